@@ -0,0 +1,89 @@
+# app/agent/answer_cache.py
+from __future__ import annotations
+import copy, threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.cache import TTLCache
+from app.core.config import (
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECS, ANSWER_CACHE_SEMANTIC, ANSWER_CACHE_SIM_THRESHOLD,
+)
+from app.providers.embed import normalize_query
+
+Scope = Tuple[Hashable, ...]
+
+def _scope(attrs: Dict[str, List[str]], top_k: int, version: int) -> Scope:
+    # parsed attrs are part of the key: "green hoodie" and "black hoodie" embed
+    # close together but must never share an answer
+    return (tuple((k, tuple(v or ())) for k, v in sorted((attrs or {}).items())), top_k, version)
+
+class AnswerCache:
+    """
+    Final /ai/rag/query responses keyed by (normalized query, attrs, top_k,
+    catalog version). With `semantic=True`, a miss falls back to the most
+    similar cached query in the same scope (cosine >= threshold).
+    """
+
+    def __init__(self, maxsize: int, ttl: float, *, semantic: bool = False, threshold: float = 0.97):
+        self._exact: TTLCache[Dict[str, Any]] = TTLCache(maxsize, ttl, name="rag_answer")
+        self.semantic = semantic
+        self.threshold = threshold
+        self.near_hits = 0
+        self._vecs: "OrderedDict[Hashable, Tuple[Scope, np.ndarray]]" = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+
+    def get(self, query: str, attrs: Dict[str, List[str]], top_k: int, version: int,
+            vec: Optional[List[float]] = None) -> Optional[Dict[str, Any]]:
+        scope = _scope(attrs, top_k, version)
+        hit = self._exact.get((normalize_query(query), scope))
+        if hit is None and self.semantic and vec is not None:
+            key = self._nearest(scope, vec)
+            if key is not None:
+                hit = self._exact.get(key)
+                if hit is not None:
+                    self.near_hits += 1
+        return copy.deepcopy(hit) if hit is not None else None
+
+    def put(self, query: str, attrs: Dict[str, List[str]], top_k: int, version: int,
+            resp: Dict[str, Any], *, ttl: Optional[float] = None, vec: Optional[List[float]] = None) -> None:
+        scope = _scope(attrs, top_k, version)
+        key = (normalize_query(query), scope)
+        self._exact.set(key, copy.deepcopy(resp), ttl=ttl)
+        if self.semantic and vec is not None:
+            v = np.asarray(vec, dtype=np.float32)
+            n = float(np.linalg.norm(v))
+            if n > 0:
+                with self._lock:
+                    self._vecs[key] = (scope, v / n)
+                    self._vecs.move_to_end(key)
+                    while len(self._vecs) > self._maxsize:
+                        self._vecs.popitem(last=False)
+
+    def _nearest(self, scope: Scope, vec: List[float]) -> Optional[Hashable]:
+        with self._lock:
+            cands = [(k, v) for k, (s, v) in self._vecs.items() if s == scope]
+        if not cands:
+            return None
+        q = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(q))
+        if n == 0:
+            return None
+        sims = np.stack([v for _, v in cands]) @ (q / n)
+        i = int(np.argmax(sims))
+        return cands[i][0] if sims[i] >= self.threshold else None
+
+    def clear(self) -> None:
+        self._exact.clear()
+        with self._lock:
+            self._vecs.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._exact.stats(), "semantic": self.semantic, "near_hits": self.near_hits}
+
+answer_cache = AnswerCache(
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECS,
+    semantic=ANSWER_CACHE_SEMANTIC, threshold=ANSWER_CACHE_SIM_THRESHOLD,
+)
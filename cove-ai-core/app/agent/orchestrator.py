@@ -4,6 +4,8 @@ from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 import re
 
+from app.core.attrs import KeywordMatcher
+
 @dataclass
 class Intent:
     kind: str  # 'lookup_product' | 'size_fit' | 'policy' | 'multi' | 'unknown'
@@ -19,22 +21,28 @@ _SIZE_FIT_KEYS = (
     "height", "weight", "cm", "kg", "inches", "lbs"
 )
 
+# both keyword groups compiled once; same substring semantics as `k in q`
+_KEYS = KeywordMatcher({"policy": _POLICY_KEYS, "size_fit": _SIZE_FIT_KEYS})
+
+_MULTI_RE = re.compile(r"\?\s+\w|\band\b.*\b(what|do|is|are|how)\b")
+_SPLIT_RE = re.compile(r"\?\s+| and ")
+
 def _looks_multi(q: str) -> bool:
     # crude: looks like two questions or contains two major topics
-    return bool(re.search(r"\?\s+\w|\band\b.*\b(what|do|is|are|how)\b", q.lower()))
+    return bool(_MULTI_RE.search(q.lower()))
 
 def _split_multi(q: str) -> List[str]:
     # very simple splitter on ' and ' and '?'
-    parts = [p.strip() for p in re.split(r"\?\s+| and ", q) if p.strip()]
+    parts = [p.strip() for p in _SPLIT_RE.split(q) if p.strip()]
     return parts[:4]  # guardrail
 
 def classify(query: str, attrs: Dict[str, List[str]]) -> Intent:
     q = query.lower()
     # policy?
-    if any(k in q for k in _POLICY_KEYS):
+    if _KEYS.hit("policy", q):
         return Intent(kind="policy", attrs=attrs)
     # size/fit?
-    if any(k in q for k in _SIZE_FIT_KEYS) or attrs.get("sizes"):
+    if _KEYS.hit("size_fit", q) or attrs.get("sizes"):
         return Intent(kind="size_fit", attrs=attrs)
     # multi?
     if _looks_multi(query):
@@ -2,64 +2,60 @@
 from __future__ import annotations
 from typing import Dict, List, Optional, Tuple
 import re
-import httpx
+
+from app.vector.store import ProductCache
 
 _PRICE_RE = re.compile(r"(?<!\d)(\d{1,4}(?:\.\d{1,2})?)")
+_SIZE_RE = re.compile(r"[A-Z]{1,3}")
+_WORD_RE = re.compile(r"[a-z]+")
+_SPACES_RE = re.compile(r"\s{2,}")
+_SLUG_RE = re.compile(r"/product/([^?\s]+)")
 _SIZE_TOKS = {"XS","S","M","L","XL","XXL"}
 
 def extract_entities(answer_text: str) -> Dict[str, List[str]]:
     text = answer_text or ""
     prices = _PRICE_RE.findall(text)
-    sizes = [tok for tok in re.findall(r"[A-Z]{1,3}", text) if tok in _SIZE_TOKS]
+    sizes = [tok for tok in _SIZE_RE.findall(text) if tok in _SIZE_TOKS]
     # colors: naive lowercase words; orchestrator/rag already parsed colors from query though
-    colors = [t for t in re.findall(r"[a-z]+", text.lower()) if t.isalpha()]
+    colors = [t for t in _WORD_RE.findall(text.lower()) if t.isalpha()]
     return {"prices": prices, "sizes": sizes, "colors": colors}
 
-async def _get_product(slug: str) -> Optional[dict]:
-    try:
-        async with httpx.AsyncClient(timeout=8) as cx:
-            r = await cx.get("http://127.0.0.1:8000/ai/tools/product.get", params={"slug": slug})
-            if r.status_code == 200:
-                return r.json()
-    except Exception:
-        pass
-    return None
-
 def _extract_slug(url: str) -> Optional[str]:
-    m = re.search(r"/product/([^?\s]+)", url or "")
+    m = _SLUG_RE.search(url or "")
     return m.group(1) if m else None
 
-async def cross_check(answer_text: str, citations: List[dict]) -> Dict[str, str]:
+async def _cited_products(citations: List[dict], products: ProductCache) -> List[dict]:
+    """Cited product rows in citation order; misses go to the DB in one batched query."""
+    slugs = [s for s in (_extract_slug(c.get("url","") or "") for c in citations) if s]
+    await products.prefetch(slugs)
+    return [p for p in (products.peek(s) for s in slugs) if p]
+
+async def cross_check(answer_text: str, citations: List[dict], products: ProductCache) -> Dict[str, str]:
     """
     Returns mapping of 'incorrect_fragment' -> 'correct_fragment'
     (for prices and size availability). If we cannot verify, we won't correct.
+    Cited products come from the request's ProductCache (usually already
+    prefetched at retrieval, so no extra round-trip).
     """
     ents = extract_entities(answer_text)
     price_corrections: Dict[str,str] = {}
     size_guard: Dict[str,str] = {}
 
     # Load cited products
-    products = []
-    for c in citations:
-        slug = _extract_slug(c.get("url","") or "")
-        if not slug: 
-            continue
-        prod = await _get_product(slug)
-        if prod:
-            products.append(prod)
+    cited = await _cited_products(citations, products)
 
     # Price verification: if answer mentions a price, ensure it matches any cited product price
-    catalog_prices = { str(p.get("price")) for p in products if p.get("price") is not None }
+    # (ordered: the representative price is the first cited product's)
+    catalog_prices = list(dict.fromkeys(str(p.get("price")) for p in cited if p.get("price") is not None))
     if catalog_prices:
         for pr in ents["prices"]:
             # allow minor formatting differences; we just replace if mismatch
             if pr not in catalog_prices:
-                # choose a representative catalog price (if multiple, first)
-                price_corrections[pr] = next(iter(catalog_prices))
+                price_corrections[pr] = catalog_prices[0]
 
     # Size guard: if answer lists size tokens, make sure they exist in at least one cited product
     catalog_sizes = set()
-    for p in products:
+    for p in cited:
         meta = p.get("meta") or {}
         sizes = meta.get("sizes") or {}
         catalog_sizes |= {k.upper() for k in sizes.keys()}
@@ -72,14 +68,17 @@ async def cross_check(answer_text: str, citations: List[dict]) -> Dict[str, str]
     corrections.update(size_guard)
     return corrections
 
+def _corrections_re(wrongs: Tuple[str, ...]) -> "re.Pattern[str]":
+    # longest first so "XXL" wins over "XL" at the same position; re caches the compile
+    alts = "|".join(re.escape(w) for w in sorted(wrongs, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alts})\b")
+
 def apply_guardrails(answer: str, corrections: Dict[str, str]) -> str:
     out = answer
-    for wrong, right in corrections.items():
-        if right == "":
-            # remove stray token (size not in catalog)
-            out = re.sub(rf"\b{re.escape(wrong)}\b", "", out)
-        else:
-            out = re.sub(rf"\b{re.escape(wrong)}\b", right, out)
+    if corrections:
+        # one pass over the answer: replacements never feed into each other,
+        # and "" removes a stray token (size not in catalog)
+        out = _corrections_re(tuple(corrections)).sub(lambda m: corrections[m.group(0)], out)
     # clean double spaces from removals
-    out = re.sub(r"\s{2,}", " ", out).strip()
+    out = _SPACES_RE.sub(" ", out).strip()
     return out
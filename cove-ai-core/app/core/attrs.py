@@ -0,0 +1,195 @@
+# app/core/attrs.py
+from __future__ import annotations
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Compiled query-attribute extraction shared by RAG (_parse_query_attrs) and
+# the intent classifier. Everything vocabulary-sized is precomputed at build
+# time; per query we tokenize once and do dict lookups.
+
+SIZES = frozenset({"XS", "S", "M", "L", "XL", "XXL"})
+
+COMMON_COLOR_WORDS = frozenset({
+    "black","white","gray","grey","cream","beige",
+    "red","maroon","crimson","pink","hotpink","rose",
+    "orange","amber","yellow","gold","mustard",
+    "green","lime","olive","teal",
+    "blue","navy","azure","cyan",
+    "purple","violet","lavender","magenta"
+})
+
+_TOKEN_RE = re.compile(r"[a-zA-Z]+")
+
+# --------- Trie → regex ----------
+
+def trie_regex(words: Iterable[str]) -> str:
+    """
+    One regex alternation built from a character trie, so shared prefixes are
+    tested once ("cancel|cancellation" -> "cancel(?:lation)?").
+    """
+    trie: Dict[str, dict] = {}
+    for w in words:
+        if not w:
+            continue
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        alts = [re.escape(ch) + emit(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        end = "" in node
+        if len(alts) == 1 and not end:
+            return alts[0]
+        body = "(?:" + "|".join(alts) + ")"
+        return body + "?" if end else body
+
+    return emit(trie) or "(?!)"
+
+class KeywordMatcher:
+    """Named keyword groups, each compiled to one trie regex (substring semantics)."""
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self._res = {name: re.compile(trie_regex(keys)) for name, keys in groups.items()}
+
+    def hit(self, group: str, text: str) -> bool:
+        return self._res[group].search(text) is not None
+
+# --------- Typo index (edit distance 1/2) ----------
+# As strict as the difflib cutoff it replaced on everyday words: 1 edit only
+# from 5 chars, 2 from 8, and never on the first letter ("what it means" must
+# not become jeans, nor "goodies" hoodie), while real typos like "hoodis" and
+# "jakcet" still resolve.
+
+def _max_edits(n: int) -> int:
+    return 0 if n < 5 else (1 if n < 8 else 2)
+
+def _deletes(word: str, d: int) -> Set[str]:
+    out, frontier = {word}, {word}
+    for _ in range(d):
+        frontier = {w[:i] + w[i+1:] for w in frontier for i in range(len(w))}
+        out |= frontier
+    return out
+
+def _edit_distance(a: str, b: str, cap: int) -> int:
+    """Optimal-string-alignment distance; returns cap+1 once it is exceeded."""
+    if abs(len(a) - len(b)) > cap:
+        return cap + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i-1] == b[j-1] else 1
+            cur[j] = min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + cost)
+            if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                cur[j] = min(cur[j], prev2[j-2] + 1)
+        if min(cur) > cap:
+            return cap + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+class TypoIndex:
+    """
+    Symmetric-delete index: every word's deletion neighbourhood is stored once,
+    so a lookup is |deletes(token)| dict probes plus a verify on the few hits.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self._index: Dict[str, Set[str]] = {}
+        for w in words:
+            for key in _deletes(w, _max_edits(len(w))):
+                self._index.setdefault(key, set()).add(w)
+
+    def lookup(self, token: str) -> Optional[str]:
+        d = _max_edits(len(token))
+        if d == 0:
+            return None
+        cands: Set[str] = set()
+        for key in _deletes(token, d):
+            cands |= self._index.get(key, set())
+        best: Optional[Tuple[int, int, str]] = None
+        for w in cands:
+            if w[0] != token[0]:
+                continue
+            dist = _edit_distance(token, w, d)
+            if dist <= min(d, _max_edits(len(w))):
+                rank = (dist, abs(len(w) - len(token)), w)
+                if best is None or rank < best:
+                    best = rank
+        return best[2] if best else None
+
+# --------- Attribute extractor ----------
+
+def plural_forms(t: str) -> List[str]:
+    forms = [t + "s", t + "es"]
+    if t.endswith("y"):
+        forms.append(t[:-1] + "ies")
+    return forms
+
+class AttrExtractor:
+    """
+    Built once per catalog vocab (see app/vector/vocab.py):
+      - token index: color/size words and every type surface form (plurals)
+      - phrase regex: multi-word colors ("navy blue"), trie-compiled
+      - typo index: types within edit distance 1 (len>=5) / 2 (len>=8),
+        same first letter
+    """
+
+    def __init__(self, colors: Iterable[str], types: Iterable[str], sizes: Iterable[str] = SIZES):
+        colors = {c.lower() for c in colors if c} | COMMON_COLOR_WORDS
+        self.types = frozenset(t.lower() for t in types if t)
+        self.sizes = frozenset(s.upper() for s in sizes)
+
+        self._colors = frozenset(c for c in colors if " " not in c)
+        phrases = sorted((c for c in colors if " " in c), key=len, reverse=True)
+        self._phrase_re = (
+            re.compile(r"(?<![a-z])(?:" + trie_regex(phrases) + r")(?![a-z])") if phrases else None
+        )
+
+        self._type_forms: Dict[str, str] = {}
+        for t in sorted(self.types):
+            for form in plural_forms(t):
+                self._type_forms.setdefault(form, t)
+        for t in self.types:  # an exact type always wins over another type's plural
+            self._type_forms[t] = t
+        self._typos = TypoIndex(self._type_forms)
+        self._typo_memo: Dict[str, Optional[str]] = {}
+
+    def normalize_type(self, tok: str) -> Optional[str]:
+        """Canonical catalog type for a token (exact, plural, or small typo)."""
+        tok = (tok or "").lower()
+        if not tok or not self.types:
+            return None
+        hit = self._type_forms.get(tok)
+        if hit is not None:
+            return hit
+        if tok in self._typo_memo:
+            return self._typo_memo[tok]
+        form = self._typos.lookup(tok)
+        res = self._type_forms.get(form) if form else None
+        if len(self._typo_memo) < 4096:
+            self._typo_memo[tok] = res
+        return res
+
+    def extract(self, query: str) -> Dict[str, List[str]]:
+        ql = (query or "").lower()
+        toks = set(_TOKEN_RE.findall(ql))
+
+        colors = {t for t in toks if t in self._colors}
+        if self._phrase_re is not None:
+            colors |= {m.group(0) for m in self._phrase_re.finditer(ql)}
+        if "hot" in toks and "pink" in toks:
+            colors.add("hotpink")
+
+        sizes = {t.upper() for t in toks if t.upper() in self.sizes}
+
+        types = set()
+        for t in toks:
+            norm = self.normalize_type(t)
+            if norm:
+                types.add(norm)
+
+        return {"colors": sorted(colors), "sizes": sorted(sizes), "types": sorted(types)}
@@ -0,0 +1,76 @@
+# app/core/cache.py
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+class TTLCache(Generic[V]):
+    """
+    Small in-process LRU with per-entry TTL and hit/miss counters.
+    Thread-safe so the sync retriever (CLI/threads) and async routes can share it.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, name: str = "cache"):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, value = item
+            if expires < monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable) -> Optional[V]:
+        """Like get(), but leaves the hit/miss counters and LRU order alone."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < monotonic():
+                return None
+            return item[1]
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -16,3 +16,54 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 
 PG_DSN = os.getenv("PG_DSN")
+
+# async connection pool (app/core/db.py)
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "2"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "10"))          # max wait for a free conn
+PG_POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", "300"))
+PG_POOL_MAX_LIFETIME = float(os.getenv("PG_POOL_MAX_LIFETIME", "1800"))
+
+# query-embedding cache (app/providers/embed.py)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL_SECS = float(os.getenv("EMBED_CACHE_TTL_SECS", "86400"))
+EMBED_CACHE_PERSIST = os.getenv("EMBED_CACHE_PERSIST", "false").lower() == "true"   # ai_core.embedding_cache
+EMBED_CACHE_PERSIST_TTL_DAYS = int(os.getenv("EMBED_CACHE_PERSIST_TTL_DAYS", "30"))
+
+# catalog vocab (app/vector/vocab.py); stale entries are served while a refresh runs
+VOCAB_TTL_SECS = float(os.getenv("VOCAB_TTL_SECS", "300"))
+
+# RAG answer cache (app/agent/answer_cache.py)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL_SECS = float(os.getenv("ANSWER_CACHE_TTL_SECS", "900"))
+ANSWER_CACHE_STOCK_TTL_SECS = float(os.getenv("ANSWER_CACHE_STOCK_TTL_SECS", "60"))    # answers quoting stock
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "false").lower() == "true"  # near-duplicate lookup
+ANSWER_CACHE_SIM_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIM_THRESHOLD", "0.97"))
+
+# per-stage budgets for the RAG pipeline (app/routes/rag.py); a stage that overruns
+# falls back (no rerank, no MMR, no corrections) instead of failing
+RAG_TIMEOUT_RERANK_SECS = float(os.getenv("RAG_TIMEOUT_RERANK_SECS", "3"))
+RAG_TIMEOUT_MMR_SECS = float(os.getenv("RAG_TIMEOUT_MMR_SECS", "4"))
+RAG_TIMEOUT_VERIFY_SECS = float(os.getenv("RAG_TIMEOUT_VERIFY_SECS", "4"))
+
+# embedding backfill (app/vector/backfill_embeddings.py)
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))          # provider batches in flight
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "256"))          # max texts per provider call
+BACKFILL_BATCH_TOKENS = int(os.getenv("BACKFILL_BATCH_TOKENS", "60000"))    # est. tokens per provider call
+BACKFILL_RETRIES = int(os.getenv("BACKFILL_RETRIES", "6"))                  # per batch, on 429/5xx/transport
+BACKFILL_WRITE_ROWS = int(os.getenv("BACKFILL_WRITE_ROWS", "1000"))         # rows per COPY + UPDATE
+
+# catalog change-data-capture from the Django tables (app/vector/cdc.py)
+CATALOG_CDC_ENABLED = os.getenv("CATALOG_CDC_ENABLED", "true").lower() == "true"
+CATALOG_CDC_POLL_SECS = float(os.getenv("CATALOG_CDC_POLL_SECS", "30"))    # fallback drain if a NOTIFY is missed
+CATALOG_CDC_BATCH = int(os.getenv("CATALOG_CDC_BATCH", "500"))             # outbox rows per transaction
+
+# telemetry sink behind app/telemetry/trace.emit (app/telemetry/sink.py)
+TELEMETRY_SINK = os.getenv("TELEMETRY_SINK", "stdout").lower()              # stdout | file | otlp | none
+TELEMETRY_FILE = os.getenv("TELEMETRY_FILE", "telemetry.jsonl")              # for TELEMETRY_SINK=file
+TELEMETRY_QUEUE_MAX = int(os.getenv("TELEMETRY_QUEUE_MAX", "10000"))         # buffered events; beyond that, dropped
+TELEMETRY_BATCH = int(os.getenv("TELEMETRY_BATCH", "256"))                   # events per write
+TELEMETRY_FLUSH_SECS = float(os.getenv("TELEMETRY_FLUSH_SECS", "0.5"))
+TELEMETRY_SAMPLE = os.getenv("TELEMETRY_SAMPLE", "")                         # "span:llm=1,query_received=0.1"
+TELEMETRY_SAMPLE_DEFAULT = float(os.getenv("TELEMETRY_SAMPLE_DEFAULT", "1.0"))
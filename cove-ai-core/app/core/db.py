@@ -0,0 +1,81 @@
+# app/core/db.py
+from __future__ import annotations
+import logging
+from typing import AsyncIterator, Optional
+
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+from pgvector.psycopg import register_vector_async
+
+from app.core.config import (
+    PG_DSN, PG_POOL_MIN, PG_POOL_MAX, PG_POOL_TIMEOUT, PG_POOL_MAX_IDLE, PG_POOL_MAX_LIFETIME,
+)
+
+log = logging.getLogger("cove.db")
+
+_pool: Optional[AsyncConnectionPool] = None
+
+# --------- Pool lifecycle (driven by the FastAPI lifespan) ----------
+
+async def _configure(conn: AsyncConnection) -> None:
+    # every pooled connection must understand the `vector` type
+    await register_vector_async(conn)
+    # `kind = $1` in a cached generic plan cannot match the per-kind partial
+    # ANN indexes; always plan with the actual parameter values
+    await conn.execute("SET plan_cache_mode = force_custom_plan")
+
+async def open_pool() -> AsyncConnectionPool:
+    """
+    Create and open the shared async pool. Safe to call twice.
+    Connections are autocommit (same as the old module-level `connect()`),
+    health-checked on checkout and recycled after PG_POOL_MAX_LIFETIME.
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+    pool = AsyncConnectionPool(
+        PG_DSN,
+        min_size=PG_POOL_MIN,
+        max_size=PG_POOL_MAX,
+        timeout=PG_POOL_TIMEOUT,
+        max_idle=PG_POOL_MAX_IDLE,
+        max_lifetime=PG_POOL_MAX_LIFETIME,
+        kwargs={"autocommit": True},
+        configure=_configure,
+        check=AsyncConnectionPool.check_connection,
+        name="cove-ai-core",
+        open=False,
+    )
+    await pool.open(wait=True)
+    _pool = pool
+    log.info("pg pool opened (min=%s max=%s)", PG_POOL_MIN, PG_POOL_MAX)
+    return pool
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is None:
+        return
+    pool, _pool = _pool, None
+    await pool.close()
+    log.info("pg pool closed")
+
+def get_pool() -> AsyncConnectionPool:
+    if _pool is None:
+        raise RuntimeError("PG pool is not open; is the app lifespan running?")
+    return _pool
+
+# --------- Per-request checkout ----------
+
+async def get_conn() -> AsyncIterator[AsyncConnection]:
+    """
+    FastAPI dependency: borrow one connection for the duration of a request
+    and hand it back to the pool afterwards.
+
+        @router.get(...)
+        async def handler(conn: AsyncConnection = Depends(get_conn)): ...
+    """
+    async with get_pool().connection() as conn:
+        yield conn
+
+def pool_stats() -> dict:
+    return get_pool().get_stats() if _pool is not None else {}
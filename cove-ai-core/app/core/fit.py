@@ -1,11 +1,16 @@
 # app/core/fit.py
 from __future__ import annotations
-from typing import Optional, List, Dict, Literal
+from typing import Any, Optional, List, Dict, Literal
+
+# Single rules engine for size recommendations. The /ai/fit/recommend route
+# and RAG (size_fit intent) both call `recommend_fit` in-process with a
+# product row they already loaded; nothing here does I/O.
 
 SizeName = Literal["XS", "S", "M", "L", "XL", "XXL"]
-FitPreference = Literal["slim", "regular", "oversized"]
+FitPreference = Literal["tight", "slim", "regular", "loose", "oversized"]
 
 _SUPPORTED_SIZES: List[SizeName] = ["XS", "S", "M", "L", "XL", "XXL"]
+_ORDER_INDEX = {name: i for i, name in enumerate(_SUPPORTED_SIZES)}
 
 
 def _normalize_sizes(sizes: Optional[List[str]]) -> List[SizeName]:
@@ -30,12 +35,133 @@ def _normalize_sizes(sizes: Optional[List[str]]) -> List[SizeName]:
             seen.add(su)
             normalized.append(su)  # type: ignore[arg-type]
 
-    # order according to _SUPPORTED_SIZES
-    order_index = {name: i for i, name in enumerate(_SUPPORTED_SIZES)}
-    normalized.sort(key=lambda x: order_index[x])
+    normalized.sort(key=lambda x: _ORDER_INDEX[x])
     return normalized
 
 
+# simple rules; replace with learned adapter later
+def _estimate_chest_from_bmi(height_cm: float, weight_kg: float) -> float:
+    h = max(1.45, min(2.1, height_cm/100.0))
+    bmi = weight_kg / (h*h)
+    # crude linear map to chest (cm)
+    # anchor points: bmi 19 -> 88cm, bmi 23 -> 96cm, bmi 27 -> 104cm, bmi 31 -> 112cm
+    return 88 + (bmi - 19) * (112 - 88) / (31 - 19)
+
+
+# static garment bands (cm); tweak later
+_BANDS: Dict[str, Dict[str, tuple]] = {
+    "hoodie": {
+        "XS": (0, 90), "S": (88, 94), "M": (93, 100),
+        "L": (99, 106), "XL": (105, 112), "XXL": (111, 118)
+    },
+    "jacket": {
+        "XS": (0, 88), "S": (86, 92), "M": (91, 98),
+        "L": (97, 104), "XL": (103, 110), "XXL": (109, 116)
+    },
+    "jeans": {
+        # map by waist proxy: chest ~ 1.08*waist ⇒ invert:
+        # we still use chest estimates; for jeans it's rough, acceptable for v0.
+        "XS": (0, 86), "S": (84, 90), "M": (89, 96),
+        "L": (95, 102), "XL": (101, 108), "XXL": (107, 114)
+    }
+}
+
+
+def _size_from_chest(chest: float, product_type: Optional[str]) -> SizeName:
+    t = (product_type or "hoodie").lower()
+    table = _BANDS.get(t, _BANDS["hoodie"])
+    for s in _SUPPORTED_SIZES:
+        lo, hi = table[s]
+        if lo <= chest <= hi:
+            return s
+    # fallback
+    return "L" if chest >= table["L"][0] else "M"
+
+
+def _apply_fit_preference(size: SizeName, fit_preference: Optional[str]) -> SizeName:
+    idx = _ORDER_INDEX[size]
+    pref = (fit_preference or "regular").lower()
+    if pref in ("tight", "slim"):
+        idx -= 1
+    elif pref in ("oversized", "baggy", "loose"):
+        idx += 1
+    return _SUPPORTED_SIZES[max(0, min(idx, len(_SUPPORTED_SIZES) - 1))]
+
+
+def _nearest_available_size(
+    target_size: SizeName,
+    available: List[SizeName],
+) -> SizeName:
+    """
+    Snap target_size to the nearest available size (ties go to the smaller one).
+    """
+    if not available or target_size in available:
+        return target_size
+    target_idx = _ORDER_INDEX.get(target_size, 0)
+    return min(available, key=lambda s: abs(_ORDER_INDEX[s] - target_idx))
+
+
+def in_stock_sizes(meta: Optional[Dict[str, Any]]) -> List[SizeName]:
+    """Sizes with stock > 0 from a product's meta.sizes ({"S": 10, ...}), XS..XXL order."""
+    sizes = (meta or {}).get("sizes") or {}
+    if not isinstance(sizes, dict):
+        return []
+    out: List[str] = []
+    for k, v in sizes.items():
+        try:
+            if float(v) > 0:
+                out.append(k)
+        except (TypeError, ValueError):
+            continue
+    return _normalize_sizes(out)
+
+
+def recommend_fit(
+    *,
+    height_cm: float,
+    weight_kg: float,
+    gender: Optional[str] = None,
+    fit_preference: Optional[str] = "regular",
+    product_type: Optional[str] = None,
+    product: Optional[Dict[str, Any]] = None,
+    slug: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Rules-based size recommendation from body measurements.
+
+    `product` is a preloaded product row ({title, url, meta}, e.g. from
+    ProductCache); when given, the result snaps to its in-stock sizes.
+    `slug` only shapes the note when the caller looked a product up and
+    found nothing.
+
+    Returns the /ai/fit/recommend payload:
+        {"size": str, "confidence": float, "notes": list[str], "citations": list[dict]}
+    """
+    chest = _estimate_chest_from_bmi(height_cm, weight_kg)
+    base = _size_from_chest(chest, product_type)
+    rec = _apply_fit_preference(base, fit_preference)
+    notes = [f"Estimated chest {chest:.1f} cm", f"Base {base}, adjusted for {fit_preference}"]
+
+    citations: List[Dict[str, Any]] = []
+    # If a product is given, intersect with in-stock sizes; nudge to nearest available
+    if product:
+        avail = in_stock_sizes(product.get("meta"))
+        citations.append({"title": product.get("title", ""), "url": product.get("url", ""), "score": 1.0})
+        if avail:
+            best = _nearest_available_size(rec, avail)
+            if best != rec:
+                notes.append(f"{rec} not in stock; nearest available: {best}")
+                rec = best
+        else:
+            notes.append("No sizes in stock for this item.")
+    elif slug:
+        notes.append("Product not found; returned generic size.")
+
+    # crude confidence: center of band ± overlap penalty
+    confidence = 0.72
+    return {"size": rec, "confidence": confidence, "notes": notes, "citations": citations}
+
+
 def _safe_bmi(height_cm: float, weight_kg: float) -> float:
     h_m = max(height_cm, 80.0) / 100.0  # guard against nonsense
     return weight_kg / (h_m * h_m)
@@ -70,7 +196,7 @@ def _base_size_index(height_cm: float, weight_kg: float) -> int:
     return max(0, min(idx, len(_SUPPORTED_SIZES) - 1))
 
 
-def _apply_fit_preference(idx: int, fit_preference: Optional[str]) -> int:
+def _apply_fit_preference_index(idx: int, fit_preference: Optional[str]) -> int:
     pref = (fit_preference or "regular").lower()
     if pref == "slim":
         idx -= 1
@@ -79,34 +205,6 @@ def _apply_fit_preference(idx: int, fit_preference: Optional[str]) -> int:
     return max(0, min(idx, len(_SUPPORTED_SIZES) - 1))
 
 
-def _nearest_available_size(
-    target_size: SizeName,
-    available: List[SizeName],
-) -> SizeName:
-    """
-    Snap target_size to the nearest available size.
-    """
-    if not available:
-        return target_size
-
-    order_index = {name: i for i, name in enumerate(_SUPPORTED_SIZES)}
-    target_idx = order_index.get(target_size, 0)
-
-    # exact hit
-    if target_size in available:
-        return target_size
-
-    # pick available size with minimal distance in the XS..XXL ordering
-    best_size = available[0]
-    best_dist = abs(order_index[best_size] - target_idx)
-    for s in available[1:]:
-        d = abs(order_index[s] - target_idx)
-        if d < best_dist:
-            best_dist = d
-            best_size = s
-    return best_size
-
-
 def recommend_size(
     *,
     height_cm: float,
@@ -117,7 +215,9 @@ def recommend_size(
     available_sizes: Optional[List[str]] = None,
 ) -> Dict[str, object]:
     """
-    Rules-based size recommendation for tops (e.g. hoodies, t-shirts).
+    Rules-based size recommendation for tops (e.g. hoodies, t-shirts) from a
+    plain size list: BMI bands with a height adjustment. The routes use
+    `recommend_fit`.
 
     Returns dict:
         {
@@ -152,7 +252,7 @@ def recommend_size(
     size_from_body: SizeName = _SUPPORTED_SIZES[base_idx]
 
     # Adjust for fit preference
-    adjusted_idx = _apply_fit_preference(base_idx, fit_preference)
+    adjusted_idx = _apply_fit_preference_index(base_idx, fit_preference)
     size_with_pref: SizeName = _SUPPORTED_SIZES[adjusted_idx]
 
     # Small gender nudge (optional; extremely conservative)
@@ -0,0 +1,138 @@
+# app/core/http.py
+from __future__ import annotations
+import asyncio, importlib.util, logging, os, time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import httpx
+
+log = logging.getLogger("cove.http")
+
+# HTTP/2 needs the optional `h2` package (httpx[http2]); fall back to 1.1 without it
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+@dataclass(frozen=True)
+class Provider:
+    base_url: str
+    timeout: float
+    retries: int           # extra attempts on 429/5xx/transport errors
+    http2: bool = True
+
+def _env_provider(name: str, base_url: str, timeout: float, retries: int, http2: bool = True) -> Provider:
+    key = name.upper()
+    return Provider(
+        base_url=os.getenv(f"HTTP_BASE_URL_{key}", base_url),
+        timeout=float(os.getenv(f"HTTP_TIMEOUT_{key}", str(timeout))),
+        retries=int(os.getenv(f"HTTP_RETRIES_{key}", str(retries))),
+        http2=http2,
+    )
+
+PROVIDERS: Dict[str, Provider] = {
+    "openai":     _env_provider("openai", "https://api.openai.com", 30, 2),
+    "openrouter": _env_provider("openrouter", "https://openrouter.ai", 30, 1),
+    "cohere":     _env_provider("cohere", "https://api.cohere.ai", 15, 1),
+    # loopback to this same service (tools endpoints); never retried
+    "internal":   _env_provider("internal", os.getenv("AI_CORE_INTERNAL_URL", "http://127.0.0.1:8000"), 8, 0, http2=False),
+    # local OpenTelemetry collector (OTLP/HTTP), for TELEMETRY_SINK=otlp
+    "otlp":       _env_provider("otlp", os.getenv("OTLP_ENDPOINT", "http://127.0.0.1:4318"), 5, 0, http2=False),
+}
+
+_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "50")),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+)
+
+_async: Dict[str, httpx.AsyncClient] = {}
+_sync: Dict[str, httpx.Client] = {}
+
+def _kwargs(p: Provider) -> dict:
+    return {
+        "base_url": p.base_url,
+        "timeout": p.timeout,
+        "limits": _LIMITS,
+        "http2": HTTP2 and p.http2,
+    }
+
+# --------- Lifecycle (driven by the FastAPI lifespan) ----------
+
+async def open_clients() -> None:
+    for name in PROVIDERS:
+        client(name)
+    log.info("http clients opened (http2=%s)", HTTP2)
+
+async def close_clients() -> None:
+    while _async:
+        _, cx = _async.popitem()
+        await cx.aclose()
+    while _sync:
+        _, cx = _sync.popitem()
+        cx.close()
+
+# --------- Accessors ----------
+
+def client(provider: str) -> httpx.AsyncClient:
+    """
+    Shared AsyncClient for a provider. Created by the app lifespan; scripts that
+    run outside it get one lazily on first use (bound to their event loop).
+    """
+    cx = _async.get(provider)
+    if cx is None or cx.is_closed:
+        cx = _async[provider] = httpx.AsyncClient(**_kwargs(PROVIDERS[provider]))
+    return cx
+
+def sync_client(provider: str) -> httpx.Client:
+    """Shared blocking Client for CLI scripts and the sync retriever."""
+    cx = _sync.get(provider)
+    if cx is None or cx.is_closed:
+        cx = _sync[provider] = httpx.Client(**_kwargs(PROVIDERS[provider]))
+    return cx
+
+# --------- Requests with a per-provider retry budget ----------
+
+def _backoff(attempt: int, resp: Optional[httpx.Response]) -> float:
+    if resp is not None:
+        ra = resp.headers.get("retry-after", "")
+        if ra.replace(".", "", 1).isdigit():
+            return min(float(ra), 5.0)
+    return min(0.25 * (2 ** attempt), 2.0)
+
+async def request(provider: str, method: str, url: str, *, retries: Optional[int] = None, **kw) -> httpx.Response:
+    """
+    Send through the provider's pooled client. Retries 429/5xx and transport
+    errors up to the provider budget; the last response/error is surfaced as-is.
+    """
+    budget = PROVIDERS[provider].retries if retries is None else retries
+    cx = client(provider)
+    for attempt in range(budget + 1):
+        resp: Optional[httpx.Response] = None
+        try:
+            resp = await cx.request(method, url, **kw)
+        except httpx.TransportError:
+            if attempt >= budget:
+                raise
+        else:
+            if resp.status_code not in _RETRY_STATUS or attempt >= budget:
+                return resp
+        log.warning("%s %s retry %d/%d", provider, url, attempt + 1, budget)
+        await asyncio.sleep(_backoff(attempt, resp))
+    raise AssertionError("unreachable")
+
+def request_sync(provider: str, method: str, url: str, *, retries: Optional[int] = None, **kw) -> httpx.Response:
+    budget = PROVIDERS[provider].retries if retries is None else retries
+    cx = sync_client(provider)
+    for attempt in range(budget + 1):
+        resp: Optional[httpx.Response] = None
+        try:
+            resp = cx.request(method, url, **kw)
+        except httpx.TransportError:
+            if attempt >= budget:
+                raise
+        else:
+            if resp.status_code not in _RETRY_STATUS or attempt >= budget:
+                return resp
+        log.warning("%s %s retry %d/%d", provider, url, attempt + 1, budget)
+        time.sleep(_backoff(attempt, resp))
+    raise AssertionError("unreachable")
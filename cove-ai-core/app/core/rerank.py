@@ -1,21 +1,72 @@
 # app/ai_core/rerank.py
 from __future__ import annotations
 from typing import List, Dict, Any, Sequence
-import math
+
+import numpy as np
 
 Vector = Sequence[float]
 Doc = Dict[str, Any]
 
 
-def _l2_normalize(vec: Vector) -> List[float]:
-    norm = math.sqrt(sum(x * x for x in vec))
-    if norm == 0:
-        return [0.0 for _ in vec]
-    return [x / norm for x in vec]
+def _l2_normalize_rows(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return np.divide(mat, norms, out=np.zeros_like(mat), where=norms > 0)
+
+
+def token_matrix(texts: Sequence[str]) -> np.ndarray:
+    """
+    Binary bag-of-words rows (one per text, whitespace tokens). After row
+    normalization a dot product is |A∩B| / sqrt(|A|·|B|), the token-set cosine.
+    """
+    vocab: Dict[str, int] = {}
+    rows = []
+    for t in texts:
+        cols = {vocab.setdefault(tok, len(vocab)) for tok in (t or "").split()}
+        rows.append(cols)
+    mat = np.zeros((len(texts), max(1, len(vocab))), dtype=np.float64)
+    for i, cols in enumerate(rows):
+        if cols:
+            mat[i, list(cols)] = 1.0
+    return mat
+
+
+def mmr_select(
+    relevance: Sequence[float],
+    doc_matrix: np.ndarray,
+    top_k: int,
+    lambda_mult: float,
+) -> List[int]:
+    """
+    Greedy MMR over precomputed features. Rows of `doc_matrix` are L2-normalized
+    once, redundancy comes from a single similarity matrix product, and the
+    per-candidate max redundancy vector is updated incrementally after each pick.
+    Ties go to the lowest index, same as the original Python loops.
+    """
+    rel = np.asarray(relevance, dtype=np.float64)
+    n = rel.shape[0]
+    top_k = min(top_k, n)
+    if n == 0 or top_k <= 0:
+        return []
+
+    vecs = _l2_normalize_rows(np.asarray(doc_matrix, dtype=np.float64))
+    sim = vecs @ vecs.T
+
+    max_red = np.zeros(n, dtype=np.float64)   # no redundancy before the first pick
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
 
+    while len(selected) < top_k:
+        scores = lambda_mult * rel - (1.0 - lambda_mult) * max_red
+        scores[~available] = -np.inf
+        idx = int(np.argmax(scores))
+        selected.append(idx)
+        available[idx] = False
+        if len(selected) == 1:
+            max_red = sim[idx].copy()
+        else:
+            np.maximum(max_red, sim[idx], out=max_red)
 
-def _cosine_sim(a: Vector, b: Vector) -> float:
-    return sum(x * y for x, y in zip(a, b))
+    return selected
 
 
 def mmr_rerank_from_vectors(
@@ -56,40 +107,18 @@ def mmr_rerank_from_vectors(
     top_k = top_k or n
     top_k = min(top_k, n)
 
-    q_vec = _l2_normalize(query_embedding)
-    doc_vecs = [_l2_normalize(v) for v in doc_embeddings]
+    doc_mat = np.asarray(doc_embeddings, dtype=np.float64)
+    q_vec = _l2_normalize_rows(np.asarray(query_embedding, dtype=np.float64).reshape(1, -1))[0]
 
     # Relevance to query
-    relevance = [_cosine_sim(q_vec, dv) for dv in doc_vecs]
-
-    selected_indices: List[int] = []
-    candidate_indices = list(range(n))
-
-    while candidate_indices and len(selected_indices) < top_k:
-        best_idx = None
-        best_score = -1e9
-
-        for idx in candidate_indices:
-            if selected_indices:
-                div = max(
-                    _cosine_sim(doc_vecs[idx], doc_vecs[j])
-                    for j in selected_indices
-                )
-            else:
-                div = 0.0
-
-            score = lambda_mult * relevance[idx] - (1.0 - lambda_mult) * div
-            if score > best_score:
-                best_score = score
-                best_idx = idx
+    relevance = _l2_normalize_rows(doc_mat) @ q_vec
 
-        selected_indices.append(best_idx)
-        candidate_indices.remove(best_idx)
+    selected_indices = mmr_select(relevance, doc_mat, top_k, lambda_mult)
 
     mmr_docs: List[Doc] = []
     for idx in selected_indices:
         d = dict(docs[idx])  # shallow copy
-        d["mmr_score"] = relevance[idx]
+        d["mmr_score"] = float(relevance[idx])
         mmr_docs.append(d)
 
     return mmr_docs
@@ -3,15 +3,20 @@ from __future__ import annotations
 import os, json, math, argparse, itertools, time
 from typing import Iterable, List, Tuple, Dict, Any
 
-import httpx
 from psycopg import Connection
-from psycopg.rows import tuple_row
 
 from app.vector.store import connect
-from app.core.config import OPENAI_API_KEY, EMBED_MODEL
+from app.vector.vocab import notify_catalog_changed
+from app.providers.embed import embed
+from app.vector.backfill_embeddings import backfill_sync
+from app.vector.incremental import DocRow, SyncStats, doc_id, sync_docs, upsert_doc_id
 
 DOCS_TABLE = "ai_core.docs"
 
+# `source` values owning the rows each loader writes (see app/vector/incremental.py)
+CATALOG_SOURCE = "ingest:catalog"
+SIZE_POLICY_SOURCE = "ingest:size_policy"
+
 # ----------------------------- utils ---------------------------------
 
 def chunks(seq: List[Any], n: int) -> Iterable[List[Any]]:
@@ -20,115 +25,36 @@ def chunks(seq: List[Any], n: int) -> Iterable[List[Any]]:
 
 async def embed_texts(texts: List[str]) -> List[List[float]]:
     """
-    Provider-aware embeddings:
+    Provider-aware embeddings (see app/providers/embed.py):
       - EMBED_MODEL starts with 'openrouter:' -> OpenRouter endpoint
       - starts with 'cohere:'               -> Cohere embed
       - otherwise                           -> OpenAI direct
     """
-    if not texts:
-        return []
-
-    model = EMBED_MODEL or ""
-    async with httpx.AsyncClient(timeout=30) as cx:
-        if model.startswith("openrouter:"):
-            m = model.split("openrouter:", 1)[1]
-            r = await cx.post(
-                "https://openrouter.ai/api/v1/embeddings",
-                headers={
-                    "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY','')}",
-                    "Content-Type": "application/json",
-                },
-                json={"model": m, "input": texts},
-            )
-            r.raise_for_status()
-            data = r.json()
-            # OpenRouter returns OpenAI-shape: {data:[{embedding:[]},...]}
-            return [d["embedding"] for d in data["data"]]
-
-        elif model.startswith("cohere:"):
-            m = model.split("cohere:", 1)[1]
-            r = await cx.post(
-                "https://api.cohere.ai/v1/embed",
-                headers={
-                    "Authorization": f"Bearer {os.getenv('COHERE_API_KEY','')}",
-                    "Content-Type": "application/json",
-                },
-                json={"model": m, "texts": texts},
-            )
-            r.raise_for_status()
-            data = r.json()
-            return data["embeddings"]  # Cohere shape
-
-        else:
-            # default: OpenAI direct (expects OPENAI_API_KEY and an OpenAI model id)
-            m = model.split("openai:", 1)[1] if model.startswith("openai:") else (model or "text-embedding-3-small")
-            r = await cx.post(
-                "https://api.openai.com/v1/embeddings",
-                headers={
-                    "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY','')}",
-                    "Content-Type": "application/json",
-                },
-                json={"model": m, "input": texts},
-            )
-            r.raise_for_status()
-            data = r.json()
-            return [d["embedding"] for d in data["data"]]
+    return await embed(texts)
 
 def upsert_doc(conn: Connection, *, kind: str, title: str, text: str,
                url: str | None, meta: Dict[str, Any] | None) -> None:
     """
-    Inserts a row if not exists (by (kind, title, url, text) hash),
-    else updates text/meta. Embedding is left null initially.
+    Inserts or updates one row keyed by kind + slug/url (+ variantId), the
+    same id as app/vector/store.upsert_doc; a no-op when the content hash is
+    unchanged. A changed text clears the embedding so the next backfill
+    re-embeds it.
     """
     meta = meta or {}
-    with conn.cursor() as cur:
-        cur.execute(
-            f"""
-            insert into {DOCS_TABLE}(kind, title, text, url, meta)
-            values (%s, %s, %s, %s, %s)
-            on conflict do nothing
-            """,
-            (kind, title or "", text or "", url, json.dumps(meta))
-        )
+    row = DocRow(
+        id=upsert_doc_id(kind, url, meta),
+        kind=kind, title=title or "", text=text or "", url=url, meta=meta,
+    )
+    sync_docs(conn, None, [row], prune=False)
 
 def backfill_embeddings_sync(conn: Connection, limit: int = 512) -> int:
     """
-    Selects rows with NULL embedding, fetches embeddings in batches,
-    and updates those rows.
-    Returns number of rows updated.
+    Embeds up to `limit` rows with NULL embedding through the async backfill
+    pipeline (bounded concurrency, retries, COPY-staged writes; see
+    app/vector/backfill_embeddings.py). Returns number of rows updated.
     """
-    # NOTE: we pull (id, text) and embed in batches
-    with conn.cursor(row_factory=tuple_row) as cur:
-        cur.execute(
-            f"select id, text from {DOCS_TABLE} where embedding is null limit %s",
-            (limit,)
-        )
-        rows = cur.fetchall()
-
-    if not rows:
-        return 0
-
-    # Batch embed to avoid very long payloads. 128 is a good sweet spot.
-    batch_size = 128
-    all_updated = 0
-    for batch in chunks(rows, batch_size):
-        ids = [r[0] for r in batch]
-        texts = [r[1] or "" for r in batch]
-
-        # lazy import for asyncio to keep this file simple to run as script
-        import asyncio
-        embs: List[List[float]] = asyncio.run(embed_texts(texts))
-
-        with conn.cursor() as cur:
-            for _id, vec in zip(ids, embs):
-                cur.execute(
-                    f"update {DOCS_TABLE} set embedding = %s where id = %s",
-                    (vec, _id)
-                )
-        conn.commit()
-        all_updated += len(batch)
-
-    return all_updated
+    conn.commit()  # the pipeline reads on its own connections
+    return backfill_sync(limit=limit).written
 
 # ----------------------- loaders for your JSONs -----------------------
 
@@ -141,12 +67,12 @@ def normalize_text(s: str | None) -> str:
     # collapse huge whitespace
     return " ".join(s.split())
 
-def add_product_docs(conn: Connection, catalog: Dict[str, Any], meta: Dict[str, Any]) -> int:
+def catalog_doc_rows(catalog: Dict[str, Any], meta: Dict[str, Any]) -> List[DocRow]:
     """
-    Walks your catalogData.json structure and writes product-level docs.
+    Walks your catalogData.json structure into variant-level product docs.
     Expects the same shape you use on the site (tiers -> products -> variants).
     """
-    n = 0
+    rows: List[DocRow] = []
     # catalog likely has tiers like {"casual":[...], "originals":[...]}
     for _, products in catalog.items():
         for p in products:
@@ -155,6 +81,8 @@ def add_product_docs(conn: Connection, catalog: Dict[str, Any], meta: Dict[str,
             tier = p.get("tier", "")
             pslug = p.get("slug", "")
             variants = p.get("variants", []) or []
+            # natural key for ids; products without a slug fall back to id/name
+            pkey = pslug or p.get("product_id") or name
 
             # Combine a short product text. You can make this richer later.
             base_txt = normalize_text(
@@ -187,12 +115,26 @@ def add_product_docs(conn: Connection, catalog: Dict[str, Any], meta: Dict[str,
                     f"Variant {vid}. Price {price}. Stock {stock}. "
                     f"Additional: {mrow.get('material','') or ''}."
                 )
-                upsert_doc(conn, kind="product", title=title, text=text, url=url, meta=extra)
-                n += 1
-    conn.commit()
-    return n
+                rows.append(DocRow(
+                    id=doc_id("product", pkey, vid if vid is not None else color),
+                    kind="product", title=title, text=text, url=url, meta=extra,
+                ))
+    return rows
+
+def add_product_docs(conn: Connection, catalog: Dict[str, Any], meta: Dict[str, Any],
+                     *, embed: bool = False) -> SyncStats:
+    """
+    Incremental catalog ingest: writes only new/changed variant docs and
+    deletes variants that left the catalog. Unchanged rows keep their
+    embeddings; rows whose text changed are embedded in batches (embed=True)
+    or queued for the backfill (NULL embedding).
+    """
+    stats = sync_docs(conn, CATALOG_SOURCE, catalog_doc_rows(catalog, meta), embed=embed)
+    if stats.changed:
+        notify_catalog_changed(conn)
+    return stats
 
-def add_size_policy_docs(conn: Connection) -> int:
+def add_size_policy_docs(conn: Connection, *, embed: bool = False) -> SyncStats:
     """
     Quick seed for size/fit guidance. Replace with your canonical policy later.
     """
@@ -210,10 +152,32 @@ def add_size_policy_docs(conn: Connection) -> int:
             "meta": {"category": "bomber"}
         }
     ]
-    for ex in examples:
-        upsert_doc(conn, kind="size_policy", title=ex["title"], text=ex["text"], url=ex["url"], meta=ex["meta"])
-    conn.commit()
-    return len(examples)
+    rows = [
+        DocRow(id=doc_id("size_policy", ex["url"], ex["meta"]["category"]), kind="size_policy",
+               title=ex["title"], text=ex["text"], url=ex["url"], meta=ex["meta"])
+        for ex in examples
+    ]
+    return sync_docs(conn, SIZE_POLICY_SOURCE, rows, embed=embed)
+
+_PRUNE_LEGACY_SQL = f"""
+    DELETE FROM {DOCS_TABLE}
+    WHERE source IS NULL
+      AND ((kind = 'product' AND meta ? 'variantId' AND NOT meta ? 'slug') OR kind = 'size_policy')
+"""
+
+def prune_legacy_docs(conn: Connection) -> int:
+    """
+    One-off cleanup: rows this loader wrote before ids were deterministic
+    (random uuids, NULL source) are duplicates of the owned rows.
+    Product-level seed rows (meta.slug) are left alone.
+    """
+    with conn.cursor() as cur:
+        cur.execute(_PRUNE_LEGACY_SQL)
+        return cur.rowcount
+
+def _report(label: str, st: SyncStats) -> None:
+    print(f"[ingest] {label}: inserted={st.inserted} updated={st.updated} "
+          f"unchanged={st.unchanged} deleted={st.deleted} to_embed={st.needs_embedding}")
 
 # ------------------------------- CLI ---------------------------------
 
@@ -222,32 +186,35 @@ def main():
     parser.add_argument("--catalog", help="Path to catalogData.json")
     parser.add_argument("--meta", help="Path to clothingMeta.json")
     parser.add_argument("--embed-missing", action="store_true", help="Backfill embeddings for rows with NULL embeddings")
+    parser.add_argument("--prune-legacy", action="store_true",
+                        help="Delete ingest rows written before deterministic ids (duplicates)")
     args = parser.parse_args()
 
     # Connect DB
     conn = connect()
     print("[ingest] Connected to DB.")
 
-    total_inserted = 0
+    if args.prune_legacy:
+        n = prune_legacy_docs(conn)
+        print(f"[ingest] Deleted legacy rows: {n}")
+        if n:
+            notify_catalog_changed(conn)
 
     # Load catalog if provided
     if args.catalog:
         catalog = load_json(args.catalog)
         m = load_json(args.meta) if args.meta else {}
-        n = add_product_docs(conn, catalog, m)
-        print(f"[ingest] Inserted/updated product docs: {n}")
-        total_inserted += n
+        _report("product docs", add_product_docs(conn, catalog, m, embed=args.embed_missing))
 
     # Always seed a tiny size policy set (safe & idempotent)
-    n = add_size_policy_docs(conn)
-    print(f"[ingest] Inserted/updated size policy docs: {n}")
-    total_inserted += n
+    _report("size policy docs", add_size_policy_docs(conn, embed=args.embed_missing))
 
     if args.embed_missing:
+        # changed rows were embedded during the sync; this catches older NULLs
         updated = backfill_embeddings_sync(conn, limit=2000)
         print(f"[ingest] Backfilled embeddings for rows: {updated}")
 
-    print(f"[ingest] Done. Rows touched (insert/update attempts): {total_inserted}")
+    print("[ingest] Done.")
 
 if __name__ == "__main__":
     main()
@@ -1,4 +1,6 @@
 # app/main.py
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.routes.rag import router as rag_router
 from app.routes import tools as tools_routes
@@ -14,7 +16,38 @@ load_dotenv()
 
 
 
-app = FastAPI(title="Cove AI Core")  # <- let FastAPI use JSONResponse
+from app.core.db import open_pool, close_pool
+from app.core.http import open_clients, close_clients
+from app.telemetry.sink import sink as telemetry_sink
+from app.core.config import CATALOG_CDC_ENABLED
+from app.vector.vocab import listen_catalog_changes
+from app.vector.cdc import consume_catalog_changes
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # pooled Postgres + shared outbound HTTP clients (app/core/db.py, app/core/http.py)
+    await open_pool()
+    await open_clients()
+    # trace events are buffered and written in batches by a background task
+    await telemetry_sink.start()
+    # vocab invalidation when ingest/seed (other processes) write products
+    tasks = [asyncio.create_task(listen_catalog_changes())]
+    # Django catalog edits (stock/price) -> docs meta, via the CDC outbox
+    if CATALOG_CDC_ENABLED:
+        tasks.append(asyncio.create_task(consume_catalog_changes()))
+    try:
+        yield
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await telemetry_sink.stop()
+        await close_clients()
+        await close_pool()
+
+
+app = FastAPI(title="Cove AI Core", lifespan=lifespan)  # <- let FastAPI use JSONResponse
 app.include_router(tools_routes.router)
 app.include_router(rag_router)
 app.include_router(fit_router)
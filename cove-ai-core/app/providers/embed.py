@@ -0,0 +1,155 @@
+# app/providers/embed.py
+from __future__ import annotations
+import logging, os
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import (
+    EMBED_CACHE_SIZE, EMBED_CACHE_TTL_SECS, EMBED_CACHE_PERSIST, EMBED_CACHE_PERSIST_TTL_DAYS,
+)
+from app.core.http import request, request_sync
+from app.telemetry.metrics import timed
+
+log = logging.getLogger("cove.embed")
+
+# Single embedding client for the retriever, RAG (MMR) and ingest.
+EMBED_MODEL = os.getenv("EMBED_MODEL","openrouter:openai/text-embedding-3-small")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY","")
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY","")
+COHERE_API_KEY = os.getenv("COHERE_API_KEY","")
+
+def _spec(texts: List[str]) -> Tuple[str, str, Dict[str, str], Dict[str, Any]]:
+    """(provider, path, headers, payload) for the configured EMBED_MODEL."""
+    if EMBED_MODEL.startswith("openrouter:"):
+        model = EMBED_MODEL.split("openrouter:",1)[1]
+        headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type":"application/json"}
+        return "openrouter", "/api/v1/embeddings", headers, {"model": model, "input": texts}
+    if EMBED_MODEL.startswith("cohere:"):
+        model = EMBED_MODEL.split("cohere:",1)[1]
+        headers = {"Authorization": f"Bearer {COHERE_API_KEY}", "Content-Type":"application/json"}
+        return "cohere", "/v1/embed", headers, {"model": model, "texts": texts}
+    model = EMBED_MODEL.split("openai:",1)[1] if EMBED_MODEL.startswith("openai:") else EMBED_MODEL
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type":"application/json"}
+    return "openai", "/v1/embeddings", headers, {"model": model, "input": texts}
+
+def _parse(data: Dict[str, Any]) -> List[List[float]]:
+    if "data" in data and data["data"] and "embedding" in data["data"][0]:
+        return [d["embedding"] for d in data["data"]]
+    if "embeddings" in data:  # Cohere
+        return data["embeddings"]
+    raise RuntimeError(f"Unexpected embedding response keys: {list(data.keys())}")
+
+@timed("embed")
+async def embed(texts: List[str], *, retries: Optional[int] = None) -> List[List[float]]:
+    """`retries` overrides the provider's retry budget (bulk callers run their own backoff)."""
+    if not texts:
+        return []
+    provider, path, headers, payload = _spec(texts)
+    r = await request(provider, "POST", path, retries=retries, headers=headers, json=payload)
+    r.raise_for_status()
+    return _parse(r.json())
+
+@timed("embed")
+def embed_sync(texts: List[str]) -> List[List[float]]:
+    if not texts:
+        return []
+    provider, path, headers, payload = _spec(texts)
+    r = request_sync(provider, "POST", path, headers=headers, json=payload)
+    r.raise_for_status()
+    return _parse(r.json())
+
+# --------- Query-embedding cache ----------
+# Tier 1: in-process LRU+TTL keyed by (EMBED_MODEL, normalized query).
+# Tier 2 (EMBED_CACHE_PERSIST=true): ai_core.embedding_cache, shared by workers.
+
+query_cache: TTLCache[List[float]] = TTLCache(EMBED_CACHE_SIZE, EMBED_CACHE_TTL_SECS, name="query_embedding")
+
+_PERSIST_GET_SQL = """
+    SELECT embedding FROM ai_core.embedding_cache
+    WHERE model = %s AND query = %s
+      AND created_at > now() - make_interval(days => %s)
+"""
+
+_PERSIST_PUT_SQL = """
+    INSERT INTO ai_core.embedding_cache(model, query, embedding)
+    VALUES (%s, %s, %s::vector)
+    ON CONFLICT (model, query) DO UPDATE
+      SET embedding = EXCLUDED.embedding, created_at = now()
+"""
+
+def normalize_query(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+def _as_list(vec: Any) -> List[float]:
+    return vec.tolist() if hasattr(vec, "tolist") else list(vec)
+
+def cached_query_embedding(text: str) -> Optional[List[float]]:
+    """
+    In-process tier only; never calls the provider or the DB. A miss is not
+    counted here: the caller falls through to embed_query, which counts it.
+    """
+    key = (EMBED_MODEL, normalize_query(text))
+    if query_cache.peek(key) is None:
+        return None
+    return query_cache.get(key)
+
+@timed("embed_query")
+async def embed_query(text: str, *, conn=None) -> List[float]:
+    """Cached single-query embedding. Pass a pooled AsyncConnection to use the persistent tier."""
+    key = (EMBED_MODEL, normalize_query(text))
+    vec = query_cache.get(key)
+    if vec is not None:
+        return vec
+
+    if conn is not None and EMBED_CACHE_PERSIST:
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(_PERSIST_GET_SQL, (key[0], key[1], EMBED_CACHE_PERSIST_TTL_DAYS))
+                row = await cur.fetchone()
+            if row and row[0] is not None:
+                vec = _as_list(row[0])
+                query_cache.set(key, vec)
+                return vec
+        except Exception as e:
+            log.warning("embedding_cache read skipped: %s", e)
+
+    [vec] = await embed([text])
+    query_cache.set(key, vec)
+
+    if conn is not None and EMBED_CACHE_PERSIST:
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(_PERSIST_PUT_SQL, (key[0], key[1], vec))
+        except Exception as e:
+            log.warning("embedding_cache write skipped: %s", e)
+    return vec
+
+def embed_query_sync(text: str, *, conn=None) -> List[float]:
+    """Sync twin of `embed_query` for the CLI retriever (sync psycopg connection)."""
+    key = (EMBED_MODEL, normalize_query(text))
+    vec = query_cache.get(key)
+    if vec is not None:
+        return vec
+
+    if conn is not None and EMBED_CACHE_PERSIST:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_PERSIST_GET_SQL, (key[0], key[1], EMBED_CACHE_PERSIST_TTL_DAYS))
+                row = cur.fetchone()
+            if row and row[0] is not None:
+                vec = _as_list(row[0])
+                query_cache.set(key, vec)
+                return vec
+        except Exception as e:
+            log.warning("embedding_cache read skipped: %s", e)
+
+    [vec] = embed_sync([text])
+    query_cache.set(key, vec)
+
+    if conn is not None and EMBED_CACHE_PERSIST:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_PERSIST_PUT_SQL, (key[0], key[1], vec))
+        except Exception as e:
+            log.warning("embedding_cache write skipped: %s", e)
+    return vec
@@ -1,6 +1,8 @@
-from typing import List, Dict, Optional
-import os, httpx
+from typing import AsyncIterator, List, Dict, Optional
+import json, os
 from app.core.config import *
+from app.core.http import client, request
+from app.telemetry.metrics import timed
 
 JSON_OK = {"type":"json_object"}
 
@@ -8,6 +10,7 @@ class LLMClient:
     def __init__(self, timeout: float = 25.0):
         self.timeout = timeout
 
+    @timed("llm_generate")
     async def generate(self, messages: List[Dict], model: Optional[str]=None, **opts) -> str:
         backend = LLM_BACKEND
         model = model or GEN_MODEL
@@ -15,7 +18,16 @@ class LLMClient:
             return await self._openrouter(messages, model.split("openrouter:",1)[-1], **opts)
         raise ValueError(f"Unsupported backend: {backend}")
 
-    async def _openrouter(self, messages, model, **opts):
+    async def stream(self, messages: List[Dict], model: Optional[str]=None, **opts) -> AsyncIterator[str]:
+        """Same request as `generate`, but yields content deltas as they arrive."""
+        backend = LLM_BACKEND
+        model = model or GEN_MODEL
+        if backend != "openrouter":
+            raise ValueError(f"Unsupported backend: {backend}")
+        async for delta in self._openrouter_stream(messages, model.split("openrouter:",1)[-1], **opts):
+            yield delta
+
+    def _openrouter_request(self, messages, model, **opts):
         headers = {
             "Authorization": f"Bearer {OPENROUTER_API_KEY}",
             "HTTP-Referer": APP_URL,
@@ -27,8 +39,38 @@ class LLMClient:
             "temperature": opts.get("temperature", 0.2),
             "response_format": opts.get("response_format", JSON_OK),
         }
-        async with httpx.AsyncClient(timeout=self.timeout) as cx:
-            r = await cx.post("https://openrouter.ai/api/v1/chat/completions",
-                              headers=headers, json=payload)
+        return headers, payload
+
+    async def _openrouter(self, messages, model, **opts):
+        headers, payload = self._openrouter_request(messages, model, **opts)
+        r = await request("openrouter", "POST", "/api/v1/chat/completions",
+                          headers=headers, json=payload, timeout=self.timeout)
         r.raise_for_status()
         return r.json()["choices"][0]["message"]["content"]
+
+    async def _openrouter_stream(self, messages, model, **opts):
+        # SSE: "data: {...}" chunks, ": OPENROUTER PROCESSING" keep-alives, "data: [DONE]".
+        # No retries here; a stream cannot be replayed once tokens went out.
+        headers, payload = self._openrouter_request(messages, model, **opts)
+        payload["stream"] = True
+        async with client("openrouter").stream("POST", "/api/v1/chat/completions",
+                                               headers=headers, json=payload, timeout=self.timeout) as r:
+            if r.status_code >= 400:
+                await r.aread()
+                r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                chunk = line[5:].strip()
+                if chunk == "[DONE]":
+                    break
+                try:
+                    obj = json.loads(chunk)
+                except ValueError:
+                    continue
+                if obj.get("error"):
+                    raise RuntimeError(f"OpenRouter stream error: {obj['error']}")
+                for choice in obj.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
@@ -1,5 +1,6 @@
 # app/routes/health.py
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 import os
 
 router = APIRouter()
@@ -13,3 +14,22 @@ def flags():
         "LLM_BYPASS_ON_FAIL": g("LLM_BYPASS_ON_FAIL"),
         "LLM_HARD_TIMEOUT_SECS": g("LLM_HARD_TIMEOUT_SECS"),
     }
+
+@router.get("/ai/cache/stats")
+def cache_stats():
+    from app.providers.embed import query_cache
+    from app.agent.answer_cache import answer_cache
+    return {"query_embedding": query_cache.stats(), "rag_answer": answer_cache.stats()}
+
+@router.get("/ai/telemetry/stats")
+def telemetry_stats():
+    from app.telemetry.sink import sink
+    return sink.stats()
+
+@router.get("/ai/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Per-stage latency histograms (app/telemetry/metrics.py) + telemetry sink counters."""
+    from app.telemetry.metrics import metrics
+    from app.telemetry.sink import sink
+    return PlainTextResponse(metrics.render() + sink.prometheus(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,32 +1,38 @@
 # app/routes/rag.py
 from __future__ import annotations
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from psycopg import AsyncConnection
 from pydantic import BaseModel
-from typing import Any, Optional, Dict, List, Tuple
 import httpx, json, os, re, logging
 import asyncio
-from typing import Any, Optional, Dict, List, Tuple, NamedTuple
+from typing import Any, AsyncIterator, Optional, Dict, List, Tuple, NamedTuple
+from dataclasses import dataclass, field
 
 from app.providers.llm import LLMClient
-from app.vector.store import connect, search_hybrid
+from app.providers.embed import embed, embed_query
+from app.core.http import client as http_client, request as http_request
+from app.core.db import get_conn, get_pool
+from app.vector.store import search_hybrid_async, ProductCache
 from app.agent.orchestrator import classify
 from app.agent.verify import cross_check, apply_guardrails
-from app.telemetry.trace import new_trace_id, emit
-from app.vector.store import search_keyword
+from app.telemetry.trace import new_trace_id, emit, span
+from app.telemetry.metrics import timed
+from app.vector.store import search_keyword_async
 from app.core.rerank import mmr_rerank_from_vectors
-from app.core.fit import recommend_size
-# Optional: dynamic vocab (colors/types) from DB; we fallback if not present
-try:
-    from app.vector.store import catalog_vocab  # optional helper
-except Exception:  # pragma: no cover
-    catalog_vocab = None  # type: ignore
-
-from app.core.config import OPENAI_API_KEY, EMBED_MODEL, RERANK_MODEL, COHERE_API_KEY
+from app.core.fit import recommend_fit
+from app.vector.vocab import Vocab, vocab as catalog_vocab, catalog_version
+from app.agent.answer_cache import answer_cache
+from app.core.attrs import SIZES
+
+from app.core.config import RERANK_MODEL, COHERE_API_KEY, ANSWER_CACHE_ENABLED, ANSWER_CACHE_STOCK_TTL_SECS
+from app.core.config import (
+    RAG_TIMEOUT_RERANK_SECS, RAG_TIMEOUT_MMR_SECS, RAG_TIMEOUT_VERIFY_SECS,
+)
 RAG_DEBUG = os.getenv("RAG_DEBUG", "false").lower() == "true"
 
 router = APIRouter()
 _llm = LLMClient()
-_conn = None
 log = logging.getLogger("cove.rag")
 
 # ------------------ I/O ------------------
@@ -35,40 +41,6 @@ class RAGIn(BaseModel):
     query: str
     top_k: int = 6
 
-# ------------------ Embeddings (async, kept for completeness) ------------------
-
-EMBED_MODEL = os.getenv("EMBED_MODEL","openrouter:openai/text-embedding-3-small")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY","")
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY","")
-COHERE_API_KEY = os.getenv("COHERE_API_KEY","")
-
-async def embed(texts: list[str]) -> list[list[float]]:
-    if EMBED_MODEL.startswith("openrouter:"):
-        model = EMBED_MODEL.split("openrouter:",1)[1]
-        url = "https://openrouter.ai/api/v1/embeddings"
-        headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type":"application/json"}
-        payload = {"model": model, "input": texts}
-    elif EMBED_MODEL.startswith("cohere:"):
-        model = EMBED_MODEL.split("cohere:",1)[1]
-        url = "https://api.cohere.ai/v1/embed"
-        headers = {"Authorization": f"Bearer {COHERE_API_KEY}", "Content-Type":"application/json"}
-        payload = {"model": model, "texts": texts}
-    else:
-        model = EMBED_MODEL.split("openai:",1)[1] if EMBED_MODEL.startswith("openai:") else EMBED_MODEL
-        url = "https://api.openai.com/v1/embeddings"
-        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type":"application/json"}
-        payload = {"model": model, "input": texts}
-
-    async with httpx.AsyncClient(timeout=30) as cx:
-        r = await cx.post(url, headers=headers, json=payload)
-        r.raise_for_status()
-        data = r.json()
-        if "data" in data and data["data"] and "embedding" in data["data"][0]:
-            return [d["embedding"] for d in data["data"]]
-        if "embeddings" in data:  # Cohere
-            return data["embeddings"]
-        raise RuntimeError(f"Unexpected embedding response keys: {list(data.keys())}")
-
 # ------------------ Optional rerank ------------------
 
 async def rerank(query: str, docs: list[dict]) -> list[dict]:
@@ -78,12 +50,11 @@ async def rerank(query: str, docs: list[dict]) -> list[dict]:
     if not COHERE_API_KEY or not docs:
         return docs
     try:
-        async with httpx.AsyncClient(timeout=15) as cx:
-            r = await cx.post(
-                "https://api.cohere.ai/v1/rerank",
-                headers={"Authorization": f"Bearer {COHERE_API_KEY}", "Content-Type": "application/json"},
-                json={"model": RERANK_MODEL or "rerank-3", "query": query, "documents": [d.get("text","") for d in docs]},
-            )
+        r = await http_request(
+            "cohere", "POST", "/v1/rerank",
+            headers={"Authorization": f"Bearer {COHERE_API_KEY}", "Content-Type": "application/json"},
+            json={"model": RERANK_MODEL or "rerank-3", "query": query, "documents": [d.get("text","") for d in docs]},
+        )
         r.raise_for_status()
         order = [x["index"] for x in r.json().get("results", [])]
         return [docs[i] for i in order] if order else docs
@@ -121,8 +92,11 @@ def _extract_slug(url: str) -> Optional[str]:
     if not url: return None
     m = re.search(r"/product/([^?\s]+)", url)
     return m.group(1) if m else None
-def _pick_primary_slug_for_fit(
-    conn,
+def _doc_slugs(docs: List[dict]) -> List[str]:
+    return [s for s in (_extract_slug(d.get("url", "") or "") for d in docs) if s]
+
+async def _pick_primary_slug_for_fit(
+    products: ProductCache,
     docs: List[dict],
     attrs: Dict[str, List[str]],
 ) -> Optional[str]:
@@ -133,13 +107,14 @@ def _pick_primary_slug_for_fit(
       - otherwise, just first product with a valid slug.
     """
     wanted_types = set(attrs.get("types") or [])
+    await products.prefetch(_doc_slugs(docs))
 
     # First pass: match requested type
     for d in docs:
         slug = _extract_slug(d.get("url", "") or "") or ""
         if not slug:
             continue
-        prod = _get_product_meta(conn, slug)
+        prod = await products.get(slug)
         if not prod:
             continue
         meta = prod.get("meta") or {}
@@ -155,42 +130,29 @@ def _pick_primary_slug_for_fit(
 
     return None
 
-async def _call_fit_recommend(
+def _fit_recommendation(
     params: _FitParams,
     *,
     product_type: Optional[str],
+    product: Optional[dict],
     slug: Optional[str],
-) -> Optional[Dict[str, Any]]:
+) -> Dict[str, Any]:
     """
-    Internal call to /ai/fit/recommend so we can reuse the fit rules from routes/fit.py.
+    Fit rules from app/core/fit.py, run in-process against the product row
+    this request already loaded (no loopback to /ai/fit/recommend).
     """
-    # Map fit_preference from natural tokens to API's expected tight/regular/loose/slim/oversized
-    pref = (params.fit_preference or "regular").lower()
-    # we already widened pattern in routes/fit.py, so these are all valid:
-    if pref in (None, ""):
-        pref = "regular"
-
-    payload = {
-        "gender": params.gender,
-        "height_cm": params.height_cm,
-        "weight_kg": params.weight_kg,
-        "fit_preference": pref,
-        "product_type": product_type,
-        "slug": slug,
-    }
-
-    try:
-        async with httpx.AsyncClient(timeout=8) as cx:
-            r = await cx.post("http://127.0.0.1:8000/ai/fit/recommend", json=payload)
-            if r.status_code == 200:
-                return r.json()
-    except Exception as e:
-        log.warning("fit.recommend call failed: %s", e)
-
-    return None
+    return recommend_fit(
+        height_cm=params.height_cm,
+        weight_kg=params.weight_kg,
+        gender=params.gender,
+        fit_preference=(params.fit_preference or "regular").lower(),
+        product_type=product_type,
+        product=product,
+        slug=slug,
+    )
 
-def _build_suggestions_for_unknown(
-    conn,
+async def _build_suggestions_for_unknown(
+    products: ProductCache,
     docs: List[dict],
     attrs: Dict[str, List[str]],
     max_items: int = 2,
@@ -209,6 +171,7 @@ def _build_suggestions_for_unknown(
     lines: List[str] = []
     selected_cites: List[dict] = []
     seen_slugs: set[str] = set()
+    await products.prefetch(_doc_slugs(docs))
 
     for d in docs:
         if len(lines) >= max_items:
@@ -218,7 +181,7 @@ def _build_suggestions_for_unknown(
         if not slug or slug in seen_slugs:
             continue
 
-        prod = _get_product_meta(conn, slug)
+        prod = await products.get(slug)
         if not prod:
             continue
 
@@ -302,26 +265,6 @@ def _strip_code_fences(s: str) -> str:
         s = re.sub(r"^```(?:json)?\s*|\s*```$", "", s, flags=re.S).strip()
     return s
 
-def _get_product_meta(conn, slug: str) -> Optional[dict]:
-    """Fetch product title+meta by slug directly from ai_core.docs to avoid loopback HTTP."""
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT title, meta
-            FROM ai_core.docs
-            WHERE kind='product' AND meta->>'slug' = %s
-            LIMIT 1
-        """, (slug,))
-        row = cur.fetchone()
-    if not row:
-        return None
-    title, meta = row
-    return {
-        "title": title or (meta.get("name") if isinstance(meta, dict) else ""),
-        "url": f"/product/{slug}",
-        "price": (meta.get("price") if isinstance(meta, dict) else None),
-        "meta": meta or {}
-    }
-
 _TITLE_PAREN_RE = re.compile(r"\s*\([^)]*\)\s*$")
 
 def _clean_title(t: str) -> str:
@@ -336,104 +279,20 @@ def _ordered_size_names(names: List[str]) -> List[str]:
 
 # ------------------ Dynamic vocab & intent ------------------
 
-_SIZES = {"XS","S","M","L","XL","XXL"}
+_SIZES = SIZES
 
-_COMMON_COLOR_WORDS = {
-    "black","white","gray","grey","cream","beige",
-    "red","maroon","crimson","pink","hotpink","rose",
-    "orange","amber","yellow","gold","mustard",
-    "green","lime","olive","teal",
-    "blue","navy","azure","cyan",
-    "purple","violet","lavender","magenta"
-}
-
-def _get_vocab(conn) -> Dict[str, set]:
-    if catalog_vocab:
-        v = catalog_vocab(conn)
-        return {
-            "colors": set(v.get("colors", set())) | _COMMON_COLOR_WORDS,
-            "types": set(v.get("types", set())),
-            "sizes": _SIZES,
-        }
-    # fallback
-    colors, types = set(), set()
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT DISTINCT lower(c->>'colorName')
-            FROM ai_core.docs, jsonb_array_elements(meta->'colors') c
-            WHERE kind='product'
-        """)
-        colors = {r[0] for r in cur.fetchall() if r[0]}
-        cur.execute("""
-            SELECT DISTINCT lower(COALESCE(meta->>'type', split_part(lower(title),' ',1)))
-            FROM ai_core.docs
-            WHERE kind='product'
-        """)
-        types = {r[0] for r in cur.fetchall() if r[0]}
-    return {"colors": colors | _COMMON_COLOR_WORDS, "types": types, "sizes": _SIZES}
+async def _get_vocab(conn: AsyncConnection) -> Vocab:
+    # cached process-wide; only the very first call touches the DB inline
+    return await catalog_vocab.get(conn)
 
 def _ask_shrinkage(q: str) -> bool:
     ql = q.lower()
     return any(w in ql for w in ("shrink", "shrinkage", "wash", "washing", "dryer", "drying"))
 
-from difflib import get_close_matches
-
-def _normalize_type_token(tok: str, catalog_types: set[str]) -> Optional[str]:
-    """
-    Map a raw query token to a canonical product type from the catalog.
-    Handles simple English plurals and small typos generically, not per-type.
-    Returns None if we are not confident.
-    """
-    tok = (tok or "").lower()
-
-    if not tok or not catalog_types:
-        return None
-
-    # 1) Direct hit
-    if tok in catalog_types:
-        return tok
-
-    # 2) Simple plural/singular heuristics (generic, not per-word)
-    candidates = {tok}
-    if tok.endswith("ies") and len(tok) > 3:
-        candidates.add(tok[:-3] + "y")    # hoodies -> hoodie, bodies -> body
-    if tok.endswith("es") and len(tok) > 2:
-        candidates.add(tok[:-2])          # jackets -> jacket (sometimes), jeans -> jean
-    if tok.endswith("s") and len(tok) > 1:
-        candidates.add(tok[:-1])          # hoodies -> hoodie, shirts -> shirt
-
-    for c in candidates:
-        if c in catalog_types:
-            return c
-
-    # 3) Fuzzy match for small typos (hoodis -> hoodie)
-    match = get_close_matches(tok, list(catalog_types), n=1, cutoff=0.84)
-    if match:
-        return match[0]
-
-    return None
-
-def _parse_query_attrs(conn, q: str) -> Dict[str, List[str]]:
-    v = _get_vocab(conn)
-    raw = re.findall(r"[a-zA-Z]+", q.lower())
-    toks = set(raw)
-
-    colors = sorted({t for t in toks if t in v["colors"]})
-    if "hot" in toks and "pink" in toks:
-        colors.append("hotpink")
-
-    sizes = sorted({t.upper() for t in toks if t.upper() in v["sizes"]})
-
-    catalog_types = v["types"]
-    norm_types: set[str] = set()
-    for t in toks:
-        norm = _normalize_type_token(t, catalog_types)
-        if norm:
-            norm_types.add(norm)
-
-    types = sorted(norm_types)
-
-    return {"colors": colors, "sizes": sizes, "types": types}
+async def _parse_query_attrs(conn: AsyncConnection, q: str) -> Dict[str, List[str]]:
+    # extractor is compiled once per vocab refresh (app/core/attrs.py)
+    v = await _get_vocab(conn)
+    return v.extractor.extract(q)
 
 
 class _FitParams(NamedTuple):
@@ -492,19 +351,19 @@ def _parse_fit_params(q: str) -> Optional[_FitParams]:
 
 async def _fetch_product(http: httpx.AsyncClient, slug: str) -> Optional[dict]:
     try:
-        r = await http.get("http://127.0.0.1:8000/ai/tools/product.get", params={"slug": slug})
+        r = await http.get("/ai/tools/product.get", params={"slug": slug})
         if r.status_code == 200:
             return r.json()
     except Exception as e:
         log.warning("product.get failed for %s: %s", slug, e)
     return None
 
+@timed("verify_color_stock")
 async def _verify_color_stock_for_citations(
     citations: list[dict],
     colors: List[str],
     *,
-    prod_cache: Dict[str, dict] | None = None,
-    conn=None,  # pass DB conn to avoid loopback HTTP
+    products: ProductCache,  # request-scoped, DB-backed (no loopback HTTP)
 ) -> Tuple[Dict[str, bool], Dict[str, Dict[str,int]], Dict[str, List[str]]]:
     """
     Returns:
@@ -515,26 +374,21 @@ async def _verify_color_stock_for_citations(
     available = {c: False for c in colors}
     color_sizes: Dict[str, Dict[str,int]] = {c: {} for c in colors}
     all_colors_by_slug: Dict[str, List[str]] = {}
-    prod_cache = prod_cache or {}
+    await products.prefetch(_doc_slugs(citations))
 
     for d in citations:
         slug = _extract_slug(d.get("url","")) or ""
         if not slug:
             continue
 
-        # 1) cache, 2) DB, 3) (optional) loopback HTTP
-        prod = prod_cache.get(slug)
-        if not prod and conn is not None:
-            prod = _get_product_meta(conn, slug)
-            if prod:
-                prod_cache[slug] = prod
+        # 1) request cache / DB (one batched query above), 2) (optional) loopback HTTP
+        prod = await products.get(slug)
 
         if not prod and os.getenv("DISABLE_TOOLS_HTTP_FALLBACK", "true").lower() != "true":
             try:
-                async with httpx.AsyncClient(timeout=5) as cx:
-                    prod = await _fetch_product(cx, slug)
-                    if prod:
-                        prod_cache[slug] = prod
+                prod = await _fetch_product(http_client("internal"), slug)
+                if prod:
+                    products.put(slug, prod)
             except Exception:
                 prod = None
 
@@ -542,7 +396,8 @@ async def _verify_color_stock_for_citations(
             continue
 
         meta = prod.get("meta") or {}
-        color_list = [(c.get("colorName") or "").lower() for c in (meta.get("colors") or [])]
+        color_entries = {(c.get("colorName") or "").lower(): c for c in (meta.get("colors") or [])}
+        color_list = list(color_entries)
         all_colors_by_slug[slug] = [c for c in color_list if c]
 
         for col in colors:
@@ -550,7 +405,8 @@ async def _verify_color_stock_for_citations(
                 continue
 
             available[col] = True
-            sizes = meta.get("sizes") or {}
+            # per-color stock when the catalog CDC has written it, else product-wide
+            sizes = color_entries[col.lower()].get("sizes") or meta.get("sizes") or {}
 
             # ---------- Decide if sizes look like STOCK (small non-negative INTs) vs PRICES ----------
             checked_any = False
@@ -618,51 +474,239 @@ async def _verify_color_stock_for_citations(
 
 
 @router.post("/ai/rag/query")
-async def rag_query(body: RAGIn):
-    global _conn
-    _conn = _conn or connect()
-    trace_id = new_trace_id()
-
-    # --- small localized helper for nicer "Unknown" UX ---
-    def _friendly_unknown(reason: str = "", *, attrs: Dict[str, List[str]] | None = None) -> str:
-        reason = (reason or "").lower()
-        attrs = attrs or {}
-        ql = (body.query or "").lower()
-        if "shrink" in ql:
-            return "Shrinkage info isn’t listed in our catalog."
-        if "ood_type" in reason:
-            return "We don’t carry that item type yet."
-        if "no_docs" in reason:
-            return "We couldn’t find matching products in the catalog."
-        if "llm_fail" in reason:
-            # *** NEW TEXT: matches canary expectations ***
-            return "We don’t have that information yet. Here are some similar items from our catalog."
-        return "We couldn’t find that in the catalog."
+async def rag_query(body: RAGIn, conn: AsyncConnection = Depends(get_conn)):
+    """
+    Answer-cached front of `_rag_answer`. Keyed by normalized query + parsed
+    attrs + top_k + catalog version (bumped on catalog NOTIFY), so ingest and
+    stock updates never serve an old answer; stock-quoting answers also get
+    the short ANSWER_CACHE_STOCK_TTL_SECS.
+    """
+    attrs = await _parse_query_attrs(conn, body.query)
+    if _answer_cache_bypassed(body):
+        return await _rag_answer(body, conn, attrs=attrs)
+
+    version, vec, hit = await _answer_cache_lookup(body, conn, attrs)
+    if hit is not None:
+        return hit
+
+    flags = {"cacheable": True}
+    resp = await _rag_answer(body, conn, attrs=attrs, flags=flags)
+    if flags["cacheable"]:
+        _answer_cache_store(body, attrs, version, vec, resp)
+    return resp
+
+
+def _answer_cache_bypassed(body: RAGIn) -> bool:
+    # measurements make every fit answer personal; debug responses carry notes
+    return (
+        not ANSWER_CACHE_ENABLED
+        or os.getenv("RAG_DEBUG", "false").lower() == "true"
+        or _parse_fit_params(body.query) is not None
+    )
+
+
+async def _answer_cache_lookup(body: RAGIn, conn: AsyncConnection, attrs: Dict[str, List[str]]):
+    """(catalog version, query vector or None, cached response or None)."""
+    version = catalog_version()
+    vec = None
+    if answer_cache.semantic and os.getenv("DISABLE_EMBEDDING", "false").lower() != "true":
+        try:
+            vec = await embed_query(body.query, conn=conn)  # retrieval reuses it (cached)
+        except Exception as e:
+            log.warning("answer cache: query embedding skipped: %s", e)
+
+    hit = answer_cache.get(body.query, attrs, body.top_k, version, vec=vec)
+    if hit is not None:
+        emit("answer_cache_hit", new_trace_id(), {"q": body.query, "attrs": attrs})
+    return version, vec, hit
+
+
+def _answer_cache_store(body: RAGIn, attrs: Dict[str, List[str]], version: int, vec, resp: Dict[str, Any]) -> None:
+    quotes_stock = bool(attrs.get("colors") or attrs.get("sizes")) or "available" in (resp.get("answer") or "").lower()
+    answer_cache.put(
+        body.query, attrs, body.top_k, version, resp,
+        ttl=ANSWER_CACHE_STOCK_TTL_SECS if quotes_stock else None, vec=vec,
+    )
+
+
+def _friendly_unknown(query: str, reason: str = "") -> str:
+    """Nicer "Unknown" UX, shared by every stage of the pipeline."""
+    reason = (reason or "").lower()
+    ql = (query or "").lower()
+    if "shrink" in ql:
+        return "Shrinkage info isn’t listed in our catalog."
+    if "ood_type" in reason:
+        return "We don’t carry that item type yet."
+    if "no_docs" in reason:
+        return "We couldn’t find matching products in the catalog."
+    if "llm_fail" in reason:
+        # *** NEW TEXT: matches canary expectations ***
+        return "We don’t have that information yet. Here are some similar items from our catalog."
+    return "We couldn’t find that in the catalog."
+
+
+@dataclass
+class _RagRun:
+    """State handed between the pipeline stages (prepare → draft → compose)."""
+    body: RAGIn
+    conn: AsyncConnection
+    trace_id: str
+    attrs: Optional[Dict[str, List[str]]] = None
+    ask_shrink: bool = False
+    intent_kind: str = "generic"
+    docs: List[dict] = field(default_factory=list)
+    products: Optional[ProductCache] = None
+    ctx: str = ""
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    data: Dict[str, Any] = field(default_factory=dict)    # parsed LLM JSON
+    corrections: Dict[str, str] = field(default_factory=dict)
+    cacheable: bool = True
+    early: Optional[Dict[str, Any]] = None                 # streamed draft failed: final response
+    pending: List[asyncio.Task] = field(default_factory=list)
+
+
+@timed("rag_answer")
+async def _rag_answer(
+    body: RAGIn,
+    conn: AsyncConnection,
+    *,
+    attrs: Optional[Dict[str, List[str]]] = None,
+    flags: Optional[Dict[str, bool]] = None,
+) -> Dict[str, Any]:
+    """Full RAG pipeline. Sets flags["cacheable"] = False on degraded (LLM failure) answers."""
+    run = _RagRun(body=body, conn=conn, trace_id=new_trace_id(), attrs=attrs)
+    try:
+        early = await _prepare(run)
+        if early is None:
+            early = await _draft(run)
+        return early if early is not None else await _compose(run)
+    finally:
+        _cancel(run.pending)
+        if flags is not None:
+            flags["cacheable"] = run.cacheable
+
+
+# ---- Stage plumbing ----
+# _prepare runs as a small dependency graph:
+#
+#   retrieval -> products -> fit? -> { rerank | mmr vectors }
+#   rerank + mmr vectors -> MMR -> prompt -> LLM -> compose -> cross_check
+#
+# Stages inside {} only read retrieval output and run as concurrent tasks.
+# Fit and cross_check are in-process over the request's ProductCache, so
+# a fit answer never starts rerank/MMR.
+
+async def _stage(run: _RagRun, name: str, aw, *, timeout: float, default: Any = None) -> Any:
+    """One pipeline stage: bounded by `timeout`, traced as a span, `default` on failure."""
+    with span(name, run.trace_id) as sp:
+        try:
+            return await asyncio.wait_for(aw, timeout=timeout)
+        except asyncio.TimeoutError:
+            sp["status"] = "timeout"
+            log.warning("rag stage %s timed out after %.1fs", name, timeout)
+        except Exception as e:
+            sp["status"] = "error"
+            log.warning("rag stage %s failed: %s", name, e)
+        return default
+
+
+def _spawn(run: _RagRun, name: str, aw, *, timeout: float, default: Any = None) -> asyncio.Task:
+    task = asyncio.create_task(_stage(run, name, aw, timeout=timeout, default=default))
+    run.pending.append(task)
+    return task
+
+
+def _cancel(tasks: List[asyncio.Task]) -> None:
+    for t in tasks:
+        if not t.done():
+            t.cancel()
+
+
+async def _completed(value: Any = None) -> Any:
+    return value
+
 
+async def _verify(run: _RagRun, answer_text: str, citations: List[dict]) -> str:
+    """cross_check + guardrails against the cited products; sets run.corrections."""
+    corrections = run.corrections = await _stage(
+        run, "cross_check", cross_check(answer_text, citations, run.products),
+        timeout=RAG_TIMEOUT_VERIFY_SECS, default={},
+    )
+    emit(
+        "verification_done",
+        run.trace_id,
+        {"had_corrections": bool(corrections), "corrections": corrections},
+    )
+    return apply_guardrails(answer_text, corrections)
+
+
+async def _fit_answer(run: _RagRun, fit_params: _FitParams) -> str:
+    """Rules-based size recommendation as answer text; answers without the LLM."""
+    # Derive product type and slug for more accurate fit recommendation
+    product_type = (run.attrs.get("types") or ["hoodie"])[0]  # default hoodie if no explicit type
+    slug_for_fit = await _pick_primary_slug_for_fit(run.products, run.docs, run.attrs)
+
+    product = await run.products.get(slug_for_fit) if slug_for_fit else None
+    with span("fit", run.trace_id):
+        fit_resp = _fit_recommendation(
+            fit_params,
+            product_type=product_type,
+            product=product,
+            slug=slug_for_fit,
+        )
+
+    size = fit_resp.get("size")
+    if size:
+        return (
+            f"Based on your height and weight, we recommend size {size} for this {product_type}."
+            " This is an estimate, not a guaranteed perfect fit."
+        )
+    return "We couldn't confidently recommend a size from your measurements alone."
+
+
+async def _mmr_vectors(query: str, docs: List[dict], conn: AsyncConnection) -> Tuple[List[float], List[Any]]:
+    """Query vector plus one vector per doc (stored from retrieval, else embedded now)."""
+    doc_vecs = [d.get("embedding") for d in docs]
+    missing = [i for i, v in enumerate(doc_vecs) if v is None]
+    # only rows without a stored embedding go to the provider
+    query_vec, fresh = await asyncio.gather(
+        embed_query(query, conn=conn),  # cached by hybrid search
+        embed([docs[i].get("text", "") for i in missing]),
+    )
+    for i, v in zip(missing, fresh):
+        doc_vecs[i] = v
+    return query_vec, doc_vecs
+
+
+async def _prepare(run: _RagRun) -> Optional[Dict[str, Any]]:
+    """
+    Attrs/intent, retrieval, type gate, rules-based fit, rerank, MMR and the
+    LLM prompt. Returns a finished response when no LLM call is needed.
+    """
+    body, conn, trace_id = run.body, run.conn, run.trace_id
 
     # Parse attrs (colors, sizes, types) and classify intent
-    attrs = _parse_query_attrs(_conn, body.query)
+    if run.attrs is None:
+        run.attrs = await _parse_query_attrs(conn, body.query)
+    attrs = run.attrs
     ask_shrink = _ask_shrinkage(body.query)
     intent = classify(body.query, attrs)
     intent_kind = getattr(intent, "kind", "generic")
     emit("query_received", trace_id, {"q": body.query, "attrs": attrs, "intent": intent_kind})
 
     USE_KEYWORD_ONLY = os.getenv("DISABLE_EMBEDDING", "false").lower() == "true"
-    RAG_DEBUG = os.getenv("RAG_DEBUG", "false").lower() == "true"
+    USE_MMR = os.getenv("USE_MMR", "true").lower() == "true"
 
     # ---- Retrieval ----
-    try:
+    with span("retrieval", trace_id, mode="keyword" if USE_KEYWORD_ONLY else "hybrid") as sp:
         if USE_KEYWORD_ONLY:
-            docs = search_keyword(_conn, query=body.query, kind="product", top_k=body.top_k)
+            docs = await search_keyword_async(conn, query=body.query, kind="product", top_k=body.top_k)
         else:
-            docs = search_hybrid(_conn, query=body.query, kind="product", top_k=body.top_k, attrs=attrs)  # type: ignore
-    except TypeError:
-        # legacy signature
-        docs = (
-            search_keyword(_conn, query=body.query, kind="product", top_k=body.top_k)
-            if USE_KEYWORD_ONLY
-            else search_hybrid(_conn, query=body.query, kind="product", top_k=body.top_k)
-        )
+            docs = await search_hybrid_async(
+                conn, query=body.query, kind="product", top_k=body.top_k, attrs=attrs,
+                with_embeddings=USE_MMR,  # MMR below reuses the stored vectors
+            )
+        sp["count"] = len(docs)
 
     emit(
         "retrieval_done",
@@ -674,6 +718,10 @@ async def rag_query(body: RAGIn):
         },
     )
 
+    # One batched lookup for every retrieved product; later stages hit this cache.
+    products = ProductCache(conn)
+    await products.prefetch(_doc_slugs(docs))
+
     # -------- Soft type gate to avoid misleading answers (doc-based) --------
     # Only apply if user explicitly requested a product type and NONE of the
     # retrieved docs actually have that type in their meta.
@@ -685,7 +733,7 @@ async def rag_query(body: RAGIn):
             slug = _extract_slug(d.get("url", "") or "") or ""
             if not slug:
                 continue
-            prod = _get_product_meta(_conn, slug)
+            prod = await products.get(slug)
             if not prod:
                 continue
             meta = prod.get("meta") or {}
@@ -696,76 +744,59 @@ async def rag_query(body: RAGIn):
 
         if not any_match:
             return {
-                "answer": _friendly_unknown("ood_type", attrs=attrs),
+                "answer": _friendly_unknown(body.query, "ood_type"),
                 "citations": _fallback_cites(docs),
             }
 
     if not docs:
-        return {"answer": _friendly_unknown("no_docs", attrs=attrs), "citations": []}
+        return {"answer": _friendly_unknown(body.query, "no_docs"), "citations": []}
 
-    # -------- Optional rules-based fit recommendation (size_fit intent) --------
-    fit_params = _parse_fit_params(body.query)
-
-    if intent_kind == "size_fit" and fit_params is not None:
-        # Derive product type and slug for more accurate fit recommendation
-        product_type = (attrs.get("types") or ["hoodie"])[0]  # default hoodie if no explicit type
-        slug_for_fit = _pick_primary_slug_for_fit(_conn, docs, attrs)
-
-        fit_resp = await _call_fit_recommend(
-            fit_params,
-            product_type=product_type,
-            slug=slug_for_fit,
-        )
+    run.docs, run.products = docs, products
 
-        if fit_resp is not None:
-            size = fit_resp.get("size")
-            if size:
-                answer_text = (
-                    f"Based on your height and weight, we recommend size {size} for this {product_type}."
-                    " This is an estimate, not a guaranteed perfect fit."
-                )
-            else:
-                answer_text = "We couldn't confidently recommend a size from your measurements alone."
+    # -------- Independent stages (see "Stage plumbing") --------
+    fit_params = _parse_fit_params(body.query)
+    want_fit = intent_kind == "size_fit" and fit_params is not None
+    want_mmr = USE_MMR and not USE_KEYWORD_ONLY and len(docs) > 1
 
-            citations = _fallback_cites(docs)
-            corrections = await cross_check(answer_text, citations)
-            final_answer = apply_guardrails(answer_text, corrections)
-            emit(
-                "verification_done",
-                trace_id,
-                {"had_corrections": bool(corrections), "corrections": corrections},
-            )
+    # -------- Optional rules-based fit recommendation (size_fit intent) --------
+    if want_fit:
+        answer_text = await _fit_answer(run, fit_params)
+        citations = _fallback_cites(docs)
+        return {
+            "answer": await _verify(run, answer_text, citations),
+            "citations": citations,
+        }
 
-            return {
-                "answer": final_answer,
-                "citations": citations,
-            }
+    rerank_task = _spawn(run, "rerank", rerank(body.query, docs), timeout=RAG_TIMEOUT_RERANK_SECS, default=docs)
+    vectors_task = (
+        _spawn(run, "mmr_vectors", _mmr_vectors(body.query, docs, conn), timeout=RAG_TIMEOUT_MMR_SECS)
+        if want_mmr else None
+    )
 
-    # -------- Rerank (Cohere) --------
-    reranked = await rerank(body.query, docs)
+    # -------- Rerank (Cohere) + MMR inputs --------
+    reranked, vectors = await asyncio.gather(rerank_task, vectors_task or _completed())
     emit("rerank_applied" if reranked is not docs else "rerank_skipped", trace_id, {})
+    vec_by_doc = {id(d): v for d, v in zip(docs, vectors[1])} if vectors else {}
     docs = reranked[: body.top_k]
 
-    # --- NEW: MMR diversity rerank (optional) ---
-    USE_MMR = os.getenv("USE_MMR", "true").lower() == "true"
-
-    if USE_MMR and not USE_KEYWORD_ONLY and len(docs) > 1:
-        try:
-            vecs = await embed([body.query] + [d.get("text", "") for d in docs])
-            if vecs and len(vecs) >= len(docs) + 1:
-                query_vec = vecs[0]
-                doc_vecs = vecs[1:]
+    # --- MMR diversity rerank (optional) ---
+    if want_mmr and len(docs) > 1:
+        doc_vecs = [vec_by_doc.get(id(d)) for d in docs]
+        if vectors and all(v is not None for v in doc_vecs):
+            try:
                 docs = mmr_rerank_from_vectors(
-                    query_embedding=query_vec,
+                    query_embedding=vectors[0],
                     doc_embeddings=doc_vecs,
                     docs=docs,
                     lambda_mult=0.55,
                     top_k=min(body.top_k, 8),
                 )
                 emit("mmr_applied", trace_id, {"count": len(docs)})
-        except Exception as e:
-            log.warning("MMR rerank skipped: %s", e)
-            emit("mmr_skipped", trace_id, {"error": str(e)})
+            except Exception as e:
+                log.warning("MMR rerank skipped: %s", e)
+                emit("mmr_skipped", trace_id, {"error": str(e)})
+        else:
+            emit("mmr_skipped", trace_id, {"error": "no vectors"})
 
     # -------- Build context for LLM --------
     ctx = "\n\n".join(
@@ -784,47 +815,170 @@ async def rag_query(body: RAGIn):
         },
     ]
 
+    run.ask_shrink, run.intent_kind = ask_shrink, intent_kind
+    run.docs, run.ctx, run.messages = docs, ctx, messages
+    return None
+
+def _parse_llm_json(out: str, docs: List[dict]) -> Dict[str, Any]:
+    raw = _strip_code_fences(out)
+    try:
+        return json.loads(raw)
+    except Exception:
+        return {"answer": out, "citations": _fallback_cites(docs)}
+
+
+def _llm_failed(run: _RagRun, message: str) -> Optional[Dict[str, Any]]:
+    """Degraded draft: friendly unknown (LLM_BYPASS_ON_FAIL) or an early response."""
+    run.cacheable = False
+    if os.getenv("LLM_BYPASS_ON_FAIL", "false").lower() == "true":
+        run.data = {
+            "answer": _friendly_unknown(run.body.query, "llm_fail"),
+            "citations": _fallback_cites(run.docs),
+        }
+        return None
+    return {"answer": message, "citations": _fallback_cites(run.docs)}
+
+
+async def _draft(run: _RagRun) -> Optional[Dict[str, Any]]:
     # ---- LLM draft (offline-safe & bounded) ----
     if os.getenv("LLM_OFFLINE", "false").lower() == "true":
-        data = {
-            "answer": _friendly_unknown("llm_fail", attrs=attrs),
-            "citations": _fallback_cites(docs),
+        run.cacheable = False
+        run.data = {
+            "answer": _friendly_unknown(run.body.query, "llm_fail"),
+            "citations": _fallback_cites(run.docs),
         }
-    else:
-        _llm_timeout = int(os.getenv("LLM_HARD_TIMEOUT_SECS", "12"))
-        _llm_bypass = os.getenv("LLM_BYPASS_ON_FAIL", "false").lower() == "true"
+        return None
+
+    _llm_timeout = int(os.getenv("LLM_HARD_TIMEOUT_SECS", "12"))
+    with span("llm", run.trace_id) as sp:
         try:
-            out = await asyncio.wait_for(_llm.generate(messages), timeout=_llm_timeout)
+            out = await asyncio.wait_for(_llm.generate(run.messages), timeout=_llm_timeout)
         except (asyncio.TimeoutError, httpx.ReadTimeout) as e:
+            sp["status"] = "timeout"
             log.warning("LLM timeout: %s", e)
-            if _llm_bypass:
-                data = {
-                    "answer": _friendly_unknown("llm_fail", attrs=attrs),
-                    "citations": _fallback_cites(docs),
-                }
-            else:
-                return {
-                    "answer": "Sorry—our language model timed out. Here are the top matches.",
-                    "citations": _fallback_cites(docs),
-                }
+            return _llm_failed(run, "Sorry—our language model timed out. Here are the top matches.")
         except Exception as e:
+            sp["status"] = "error"
             log.warning("LLM generate failed: %s", e)
-            if _llm_bypass:
-                data = {
-                    "answer": _friendly_unknown("llm_fail", attrs=attrs),
-                    "citations": _fallback_cites(docs),
-                }
-            else:
-                return {
-                    "answer": "Sorry—having trouble reaching the language model. Here are the top matches.",
-                    "citations": _fallback_cites(docs),
-                }
-        else:
-            raw = _strip_code_fences(out)
-            try:
-                data = json.loads(raw)
-            except Exception:
-                data = {"answer": out, "citations": _fallback_cites(docs)}
+            return _llm_failed(run, "Sorry—having trouble reaching the language model. Here are the top matches.")
+    run.data = _parse_llm_json(out, run.docs)
+    return None
+
+
+_ANSWER_KEY_RE = re.compile(r'"answer"\s*:\s*"')
+_JSON_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+def _hex4(s: str) -> Optional[int]:
+    try:
+        return int(s, 16)
+    except ValueError:
+        return None
+
+class _AnswerFieldStream:
+    """Incrementally pull the "answer" string out of the model's streamed JSON."""
+
+    def __init__(self):
+        self.buf = ""
+        self._pos: Optional[int] = None
+        self._done = False
+
+    def feed(self, delta: str) -> str:
+        self.buf += delta
+        if self._done:
+            return ""
+        if self._pos is None:
+            m = _ANSWER_KEY_RE.search(self.buf)
+            if not m:
+                return ""
+            self._pos = m.end()
+        out: List[str] = []
+        i, buf = self._pos, self.buf
+        while i < len(buf):
+            ch = buf[i]
+            if ch == "\\":
+                if i + 1 >= len(buf):
+                    break  # escape split across chunks
+                nxt = buf[i + 1]
+                if nxt == "u":
+                    if i + 6 > len(buf):
+                        break
+                    cp, step = _hex4(buf[i + 2:i + 6]), 6
+                    if cp is not None and 0xD800 <= cp < 0xDC00:
+                        # non-BMP characters arrive as a \uD8xx\uDCxx pair; a lone
+                        # surrogate would fail UTF-8 encoding in the SSE response
+                        tail = buf[i + 6:i + 12]
+                        if len(tail) < 6 and "\\u".startswith(tail[:2]):
+                            break  # low half not streamed yet
+                        lo = _hex4(tail[2:]) if tail.startswith("\\u") else None
+                        if lo is not None and 0xDC00 <= lo < 0xE000:
+                            cp, step = 0x10000 + ((cp - 0xD800) << 10) + (lo - 0xDC00), 12
+                        else:
+                            cp = 0xFFFD
+                    elif cp is not None and 0xDC00 <= cp < 0xE000:
+                        cp = 0xFFFD
+                    if cp is not None:
+                        out.append(chr(cp))
+                    i += step
+                    continue
+                out.append(_JSON_ESCAPES.get(nxt, nxt))
+                i += 2
+                continue
+            if ch == '"':
+                self._done = True
+                i += 1
+                break
+            out.append(ch)
+            i += 1
+        self._pos = i
+        return "".join(out)
+
+
+async def _draft_stream(run: _RagRun) -> AsyncIterator[str]:
+    """
+    Streaming twin of `_draft`: yields answer text as the model produces it,
+    then leaves the parsed JSON in run.data (or a failure response in run.early).
+    """
+    if os.getenv("LLM_OFFLINE", "false").lower() == "true":
+        await _draft(run)
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + int(os.getenv("LLM_HARD_TIMEOUT_SECS", "12"))
+    field_stream = _AnswerFieldStream()
+    deltas = _llm.stream(run.messages)
+    with span("llm", run.trace_id, stream=True) as sp:
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    delta = await asyncio.wait_for(deltas.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    break
+                text = field_stream.feed(delta)
+                if text:
+                    yield text
+        except (asyncio.TimeoutError, httpx.ReadTimeout) as e:
+            sp["status"] = "timeout"
+            log.warning("LLM stream timeout: %s", e)
+            run.early = _llm_failed(run, "Sorry—our language model timed out. Here are the top matches.")
+            return
+        except Exception as e:
+            sp["status"] = "error"
+            log.warning("LLM stream failed: %s", e)
+            run.early = _llm_failed(run, "Sorry—having trouble reaching the language model. Here are the top matches.")
+            return
+        finally:
+            await deltas.aclose()
+    run.data = _parse_llm_json(field_stream.buf, run.docs)
+
+
+async def _compose(run: _RagRun) -> Dict[str, Any]:
+    """Citations, unknown-with-suggestions, verified stock lines, guardrails."""
+    body, attrs, docs, products = run.body, run.attrs, run.docs, run.products
+    ask_shrink, intent_kind, ctx, data = run.ask_shrink, run.intent_kind, run.ctx, run.data
+    RAG_DEBUG = os.getenv("RAG_DEBUG", "false").lower() == "true"
 
     # -------- Normalize citations from model --------
     citations = _normalize_citations(data.get("citations"), docs)
@@ -835,7 +989,7 @@ async def rag_query(body: RAGIn):
     is_unknown = normalized == "unknown"
 
     if is_unknown and not ask_shrink and not attrs.get("colors") and intent_kind != "policy":
-        alt_lines, alt_cites = _build_suggestions_for_unknown(_conn, docs, attrs, max_items=2)
+        alt_lines, alt_cites = await _build_suggestions_for_unknown(products, docs, attrs, max_items=2)
 
         if alt_lines:
             answer_text = (
@@ -851,13 +1005,7 @@ async def rag_query(body: RAGIn):
             )
             citations = _fallback_cites(docs)
 
-        corrections = await cross_check(answer_text, citations)
-        final_answer = apply_guardrails(answer_text, corrections)
-        emit(
-            "verification_done",
-            trace_id,
-            {"had_corrections": bool(corrections), "corrections": corrections},
-        )
+        final_answer = await _verify(run, answer_text, citations)
 
         if RAG_DEBUG:
             log.warning("[RAG_DEBUG] unknown_with_suggestions=%s", final_answer)
@@ -869,13 +1017,12 @@ async def rag_query(body: RAGIn):
 
     # -------- Verified composition (shrinkage + colors/sizes) --------
     lines: List[str] = []
-    prod_cache: Dict[str, dict] = {}
 
     # Shrinkage line (never guess)
     if ask_shrink:
         if "shrink" in ctx.lower():
             first = (data.get("answer", "") or "").split(".")[0].strip()
-            shrink_line = first if first else _friendly_unknown("shrink", attrs=attrs)
+            shrink_line = first if first else _friendly_unknown(body.query, "shrink")
         else:
             shrink_line = "Shrinkage: not stated in catalog."
         lines.append(shrink_line if shrink_line.endswith(".") else shrink_line + ".")
@@ -908,7 +1055,7 @@ async def rag_query(body: RAGIn):
 
     if colors:
         available, color_sizes, _ = await _verify_color_stock_for_citations(
-            citations, colors, prod_cache=prod_cache, conn=_conn
+            citations, colors, products=products
         )
         for c in colors:
             if not available.get(c):
@@ -929,7 +1076,7 @@ async def rag_query(body: RAGIn):
                     slug = _extract_slug(d.get("url", "") or "") or ""
                     if not slug:
                         continue
-                    prod = prod_cache.get(slug) or (_get_product_meta(_conn, slug) if _conn else None)
+                    prod = await products.get(slug)
                     if not prod:
                         continue
                     meta = prod.get("meta") or {}
@@ -980,7 +1127,7 @@ async def rag_query(body: RAGIn):
         if wants_overview:
             wanted_types = set(attrs.get("types") or [])
             _, __, all_colors_by_slug = await _verify_color_stock_for_citations(
-                citations, [], prod_cache=prod_cache, conn=_conn
+                citations, [], products=products
             )
 
             anchor_type: Optional[str] = None
@@ -992,7 +1139,7 @@ async def rag_query(body: RAGIn):
                 slug = _extract_slug(d.get("url", "") or "") or ""
                 if not slug:
                     continue
-                prod = prod_cache.get(slug) or (_get_product_meta(_conn, slug) if _conn else None)
+                prod = await products.get(slug)
                 if not prod:
                     continue
 
@@ -1029,13 +1176,7 @@ async def rag_query(body: RAGIn):
     draft_answer = " ".join(lines)
 
     # ===== Numeric/entity verifier (prices/sizes) =====
-    corrections = await cross_check(draft_answer, citations)
-    final_answer = apply_guardrails(draft_answer, corrections)
-    emit(
-        "verification_done",
-        trace_id,
-        {"had_corrections": bool(corrections), "corrections": corrections},
-    )
+    final_answer = await _verify(run, draft_answer, citations)
 
     if RAG_DEBUG:
         log.warning("[RAG_DEBUG] composed=%s", final_answer)
@@ -1045,6 +1186,62 @@ async def rag_query(body: RAGIn):
         resp["debug"] = {"notes": debug_notes}
     return resp
 
+# ------------------ Streaming (SSE) ------------------
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/ai/rag/stream")
+async def rag_stream(body: RAGIn):
+    """
+    Server-Sent Events twin of /ai/rag/query:
+      event: retrieval  {citations}                      right after retrieval/rerank/MMR
+      event: token      {text}                           answer text while the LLM streams
+      event: final      {answer, citations, corrections} verified answer; replaces the tokens
+      event: error      {error}
+    A cache hit or an answer that needs no LLM goes straight to `final`.
+    """
+    return StreamingResponse(
+        _rag_events(body),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _rag_events(body: RAGIn) -> AsyncIterator[str]:
+    # Own pool checkout: yield-dependencies are torn down before a
+    # StreamingResponse body runs, so Depends(get_conn) can't be used here.
+    try:
+        async with get_pool().connection() as conn:
+            attrs = await _parse_query_attrs(conn, body.query)
+            use_cache = not _answer_cache_bypassed(body)
+            version, vec = 0, None
+            if use_cache:
+                version, vec, hit = await _answer_cache_lookup(body, conn, attrs)
+                if hit is not None:
+                    yield _sse("final", {**hit, "corrections": {}})
+                    return
+
+            run = _RagRun(body=body, conn=conn, trace_id=new_trace_id(), attrs=attrs)
+            try:
+                resp = await _prepare(run)
+                if resp is None:
+                    yield _sse("retrieval", {"citations": _fallback_cites(run.docs)})
+                    async for text in _draft_stream(run):
+                        yield _sse("token", {"text": text})
+                    resp = run.early if run.early is not None else await _compose(run)
+            finally:
+                _cancel(run.pending)
+
+            if use_cache and run.cacheable:
+                _answer_cache_store(body, attrs, version, vec, resp)
+            yield _sse("final", {**resp, "corrections": run.corrections})
+    except Exception as e:
+        log.exception("rag stream failed: %s", e)
+        yield _sse("error", {"error": "internal_error"})
+
+
 # ------------------ Canary / eval set for RAG ------------------
 
 _CANARY_QUERIES: List[Dict[str, Any]] = [
@@ -1118,7 +1315,7 @@ def _eval_canary_case(case: Dict[str, Any], resp: Dict[str, Any]) -> Tuple[bool,
     return ok, notes
 
 @router.post("/ai/rag/canary")
-async def rag_canary(limit: int = 0) -> Dict[str, Any]:
+async def rag_canary(limit: int = 0, conn: AsyncConnection = Depends(get_conn)) -> Dict[str, Any]:
     """
     Run a small, hard-coded canary set against /ai/rag/query.
     This is for local/regression checks, not exposed in production UI.
@@ -1131,8 +1328,8 @@ async def rag_canary(limit: int = 0) -> Dict[str, Any]:
 
     for case in cases:
         body = RAGIn(query=case["query"], top_k=case.get("top_k", 6))
-        # Reuse the main rag_query logic directly
-        resp = await rag_query(body)
+        # Reuse the main pipeline directly (never the answer cache)
+        resp = await _rag_answer(body, conn)
 
         ok, notes = _eval_canary_case(case, resp)
         if ok:
@@ -1159,13 +1356,10 @@ async def rag_canary(limit: int = 0) -> Dict[str, Any]:
 
 
 @router.post("/ai/rag/debug")
-async def rag_debug(body: RAGIn):
-    global _conn
-    _conn = _conn or connect()
-
-    attrs = _parse_query_attrs(_conn, body.query)
+async def rag_debug(body: RAGIn, conn: AsyncConnection = Depends(get_conn)):
+    attrs = await _parse_query_attrs(conn, body.query)
     # Always pure keyword here so no external HTTP happens
-    docs = search_keyword(_conn, query=body.query, kind="product", top_k=body.top_k)
+    docs = await search_keyword_async(conn, query=body.query, kind="product", top_k=body.top_k)
 
     return {
         "count": len(docs),
@@ -1,21 +1,23 @@
 # app/routes/recs.py
 from __future__ import annotations
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from psycopg import AsyncConnection
 from pydantic import BaseModel
 from typing import Any, Dict, List, Optional, Tuple
 import logging
 import os
 import re
 
-from app.vector.store import connect, search_hybrid, search_keyword
+from app.core.db import get_conn
+from app.vector.store import (
+    search_hybrid_async, search_keyword_async, ProductCache, product_fields, product_payload,
+)
 from app.telemetry.trace import new_trace_id, emit
 
 log = logging.getLogger("cove.recs")
 router = APIRouter()
 
-_conn = None
-
 # -------------------------------------------------------------------
 # I/O models
 # -------------------------------------------------------------------
@@ -51,43 +53,6 @@ class RecsOut(BaseModel):
 # Helpers (local, no LLM)
 # -------------------------------------------------------------------
 
-def _extract_slug(url: str) -> Optional[str]:
-    """
-    Extract slug from URLs like '/product/hoodie-casual-fleece-59.99'.
-    """
-    if not url:
-        return None
-    m = re.search(r"/product/([^?\s]+)", url)
-    return m.group(1) if m else None
-
-
-def _get_product_meta(conn, slug: str) -> Optional[dict]:
-    """
-    Fetch product title + meta by slug directly from ai_core.docs.
-    Duplicated from rag.py on purpose to avoid circular imports.
-    """
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT title, meta
-            FROM ai_core.docs
-            WHERE kind='product' AND meta->>'slug' = %s
-            LIMIT 1
-            """,
-            (slug,),
-        )
-        row = cur.fetchone()
-    if not row:
-        return None
-    title, meta = row
-    return {
-        "title": title or (meta.get("name") if isinstance(meta, dict) else ""),
-        "url": f"/product/{slug}",
-        "price": (meta.get("price") if isinstance(meta, dict) else None),
-        "meta": meta or {},
-    }
-
-
 def _clean_title(t: str) -> str:
     """
     Remove trailing parentheticals like ' (100% Cotton)' to keep titles tidy.
@@ -225,7 +190,7 @@ def _pick_primary_color(meta: dict, desired_color: Optional[str]) -> Optional[st
 # -------------------------------------------------------------------
 
 @router.post("/ai/recs/suggest", response_model=RecsOut)
-async def recs_suggest(body: RecsIn) -> RecsOut:
+async def recs_suggest(body: RecsIn, conn: AsyncConnection = Depends(get_conn)) -> RecsOut:
     """
     Recommend similar products given:
       - an anchor product slug (similar-to-this)
@@ -241,8 +206,6 @@ async def recs_suggest(body: RecsIn) -> RecsOut:
       pop_score   = meta.popularity (0..1) if present, else 0.5
       avail_score = simple availability heuristic (stock-aware, no counts exposed)
     """
-    global _conn
-    _conn = _conn or connect()
     trace_id = new_trace_id()
 
     filters = body.filters or RecsFilters()
@@ -251,8 +214,9 @@ async def recs_suggest(body: RecsIn) -> RecsOut:
     # 1) Resolve anchor product (if any)
     anchor_meta: Optional[dict] = None
     anchor_slug = (body.anchor_slug or "").strip()
+    products = ProductCache(conn)
     if anchor_slug:
-        anchor_meta = _get_product_meta(_conn, anchor_slug)
+        anchor_meta = await products.get(anchor_slug)
         if not anchor_meta:
             log.warning("recs_suggest: anchor slug %s not found", anchor_slug)
 
@@ -273,23 +237,26 @@ async def recs_suggest(body: RecsIn) -> RecsOut:
         return RecsOut(items=[])
 
     # 3) Run hybrid search (or keyword-only if embeddings disabled)
+    #    Filters are pushed into the SQL so the candidate set is ranked among
+    #    matching products; the meta checks in step 4 stay as the final word.
     USE_KEYWORD_ONLY = os.getenv("DISABLE_EMBEDDING", "false").lower() == "true"
+    sql_filters = filters.dict()
 
     if USE_KEYWORD_ONLY:
-        docs = search_keyword(
-            _conn,
+        docs = await search_keyword_async(
+            conn,
             query=retrieval_query,
             kind="product",
             top_k=top_k * 4,
+            filters=sql_filters,
         )
     else:
-        # We don't pass attrs for now to keep this route simple;
-        # filters are applied post-retrieval using meta, which we trust more.
-        docs = search_hybrid(
-            _conn,
+        docs = await search_hybrid_async(
+            conn,
             query=retrieval_query,
             kind="product",
             top_k=top_k * 4,
+            filters=sql_filters,
         )
 
     emit(
@@ -306,37 +273,48 @@ async def recs_suggest(body: RecsIn) -> RecsOut:
     if not docs:
         return RecsOut(items=[])
 
-    # 4) Build candidate list with meta and apply filters
-    candidates: List[Tuple[dict, dict]] = []  # (doc, prod_meta)
+    # 4) Build candidate list from the retrieval payload and apply filters.
+    #    Product-level rows already carry meta + structured fields; only
+    #    variant-level rows (no meta.slug) need their product row resolved,
+    #    and those go in one batched query.
+    def _is_product_row(d: dict) -> bool:
+        return bool(d.get("slug")) and (d.get("meta") or {}).get("slug") == d.get("slug")
+
+    await products.prefetch([d.get("slug") or "" for d in docs if not _is_product_row(d)])
+    candidates: List[Tuple[dict, dict, dict]] = []  # (doc, prod_meta, fields)
     for d in docs:
-        slug = _extract_slug(d.get("url", "") or "") or ""
+        slug = d.get("slug") or ""
         if not slug:
             continue
         if anchor_slug and slug == anchor_slug:
             continue  # avoid recommending the same item as "similar"
 
-        prod = _get_product_meta(_conn, slug)
-        if not prod:
-            continue
+        if _is_product_row(d):
+            prod = product_payload(slug, d.get("title"), d.get("meta"))
+            fields = d
+        else:
+            prod = await products.get(slug)
+            if not prod:
+                continue
+            fields = product_fields(prod.get("meta"), prod.get("url") or "")
 
         meta = prod.get("meta") or {}
 
         # --- Apply filters (type, tier, color, size) ---
 
-        ptype = (meta.get("type") or "").lower().strip()
+        ptype = fields.get("type") or ""
         if filters.type and ptype and ptype != filters.type.lower().strip():
             continue
 
-        ptier = (meta.get("tier") or "").lower().strip()
+        ptier = fields.get("tier") or ""
         if filters.tier and ptier and ptier != filters.tier.lower().strip():
             continue
 
         if filters.color:
             wanted_color = filters.color.lower().strip()
-            color_names = [
-                (c.get("colorName") or "").lower().strip()
-                for c in (meta.get("colors") or [])
-            ]
+            color_names = [c.lower() for c in (fields.get("colors") or [])]
+            if not color_names and meta.get("color"):
+                color_names = [str(meta["color"]).lower().strip()]
             if color_names and wanted_color not in color_names:
                 continue
 
@@ -349,7 +327,7 @@ async def recs_suggest(body: RecsIn) -> RecsOut:
                     # If we want more relaxed recs, we could drop this filter.
                     continue
 
-        candidates.append((d, prod))
+        candidates.append((d, prod, fields))
 
     if not candidates:
         emit("recs_no_candidates_after_filter", trace_id, {"filters": filters.dict()})
@@ -361,8 +339,8 @@ async def recs_suggest(body: RecsIn) -> RecsOut:
 
     scored_items: List[Tuple[float, RecItem]] = []
 
-    for (doc, prod), sim in zip(candidates, norm_sim_scores):
-        slug = _extract_slug(doc.get("url", "") or "") or ""
+    for (doc, prod, fields), sim in zip(candidates, norm_sim_scores):
+        slug = fields.get("slug") or doc.get("slug") or ""
         meta = prod.get("meta") or {}
         title_raw = prod.get("title") or doc.get("title", "Product")
         title = _clean_title(title_raw)
@@ -384,8 +362,8 @@ async def recs_suggest(body: RecsIn) -> RecsOut:
         # Build a short "reason" string
         reason_pieces: List[str] = []
 
-        ptype = (meta.get("type") or "").lower().strip()
-        ptier = (meta.get("tier") or "").lower().strip()
+        ptype = fields.get("type") or ""
+        ptier = fields.get("tier") or ""
         primary_color = _pick_primary_color(meta, filters.color)
         requested_size = (filters.size or "").upper().strip()
 
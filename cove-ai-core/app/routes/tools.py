@@ -1,14 +1,14 @@
 # app/routes/tools.py
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel
 from typing import Any, Optional
 from uuid import UUID
+from psycopg import AsyncConnection
 from psycopg.rows import dict_row
 
-from app.vector.store import connect
+from app.core.db import get_conn
 
 router = APIRouter()
-_conn = None
 
 class ProductOut(BaseModel):
     id: UUID
@@ -18,21 +18,17 @@ class ProductOut(BaseModel):
     stock: Optional[dict] = None
     meta: dict = {}
 
-def _get_conn():
-    global _conn
-    if _conn is None:
-        _conn = connect()
-    return _conn
-
 @router.get("/ai/tools/product.get", response_model=ProductOut)
-def product_get(slug: str = Query(..., description="product slug e.g. hoodie-casual-fleece-59.99")):
+async def product_get(
+    slug: str = Query(..., description="product slug e.g. hoodie-casual-fleece-59.99"),
+    conn: AsyncConnection = Depends(get_conn),
+):
     """
     Lookup a product row stored in ai_core.docs where kind='product'
     and meta->>'slug' matches.
     """
-    conn = _get_conn()
-    with conn.cursor(row_factory=dict_row) as cur:
-        cur.execute(
+    async with conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(
             """
             SELECT id, kind, title, text, url, meta
             FROM ai_core.docs
@@ -41,7 +37,7 @@ def product_get(slug: str = Query(..., description="product slug e.g. hoodie-cas
             """,
             (slug,),
         )
-        row = cur.fetchone()
+        row = await cur.fetchone()
         if not row:
             # FastAPI will render this as JSON automatically
             # (no jq parse error)
@@ -65,22 +61,24 @@ def product_get(slug: str = Query(..., description="product slug e.g. hoodie-cas
         )
 
 @router.get("/ai/tools/variant.get")
-def variant_get(variantId: str = Query(...)):
+async def variant_get(variantId: str = Query(...), conn: AsyncConnection = Depends(get_conn)):
     """
-    Optional: fetch by variantId from meta (for verifier).
+    Optional: fetch by variantId (for verifier). Indexed lookup through
+    ai_core.product_attrs; the variant-level doc wins over its product row.
     """
-    conn = _get_conn()
-    with conn.cursor(row_factory=dict_row) as cur:
-        cur.execute(
+    async with conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(
             """
-            SELECT id, title, url, meta
-            FROM ai_core.docs
-            WHERE kind = 'product' AND meta @> %s::jsonb
+            SELECT d.id, d.title, d.url, d.meta
+            FROM ai_core.product_attrs a
+            JOIN ai_core.docs d ON d.id = a.product_doc_id
+            WHERE a.variant_id = %s
+            ORDER BY (d.meta->>'variantId' IS NOT NULL) DESC
             LIMIT 1
             """,
-            ({"variantId": variantId},),
+            (variantId,),
         )
-        row = cur.fetchone()
+        row = await cur.fetchone()
         if not row:
             return {"ok": False, "error": f"variant {variantId} not found"}
         return {
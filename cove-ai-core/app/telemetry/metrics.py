@@ -0,0 +1,169 @@
+# app/telemetry/metrics.py
+from __future__ import annotations
+import asyncio, functools, math, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple, TypeVar
+
+# In-process latency metrics for the RAG pipeline, exported by /ai/metrics
+# (app/routes/health.py) in the Prometheus text format.
+#
+# Every trace.span() lands here (rerank, mmr_vectors, cross_check, llm, fit,
+# retrieval); code without a trace id uses `timer` / `@timed`. Per stage we
+# keep an HDR-style log-linear histogram (8 sub-buckets per power of two of
+# microseconds, <= 12.5% relative error, fixed memory) for quantiles, plus
+# cumulative counts on fixed Prometheus `le` bounds so histogram_quantile()
+# and rate() work across scrapes and workers.
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_SUB_BITS = 3
+_SUB = 1 << _SUB_BITS
+_MAX_EXP = 36                                     # 2**36 us ~ 19 h; anything longer is clamped
+_N_BUCKETS = (_MAX_EXP - _SUB_BITS + 1) * _SUB
+
+PROM_BOUNDS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+QUANTILES: Tuple[float, ...] = (0.5, 0.9, 0.99)
+
+def _index(us: int) -> int:
+    if us < _SUB:
+        return us
+    e = us.bit_length() - _SUB_BITS - 1          # leaves the top SUB_BITS+1 bits: us >> e in [SUB, 2*SUB)
+    return min((e + 1) * _SUB + (us >> e) - _SUB, _N_BUCKETS - 1)
+
+def _lower(idx: int) -> int:
+    if idx < _SUB:
+        return idx
+    e = idx // _SUB - 1
+    return (idx % _SUB + _SUB) << e
+
+class LatencyHistogram:
+    """Log-linear (HDR-style) histogram of durations plus Prometheus bucket counts."""
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * _N_BUCKETS
+        self.prom: List[int] = [0] * len(PROM_BOUNDS)   # per-bound (not cumulative) counts
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        seconds = max(0.0, seconds)
+        self.counts[_index(int(seconds * 1e6))] += 1
+        i = bisect_left(PROM_BOUNDS, seconds)
+        if i < len(self.prom):
+            self.prom[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Upper edge of the bucket holding the q-th value, in seconds (capped at the max seen)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(_lower(idx + 1) / 1e6, self.max)
+        return self.max
+
+    def cumulative(self) -> List[int]:
+        out, acc = [], 0
+        for c in self.prom:
+            acc += c
+            out.append(acc)
+        return out
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()   # the sync CLI retriever may record from threads
+        self._hist: Dict[str, LatencyHistogram] = {}
+        self._status: Dict[Tuple[str, str], int] = {}
+
+    def observe(self, stage: str, seconds: float, status: str = "ok") -> None:
+        with self._lock:
+            h = self._hist.get(stage)
+            if h is None:
+                h = self._hist[stage] = LatencyHistogram()
+            h.record(seconds)
+            self._status[(stage, status)] = self._status.get((stage, status), 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                stage: {"count": h.count, "sum": h.sum, "max": h.max,
+                        **{f"p{int(q * 100)}": h.quantile(q) for q in QUANTILES}}
+                for stage, h in self._hist.items()
+            }
+
+    def render(self) -> str:
+        """Prometheus text exposition (format 0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            stages = sorted(self._hist.items())
+            lines += ["# HELP cove_ai_stage_seconds Latency of RAG pipeline stages.",
+                      "# TYPE cove_ai_stage_seconds histogram"]
+            for stage, h in stages:
+                lab = f'stage="{_esc(stage)}"'
+                for bound, n in zip(PROM_BOUNDS, h.cumulative()):
+                    lines.append(f'cove_ai_stage_seconds_bucket{{{lab},le="{bound:g}"}} {n}')
+                lines.append(f'cove_ai_stage_seconds_bucket{{{lab},le="+Inf"}} {h.count}')
+                lines.append(f"cove_ai_stage_seconds_sum{{{lab}}} {h.sum:.6f}")
+                lines.append(f"cove_ai_stage_seconds_count{{{lab}}} {h.count}")
+
+            lines += ["# HELP cove_ai_stage_quantile_seconds Latency quantiles since process start (HDR estimate).",
+                      "# TYPE cove_ai_stage_quantile_seconds gauge"]
+            for stage, h in stages:
+                for q in QUANTILES:
+                    lines.append(f'cove_ai_stage_quantile_seconds{{stage="{_esc(stage)}",quantile="{q:g}"}} '
+                                 f"{h.quantile(q):.6f}")
+                lines.append(f'cove_ai_stage_quantile_seconds{{stage="{_esc(stage)}",quantile="1"}} {h.max:.6f}')
+
+            lines += ["# HELP cove_ai_stage_total Completed stage runs by outcome.",
+                      "# TYPE cove_ai_stage_total counter"]
+            for (stage, status), n in sorted(self._status.items()):
+                lines.append(f'cove_ai_stage_total{{stage="{_esc(stage)}",status="{_esc(status)}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metrics = Registry()
+
+# --------- Timing helpers (no trace id needed) ----------
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        metrics.observe(stage, time.perf_counter() - t0, status)
+
+def timed(stage: str) -> Callable[[F], F]:
+    """Decorator: record every call of a sync or async function under `stage`."""
+    def deco(fn: F) -> F:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with timer(stage):
+                    return await fn(*args, **kwargs)
+            return awrapper  # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return deco
@@ -0,0 +1,226 @@
+# app/telemetry/sink.py
+from __future__ import annotations
+import asyncio, json, logging, random, sys, time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, TextIO
+
+from app.core.config import (
+    TELEMETRY_SINK, TELEMETRY_FILE, TELEMETRY_QUEUE_MAX, TELEMETRY_BATCH,
+    TELEMETRY_FLUSH_SECS, TELEMETRY_SAMPLE, TELEMETRY_SAMPLE_DEFAULT,
+)
+from app.core.http import request, request_sync
+
+log = logging.getLogger("cove.telemetry")
+
+# Buffered sink behind trace.emit. On the request path an event is a sample
+# check and a deque append; serialization and I/O happen in one background
+# task (app lifespan), in batches, off the event loop for stdout/file.
+#
+#   - bounded buffer: when full, new events are dropped and counted per event
+#   - sampling: TELEMETRY_SAMPLE="span:llm=1,query_received=0.1,span=0.2";
+#     spans that did not end "ok" and events carrying "error" are always kept
+#   - outputs: stdout (JSON lines), file (JSON lines, appended), otlp (OTLP/HTTP
+#     JSON logs to a local collector, provider "otlp" in app/core/http.py), none
+#
+# Until start() (CLIs, scripts, tests) and after stop(), events are written
+# synchronously as before, so nothing is lost outside the app.
+
+def parse_sample(spec: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        key, _, val = part.partition("=")
+        if key.strip() and val.strip():
+            try:
+                rates[key.strip()] = max(0.0, min(1.0, float(val)))
+            except ValueError:
+                log.warning("ignoring TELEMETRY_SAMPLE entry %r", part)
+    return rates
+
+def _dumps(row: Dict[str, Any]) -> str:
+    return json.dumps(row, ensure_ascii=False, default=str)
+
+def _otlp_value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    if isinstance(v, str):
+        return {"stringValue": v}
+    return {"stringValue": _dumps(v)}
+
+def otlp_logs(rows: List[Dict[str, Any]], service: str = "cove-ai-core") -> Dict[str, Any]:
+    """OTLP/HTTP JSON (ExportLogsServiceRequest) body: one log record per event."""
+    records = []
+    for r in rows:
+        records.append({
+            "timeUnixNano": str(int(r.get("ts", time.time()) * 1e9)),
+            "severityText": "ERROR" if r.get("status") == "error" or "error" in r else "INFO",
+            "body": {"stringValue": r.get("event", "")},
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in r.items() if k not in ("ts", "event")],
+        })
+    return {"resourceLogs": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+        "scopeLogs": [{"scope": {"name": "cove.trace"}, "logRecords": records}],
+    }]}
+
+class TelemetrySink:
+    def __init__(
+        self,
+        output: str = TELEMETRY_SINK,
+        *,
+        path: str = TELEMETRY_FILE,
+        max_queue: int = TELEMETRY_QUEUE_MAX,
+        batch: int = TELEMETRY_BATCH,
+        flush_secs: float = TELEMETRY_FLUSH_SECS,
+        sample: Optional[Dict[str, float]] = None,
+        default_rate: float = TELEMETRY_SAMPLE_DEFAULT,
+    ):
+        self.output = output
+        self.path = path
+        self.max_queue = max(1, max_queue)
+        self.batch = max(1, batch)
+        self.flush_secs = flush_secs
+        self.sample = parse_sample(TELEMETRY_SAMPLE) if sample is None else sample
+        self.default_rate = default_rate
+        self.written = 0
+        self.write_errors = 0
+        self.dropped: Counter = Counter()       # buffer full / failed batch, per event
+        self.sampled_out: Counter = Counter()   # per event
+        self._buf: Deque[Dict[str, Any]] = deque()
+        self._file: Optional[TextIO] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # --------- Request path ----------
+
+    def _rate(self, row: Dict[str, Any]) -> float:
+        event = row.get("event", "")
+        if event == "span":
+            rate = self.sample.get(f"span:{row.get('span')}")
+            if rate is not None:
+                return rate
+        return self.sample.get(event, self.default_rate)
+
+    def submit(self, row: Dict[str, Any]) -> None:
+        if self.output == "none":
+            return
+        event = row.get("event", "")
+        rate = self._rate(row)
+        if rate < 1.0 and row.get("status", "ok") == "ok" and "error" not in row and random.random() >= rate:
+            self.sampled_out[event] += 1
+            return
+        if self._task is None:
+            self._write_sync([row])
+            return
+        if len(self._buf) >= self.max_queue:
+            self.dropped[event] += 1
+            return
+        self._buf.append(row)
+        if len(self._buf) >= self.batch and self._wake is not None:
+            self._wake.set()
+
+    # --------- Writers ----------
+
+    def _write_lines(self, rows: List[Dict[str, Any]]) -> None:
+        data = "".join(_dumps(r) + "\n" for r in rows)
+        if self.output == "file":
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(data)
+            self._file.flush()
+        else:
+            sys.stdout.write(data)
+            sys.stdout.flush()
+
+    def _write_sync(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            if self.output == "otlp":
+                request_sync("otlp", "POST", "/v1/logs", json=otlp_logs(rows), retries=0).raise_for_status()
+            else:
+                self._write_lines(rows)
+            self.written += len(rows)
+        except Exception as e:
+            self._failed(rows, e)
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            if self.output == "otlp":
+                resp = await request("otlp", "POST", "/v1/logs", json=otlp_logs(rows), retries=0)
+                resp.raise_for_status()
+            else:
+                await asyncio.to_thread(self._write_lines, rows)
+            self.written += len(rows)
+        except Exception as e:
+            self._failed(rows, e)
+
+    def _failed(self, rows: List[Dict[str, Any]], exc: Exception) -> None:
+        self.write_errors += 1
+        self.dropped.update(r.get("event", "") for r in rows)
+        if self.write_errors == 1 or self.write_errors % 100 == 0:
+            log.warning("telemetry %s write failed (%d so far), %d events dropped: %s",
+                        self.output, self.write_errors, len(rows), exc)
+
+    # --------- Drain ----------
+
+    async def flush(self) -> None:
+        while self._buf:
+            n = min(self.batch, len(self._buf))
+            await self._write([self._buf.popleft() for _ in range(n)])
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_secs)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def start(self) -> None:
+        if self._task is None and self.output != "none":
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the drain task and write what is still buffered."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def prometheus(self) -> str:
+        """Sink counters for /ai/metrics (Prometheus text format)."""
+        lines = [
+            "# TYPE cove_ai_telemetry_written_total counter",
+            f"cove_ai_telemetry_written_total {self.written}",
+            "# TYPE cove_ai_telemetry_write_errors_total counter",
+            f"cove_ai_telemetry_write_errors_total {self.write_errors}",
+            "# TYPE cove_ai_telemetry_queued gauge",
+            f"cove_ai_telemetry_queued {len(self._buf)}",
+            "# TYPE cove_ai_telemetry_dropped_total counter",
+            *(f'cove_ai_telemetry_dropped_total{{event="{e}"}} {n}' for e, n in sorted(self.dropped.items())),
+            "# TYPE cove_ai_telemetry_sampled_out_total counter",
+            *(f'cove_ai_telemetry_sampled_out_total{{event="{e}"}} {n}' for e, n in sorted(self.sampled_out.items())),
+        ]
+        return "\n".join(lines) + "\n"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "output": self.output,
+            "running": self._task is not None,
+            "queued": len(self._buf),
+            "max_queue": self.max_queue,
+            "written": self.written,
+            "write_errors": self.write_errors,
+            "dropped": dict(self.dropped),
+            "sampled_out": dict(self.sampled_out),
+        }
+
+sink = TelemetrySink()
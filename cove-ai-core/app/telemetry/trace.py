@@ -1,7 +1,11 @@
 # app/telemetry/trace.py
 from __future__ import annotations
-import os, json, time, uuid
-from typing import Any, Dict
+import os, time, uuid, asyncio
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from app.telemetry.metrics import metrics
+from app.telemetry.sink import sink
 
 TRACE_ENABLED = os.getenv("TRACE", "true").lower() == "true"
 
@@ -9,6 +13,7 @@ def new_trace_id() -> str:
     return uuid.uuid4().hex[:16]
 
 def emit(event: str, trace_id: str, payload: Dict[str, Any]) -> None:
+    """Queue one event; serialization and output happen off the request path (app/telemetry/sink.py)."""
     if not TRACE_ENABLED:
         return
     row = {
@@ -17,4 +22,28 @@ def emit(event: str, trace_id: str, payload: Dict[str, Any]) -> None:
         "trace_id": trace_id,
         **payload
     }
-    print(json.dumps(row, ensure_ascii=False), flush=True)
+    sink.submit(row)
+
+@contextmanager
+def span(name: str, trace_id: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time a block and emit one "span" event with its duration and status.
+    The yielded dict is the event payload; callers may set "status" or add fields.
+    The duration also goes to the `name` histogram behind /ai/metrics.
+    """
+    rec: Dict[str, Any] = {"span": name, "status": "ok", **attrs}
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    except asyncio.CancelledError:
+        rec["status"] = "cancelled"
+        raise
+    except BaseException:
+        if rec["status"] == "ok":
+            rec["status"] = "error"
+        raise
+    finally:
+        secs = time.perf_counter() - t0
+        rec["ms"] = round(secs * 1000, 2)
+        metrics.observe(name, secs, rec["status"])
+        emit("span", trace_id, rec)
@@ -0,0 +1,84 @@
+# app/vector/ann_index.py
+from __future__ import annotations
+import argparse
+import math
+from typing import List
+
+import psycopg
+from psycopg import sql
+
+from app.vector.store import connect
+
+# Partial ANN indexes on ai_core.docs.embedding, one per `kind`.
+#   python -m app.vector.ann_index                      # HNSW for every kind present
+#   python -m app.vector.ann_index --kind product --method ivfflat --lists 100
+
+def index_name(kind: str, method: str) -> str:
+    return f"idx_ai_docs_emb_{method}_{kind}"
+
+def list_kinds(conn: psycopg.Connection) -> List[str]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT DISTINCT kind FROM ai_core.docs WHERE embedding IS NOT NULL ORDER BY 1")
+        return [r[0] for r in cur.fetchall()]
+
+def count_rows(conn: psycopg.Connection, kind: str) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM ai_core.docs WHERE kind = %s AND embedding IS NOT NULL", (kind,))
+        return int(cur.fetchone()[0])
+
+def create_index(
+    conn: psycopg.Connection,
+    kind: str,
+    *,
+    method: str = "hnsw",
+    m: int = 16,
+    ef_construction: int = 64,
+    lists: int | None = None,
+    replace: bool = False,
+) -> str:
+    """
+    Build (CONCURRENTLY) a partial cosine index for one kind. IVFFlat needs data
+    to train on; `lists` defaults to rows/1000 (min 1), or sqrt(rows) past 1M.
+    Requires an autocommit connection (store.connect() is).
+    """
+    name = index_name(kind, method)
+    if method == "hnsw":
+        opts = sql.SQL("WITH (m = {}, ef_construction = {})").format(sql.Literal(m), sql.Literal(ef_construction))
+    elif method == "ivfflat":
+        if lists is None:
+            n = count_rows(conn, kind)
+            lists = max(1, int(math.sqrt(n)) if n > 1_000_000 else n // 1000)
+        opts = sql.SQL("WITH (lists = {})").format(sql.Literal(lists))
+    else:
+        raise ValueError(f"Unsupported ANN method: {method}")
+
+    with conn.cursor() as cur:
+        if replace:
+            cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS ai_core.{}").format(sql.Identifier(name)))
+        cur.execute(
+            sql.SQL(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON ai_core.docs "
+                "USING {} (embedding vector_cosine_ops) {} WHERE kind = {}"
+            ).format(sql.Identifier(name), sql.SQL(method), opts, sql.Literal(kind))
+        )
+        cur.execute("ANALYZE ai_core.docs")
+    return name
+
+def main():
+    parser = argparse.ArgumentParser(description="Cove AI — build per-kind ANN indexes on ai_core.docs.embedding")
+    parser.add_argument("--kind", action="append", help="kind to index (repeatable); default: all kinds with embeddings")
+    parser.add_argument("--method", choices=("hnsw", "ivfflat"), default="hnsw")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--replace", action="store_true", help="drop and rebuild an existing index")
+    args = parser.parse_args()
+
+    conn = connect()
+    for kind in (args.kind or list_kinds(conn)):
+        name = create_index(conn, kind, method=args.method, m=args.m,
+                            ef_construction=args.ef_construction, lists=args.lists, replace=args.replace)
+        print(f"[ann] {kind}: {name}", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,289 @@
 # app/vector/backfill_embeddings.py
 from __future__ import annotations
-import os
-import sys
-import math
-from typing import List, Tuple
+import argparse, asyncio, logging, random, time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import httpx
 import psycopg
-from psycopg.rows import tuple_row
-
-from app.vector.store import connect, _embed_sync  # uses your existing sync embedder
-
-BATCH = 64
-
-def fetch_batch(conn: psycopg.Connection) -> List[Tuple[str, str]]:
-    with conn.cursor(row_factory=tuple_row) as cur:
-        cur.execute(
-            """
-            SELECT id, coalesce(text, '') AS text
-            FROM ai_core.docs
-            WHERE kind = 'product' AND embedding IS NULL
-            LIMIT %s
-            """,
-            (BATCH,),
-        )
-        return cur.fetchall()
-
-def update_embeddings(conn: psycopg.Connection, rows: List[Tuple[str, List[float]]]) -> None:
-    with conn.cursor() as cur:
-        for _id, emb in rows:
-            cur.execute(
-                "UPDATE ai_core.docs SET embedding = %s WHERE id = %s",
-                (emb, _id),
-            )
+from psycopg import sql
+from pgvector.psycopg import register_vector_async
+
+from app.core.config import (
+    PG_DSN, BACKFILL_CONCURRENCY, BACKFILL_BATCH_SIZE, BACKFILL_BATCH_TOKENS,
+    BACKFILL_RETRIES, BACKFILL_WRITE_ROWS,
+)
+from app.core.http import close_clients
+from app.providers.embed import embed
+from app.vector.bulk import copy_rows_async
+
+log = logging.getLogger("cove.backfill")
+
+# Async backfill pipeline:
+#
+#   reader (keyset pages) -> token-aware batches -> N embed workers -> writer
+#
+# At most `concurrency` provider calls are in flight; the queues between the
+# stages are bounded so the reader never runs far ahead. The writer stages
+# vectors with a binary COPY into a temp table and applies each chunk with
+# one UPDATE ... FROM, on its own connection.
+
+_PAGE = 2000
+_CHARS_PER_TOKEN = 4           # rough estimate for English catalog copy
+_MAX_TEXT_CHARS = 24000        # keeps one input well under the 8191-token provider limit
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_STAGE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS backfill_stage (id uuid PRIMARY KEY, embedding vector)
+    ON COMMIT DELETE ROWS
+"""
+
+_APPLY_SQL = """
+    UPDATE ai_core.docs d SET embedding = s.embedding
+    FROM backfill_stage s WHERE d.id = s.id
+"""
+
+Row = Tuple[Any, str]   # (id, text); ids are uuids from the DB, indices in embed_many
+
+@dataclass
+class BackfillStats:
+    selected: int = 0
+    embedded: int = 0
+    written: int = 0
+    failed: int = 0
+    batches: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def line(self) -> str:
+        secs = time.monotonic() - self.started
+        rate = self.written / secs if secs > 0 else 0.0
+        return (f"selected={self.selected} embedded={self.embedded} written={self.written} "
+                f"failed={self.failed} batches={self.batches} ({rate:.0f} rows/s)")
+
+# --------- Reader ----------
+
+def _select_sql(kind: Optional[str], reembed: bool) -> sql.Composed:
+    where = [sql.SQL("id > %(after)s")]
+    if not reembed:
+        where.append(sql.SQL("embedding IS NULL"))
+    if kind:
+        where.append(sql.SQL("kind = %(kind)s"))
+    return sql.SQL(
+        "SELECT id, coalesce(text, '') FROM ai_core.docs WHERE {} ORDER BY id LIMIT %(page)s"
+    ).format(sql.SQL(" AND ").join(where))
+
+async def _rows(conn: psycopg.AsyncConnection, *, kind: Optional[str], reembed: bool,
+                limit: Optional[int]) -> AsyncIterator[Row]:
+    """Keyset pagination by id: rows that keep failing are never re-read in the same run."""
+    query = _select_sql(kind, reembed)
+    after, seen = UUID(int=0), 0
+    while limit is None or seen < limit:
+        page = _PAGE if limit is None else min(_PAGE, limit - seen)
+        async with conn.cursor() as cur:
+            await cur.execute(query, {"after": after, "kind": kind, "page": page})
+            rows = await cur.fetchall()
+        if not rows:
+            return
+        for rid, text in rows:
+            yield rid, text
+        seen += len(rows)
+        after = rows[-1][0]
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+async def _batches(rows: AsyncIterator[Row], *, max_items: int, max_tokens: int) -> AsyncIterator[List[Row]]:
+    """Group rows so each provider call stays under both the item and the token budget."""
+    batch: List[Row] = []
+    tokens = 0
+    async for rid, text in rows:
+        text = text[:_MAX_TEXT_CHARS]
+        t = _estimate_tokens(text)
+        if batch and (len(batch) >= max_items or tokens + t > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append((rid, text))
+        tokens += t
+    if batch:
+        yield batch
+
+# --------- Provider calls ----------
+
+def _retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.TransportError):
+        return True
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code in _RETRY_STATUS
+
+def _retry_delay(attempt: int, exc: BaseException) -> float:
+    resp = getattr(exc, "response", None)
+    ra = resp.headers.get("retry-after", "") if resp is not None else ""
+    if ra.replace(".", "", 1).isdigit():
+        return min(float(ra), 60.0)
+    # exponential with jitter so concurrent workers don't retry in lockstep
+    return min(2.0 ** attempt, 30.0) * random.uniform(0.5, 1.0)
+
+async def embed_with_backoff(texts: List[str], *, retries: int = BACKFILL_RETRIES) -> List[List[float]]:
+    for attempt in range(retries + 1):
+        try:
+            return await embed(texts, retries=0)
+        except Exception as e:
+            if attempt >= retries or not _retryable(e):
+                raise
+            delay = _retry_delay(attempt, e)
+            log.warning("embed batch of %d failed (%s); retry %d/%d in %.1fs",
+                        len(texts), e, attempt + 1, retries, delay)
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
+
+async def embed_many(
+    texts: Sequence[str],
+    *,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    batch_tokens: int = BACKFILL_BATCH_TOKENS,
+) -> List[List[float]]:
+    """Embed `texts` (order kept) with the backfill's batching, concurrency and retries."""
+    async def numbered() -> AsyncIterator[Row]:
+        for i, t in enumerate(texts):
+            yield i, t or ""
+
+    out: List[Any] = [None] * len(texts)
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(batch: List[Row]) -> None:
+        async with sem:
+            vecs = await embed_with_backoff([t for _, t in batch])
+        for (i, _), vec in zip(batch, vecs):
+            out[i] = vec
+
+    batches = [b async for b in _batches(numbered(), max_items=batch_size, max_tokens=batch_tokens)]
+    await asyncio.gather(*(one(b) for b in batches))
+    return out
+
+def embed_many_sync(texts: Sequence[str], **kwargs) -> List[List[float]]:
+    """`embed_many` for the sync CLIs (seed/ingest), on one event loop."""
+    async def run() -> List[List[float]]:
+        try:
+            return await embed_many(texts, **kwargs)
+        finally:
+            await close_clients()  # the shared clients are bound to this loop
+    return asyncio.run(run())
+
+# --------- Writer ----------
+
+async def write_embeddings(conn: psycopg.AsyncConnection, rows: List[Tuple[UUID, List[float]]]) -> int:
+    """Binary COPY into the temp stage, then one UPDATE ... FROM, in one transaction."""
+    if not rows:
+        return 0
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            await cur.execute(_STAGE_SQL)
+            await copy_rows_async(cur, "backfill_stage", ("id", "embedding"), ("uuid", "vector"), rows)
+            await cur.execute(_APPLY_SQL)
+            return cur.rowcount
+
+async def _connect() -> psycopg.AsyncConnection:
+    conn = await psycopg.AsyncConnection.connect(PG_DSN, autocommit=True)
+    await register_vector_async(conn)
+    return conn
+
+# --------- Pipeline ----------
+
+async def backfill(
+    *,
+    kind: Optional[str] = None,
+    reembed: bool = False,
+    limit: Optional[int] = None,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    batch_tokens: int = BACKFILL_BATCH_TOKENS,
+    write_rows: int = BACKFILL_WRITE_ROWS,
+    progress: bool = False,
+) -> BackfillStats:
+    """
+    Embed rows with NULL embeddings (or every row with `reembed=True`, e.g.
+    after an EMBED_MODEL change). Batches that still fail after retries are
+    logged and skipped; their rows are picked up by the next run.
+    """
+    stats = BackfillStats()
+    concurrency = max(1, concurrency)
+    embed_q: "asyncio.Queue[Optional[List[Row]]]" = asyncio.Queue(maxsize=concurrency * 2)
+    write_q: "asyncio.Queue[Optional[List[Tuple[UUID, List[float]]]]]" = asyncio.Queue(maxsize=concurrency * 2)
+
+    rconn, wconn = await _connect(), await _connect()
+
+    async def produce() -> None:
+        rows = _rows(rconn, kind=kind, reembed=reembed, limit=limit)
+        async for batch in _batches(rows, max_items=batch_size, max_tokens=batch_tokens):
+            stats.selected += len(batch)
+            await embed_q.put(batch)
+        for _ in range(concurrency):
+            await embed_q.put(None)
+
+    async def work() -> None:
+        while (batch := await embed_q.get()) is not None:
+            try:
+                vecs = await embed_with_backoff([t for _, t in batch])
+            except Exception as e:
+                stats.failed += len(batch)
+                log.error("embed batch of %d skipped: %s", len(batch), e)
+                continue
+            stats.embedded += len(batch)
+            stats.batches += 1
+            await write_q.put([(rid, vec) for (rid, _), vec in zip(batch, vecs)])
+        await write_q.put(None)
+
+    async def write() -> None:
+        pending: List[Tuple[UUID, List[float]]] = []
+        running = concurrency
+        while running:
+            item = await write_q.get()
+            if item is None:
+                running -= 1
+            else:
+                pending.extend(item)
+            if pending and (len(pending) >= write_rows or not running):
+                stats.written += await write_embeddings(wconn, pending)
+                pending = []
+                if progress:
+                    print(f"[backfill] {stats.line()}", flush=True)
+
+    tasks = [asyncio.create_task(produce()), asyncio.create_task(write())]
+    tasks += [asyncio.create_task(work()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        await rconn.close()
+        await wconn.close()
+    return stats
+
+def backfill_sync(**kwargs) -> BackfillStats:
+    """Run the pipeline from sync code (CLI/ingest) on one event loop."""
+    async def run() -> BackfillStats:
+        try:
+            return await backfill(**kwargs)
+        finally:
+            await close_clients()  # the shared clients are bound to this loop
+    return asyncio.run(run())
 
 def main():
-    conn = connect()
-    total = 0
-    while True:
-        batch = fetch_batch(conn)
-        if not batch:
-            break
-        texts = [t for (_id, t) in batch]
-        embs = _embed_sync(texts)  # same model/dim as your table (1536)
-        to_update = [(batch[i][0], embs[i]) for i in range(len(batch))]
-        update_embeddings(conn, to_update)
-        total += len(batch)
-        print(f"updated {total} embeddings...", flush=True)
-    print("done", flush=True)
+    parser = argparse.ArgumentParser(description="Cove AI — embed ai_core.docs rows (NULL embeddings by default)")
+    parser.add_argument("--kind", default="product", help="kind to embed; pass '' for every kind")
+    parser.add_argument("--all", action="store_true", help="re-embed every row, e.g. after an EMBED_MODEL change")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = backfill_sync(kind=args.kind or None, reembed=args.all, limit=args.limit,
+                          concurrency=args.concurrency, progress=True)
+    print(f"[backfill] done: {stats.line()}", flush=True)
 
 if __name__ == "__main__":
     main()
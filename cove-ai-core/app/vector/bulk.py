@@ -0,0 +1,90 @@
+# app/vector/bulk.py
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import psycopg
+from psycopg.types.json import Jsonb
+
+if TYPE_CHECKING:
+    from app.vector.incremental import DocRow
+
+# Bulk writes to ai_core.docs. Rows (pgvector embeddings included) stream
+# through one binary COPY into a temp stage table and are merged with one
+# statement. The connection must have pgvector registered (store.connect()
+# and the pool both do) so `vector` has a binary dumper.
+
+def copy_rows(cur: psycopg.Cursor, table: str, columns: Sequence[str], types: Sequence[str],
+              rows: Iterable[Sequence[Any]]) -> None:
+    stmt = f"COPY {table} ({', '.join(columns)}) FROM STDIN (FORMAT BINARY)"
+    with cur.copy(stmt) as copy:
+        copy.set_types(list(types))
+        for row in rows:
+            copy.write_row(row)
+
+async def copy_rows_async(cur: psycopg.AsyncCursor, table: str, columns: Sequence[str], types: Sequence[str],
+                          rows: Iterable[Sequence[Any]]) -> None:
+    stmt = f"COPY {table} ({', '.join(columns)}) FROM STDIN (FORMAT BINARY)"
+    async with cur.copy(stmt) as copy:
+        copy.set_types(list(types))
+        for row in rows:
+            await copy.write_row(row)
+
+# --------- Documents ----------
+
+_DOC_COLUMNS = ("id", "kind", "title", "text", "url", "meta", "content_hash", "embedding")
+_DOC_TYPES = ("uuid", "text", "text", "text", "text", "jsonb", "text", "vector")
+
+# ON COMMIT DROP + TRUNCATE: fresh per transaction, and safe to reuse when the
+# caller writes several batches inside one outer transaction.
+_DOC_STAGE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS docs_stage (
+      id uuid, kind text, title text, text text, url text, meta jsonb,
+      content_hash text, embedding vector
+    ) ON COMMIT DROP
+"""
+
+# A supplied embedding always wins; otherwise the stored one is kept unless
+# the text changed, in which case it is cleared for the backfill.
+_DOC_MERGE_SQL = """
+    INSERT INTO ai_core.docs AS d (id, kind, title, text, url, meta, content_hash, embedding, source)
+    SELECT id, kind, title, text, url, meta, content_hash, embedding, %(source)s::text FROM docs_stage
+    ON CONFLICT (id) DO UPDATE SET
+      kind = EXCLUDED.kind, title = EXCLUDED.title, text = EXCLUDED.text,
+      url = EXCLUDED.url, meta = EXCLUDED.meta,
+      content_hash = EXCLUDED.content_hash, source = COALESCE(EXCLUDED.source, d.source),
+      embedding = CASE
+        WHEN EXCLUDED.embedding IS NOT NULL THEN EXCLUDED.embedding
+        WHEN d.text IS DISTINCT FROM EXCLUDED.text THEN NULL
+        ELSE d.embedding
+      END
+    RETURNING (xmax = 0) AS inserted, (embedding IS NULL) AS needs_embedding
+"""
+
+def write_docs(
+    conn: psycopg.Connection,
+    rows: Sequence["DocRow"],
+    *,
+    source: Optional[str] = None,
+    embeddings: Optional[Dict[UUID, Any]] = None,
+) -> List[Tuple[bool, bool]]:
+    """
+    Upsert `rows` into ai_core.docs in one COPY + one merge, in a transaction.
+    `embeddings` maps row id -> vector for rows embedded by the caller.
+    `source` (when given) marks the rows as owned by that loader.
+    Returns (inserted, needs_embedding) per written row.
+    """
+    if not rows:
+        return []
+    embeddings = embeddings or {}
+    with conn.transaction():
+        with conn.cursor() as cur:
+            cur.execute(_DOC_STAGE_SQL)
+            cur.execute("TRUNCATE docs_stage")
+            copy_rows(
+                cur, "docs_stage", _DOC_COLUMNS, _DOC_TYPES,
+                ((r.id, r.kind, r.title, r.text, r.url, Jsonb(r.meta), r.hash, embeddings.get(r.id))
+                 for r in rows),
+            )
+            cur.execute(_DOC_MERGE_SQL, {"source": source})
+            return [(bool(ins), bool(ne)) for ins, ne in cur.fetchall()]
@@ -0,0 +1,303 @@
+# app/vector/cdc.py
+from __future__ import annotations
+import argparse, asyncio, logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import psycopg
+from psycopg.types.json import Jsonb
+
+from app.core.config import PG_DSN, CATALOG_CDC_BATCH, CATALOG_CDC_POLL_SECS
+from app.vector.vocab import CATALOG_CHANNEL
+
+log = logging.getLogger("cove.cdc")
+
+# Catalog change-data-capture: Django catalog tables -> ai_core.docs.meta.
+#
+# Triggers on the catalog tables (migrations/2026-10-18__catalog_cdc.sql) append
+# the affected product to ai_core.catalog_outbox and NOTIFY CDC_CHANNEL in the
+# writer's transaction. `consume_catalog_changes` (app lifespan) wakes on the
+# NOTIFY, claims outbox rows with SKIP LOCKED (safe with several workers), reads
+# the products' current state and patches the meta of their product docs:
+#
+#   product rows (seed: meta.colors/sizes)   price, sizes, colors[] (+ per-color sizes), attrs
+#   variant rows (ingest: meta.variantId)    price, stock, sizes, color, hex, images
+#
+# text, url and embedding are never written, so a stock or price change costs
+# one UPDATE and no embedding call; name/description edits still go through
+# ingest/seed. Docs of products deleted from the catalog are deleted. Claim and
+# patch share one transaction: a failed batch stays in the outbox.
+
+CDC_CHANNEL = "ai_core_catalog_cdc"
+_DEBOUNCE_SECS = 0.2   # fold a burst of commits (checkout, admin bulk edit) into one batch
+
+_CLAIM_SQL = """
+    DELETE FROM ai_core.catalog_outbox
+    WHERE id IN (
+      SELECT id FROM ai_core.catalog_outbox ORDER BY id LIMIT %(n)s FOR UPDATE SKIP LOCKED
+    )
+    RETURNING product_id, slug
+"""
+
+_STATE_SQL = """
+    SELECT p.product_id, p.slug, p.tier, p.type, p.material, p.gender, p.fit, p.base_price,
+           c.variant_id, c.color_name, c.hex, c.slug,
+           ARRAY(SELECT i.image_name FROM catalog_productimage i
+                 WHERE i.variant_id = c.variant_id ORDER BY i.image_name),
+           (SELECT coalesce(jsonb_agg(jsonb_build_array(s.size, s.quantity, s.price) ORDER BY s.id), '[]')
+              FROM catalog_sizestockprice s WHERE s.variant_id = c.variant_id)
+    FROM catalog_productmastergroup p
+    LEFT JOIN catalog_colorgroup c ON c.product_id = p.product_id
+    WHERE p.product_id = ANY(%(pids)s)
+    ORDER BY p.product_id, c.variant_id
+"""
+
+# product_attrs carries slug + variant_id for every product doc (trigger-maintained)
+_DOCS_SQL = """
+    SELECT d.id, d.meta, a.slug FROM ai_core.docs d
+    JOIN (
+      SELECT DISTINCT product_doc_id, slug FROM ai_core.product_attrs
+      WHERE slug = ANY(%(slugs)s) OR variant_id = ANY(%(vids)s)
+    ) a ON a.product_doc_id = d.id
+    WHERE d.kind = 'product'
+"""
+
+_PATCH_SQL = """
+    UPDATE ai_core.docs d SET meta = v.meta
+    FROM unnest(%(ids)s::uuid[], %(metas)s::jsonb[]) AS v(id, meta)
+    WHERE d.id = v.id
+"""
+
+_DELETE_SQL = "DELETE FROM ai_core.docs WHERE id = ANY(%(ids)s::uuid[])"
+
+@dataclass
+class CdcStats:
+    events: int = 0
+    products: int = 0
+    patched: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.patched or self.deleted)
+
+# --------- Catalog state ----------
+
+def _num(v: Any) -> Optional[float]:
+    try:
+        return None if v is None else float(v)
+    except (TypeError, ValueError):
+        return None
+
+def _load_state(rows: Iterable[Tuple]) -> Dict[str, Dict[str, Any]]:
+    """Fold _STATE_SQL rows into {product_id: {..., "variants": {variant_id: {...}}}}."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for (pid, slug, tier, typ, material, gender, fit, base_price,
+         vid, color, hex_, vslug, images, sizes) in rows:
+        p = out.setdefault(pid, {
+            "product_id": pid, "slug": slug, "tier": tier, "type": typ, "material": material,
+            "gender": gender, "fit": fit, "price": _num(base_price), "variants": {},
+        })
+        if vid is None:
+            continue
+        stock: Dict[str, int] = {}
+        prices: List[float] = []
+        for size, qty, price in sizes or []:
+            stock[size] = int(qty or 0)
+            if _num(price) is not None:
+                prices.append(_num(price))
+        p["variants"][vid] = {
+            "colorName": color, "hex": hex_, "slug": vslug, "images": list(images or []),
+            "sizes": stock, "price": min(prices) if prices else p["price"],
+        }
+    return out
+
+# --------- Meta patches ----------
+
+def _product_meta(meta: Dict[str, Any], p: Dict[str, Any]) -> Dict[str, Any]:
+    """Product-level doc: colors[] from the variants, sizes summed across them."""
+    variants = p["variants"]
+    colors: List[Dict[str, Any]] = []
+    seen: Set[str] = set()
+    for c in meta.get("colors") or []:
+        vid = c.get("variantId") if isinstance(c, dict) else None
+        if vid in variants:  # keep the doc's color order and any extra keys
+            v = variants[vid]
+            colors.append({**c, "colorName": v["colorName"], "hex": v["hex"], "images": v["images"],
+                           "sizes": v["sizes"]})
+            seen.add(vid)
+    for vid, v in variants.items():
+        if vid not in seen:
+            colors.append({"colorName": v["colorName"], "hex": v["hex"], "variantId": vid,
+                           "images": v["images"], "slug": v["slug"], "sizes": v["sizes"]})
+
+    sizes: Dict[str, int] = {}
+    for v in variants.values():
+        for size, qty in v["sizes"].items():
+            sizes[size] = sizes.get(size, 0) + qty
+
+    prices = [v["price"] for v in variants.values() if v["price"] is not None]
+    out = dict(meta)
+    out.update({k: p[k] for k in ("tier", "type", "material", "gender", "fit")})
+    out.update(colors=colors, sizes=sizes, price=min(prices) if prices else p["price"])
+    return out
+
+def _variant_meta(meta: Dict[str, Any], v: Dict[str, Any]) -> Dict[str, Any]:
+    """Variant-level doc (ingest): one color's price/stock/sizes."""
+    out = dict(meta)
+    out.update(color=v["colorName"], hex=v["hex"], images=v["images"], price=v["price"],
+               stock=sum(v["sizes"].values()), sizes=v["sizes"])
+    return out
+
+def plan_patches(
+    docs: Iterable[Tuple[Any, Dict[str, Any], Optional[str]]],
+    state: Dict[str, Dict[str, Any]],
+    claimed: Set[str],
+) -> Tuple[List[Tuple[Any, Dict[str, Any]]], List[Any], int]:
+    """
+    Decide per doc (id, meta, slug): patch its meta, delete it (its product or
+    variant is gone from the catalog), or leave it. Returns (patches, deletes, unchanged).
+    """
+    by_slug = {p["slug"]: p for p in state.values()}
+    by_vid = {vid: p for p in state.values() for vid in p["variants"]}
+    patches: List[Tuple[Any, Dict[str, Any]]] = []
+    deletes: List[Any] = []
+    unchanged = 0
+    done: Set[Any] = set()
+
+    for did, meta, slug in docs:
+        if did in done:
+            continue
+        done.add(did)
+        meta = meta if isinstance(meta, dict) else {}
+        vid = meta.get("variantId")
+        pid = meta.get("id") or meta.get("product_id")
+        p = by_vid.get(vid) if vid else None
+        p = p or state.get(pid) or by_slug.get(slug)
+
+        if p is None:
+            # only act on products this batch was told about; anything else is not ours to judge
+            if pid in claimed:
+                deletes.append(did)
+            continue
+        if vid:
+            if vid not in p["variants"]:
+                deletes.append(did)
+                continue
+            new = _variant_meta(meta, p["variants"][vid])
+        else:
+            new = _product_meta(meta, p)
+
+        if new == meta:
+            unchanged += 1
+        else:
+            patches.append((did, new))
+    return patches, deletes, unchanged
+
+# --------- Consumer ----------
+
+async def apply_batch(conn: psycopg.AsyncConnection, limit: int = CATALOG_CDC_BATCH) -> CdcStats:
+    """Claim up to `limit` outbox rows and patch the affected docs, in one transaction."""
+    stats = CdcStats()
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            await cur.execute(_CLAIM_SQL, {"n": limit})
+            events = await cur.fetchall()
+            stats.events = len(events)
+            if not events:
+                return stats
+            pids = sorted({pid for pid, _ in events})
+            stats.products = len(pids)
+
+            await cur.execute(_STATE_SQL, {"pids": pids})
+            state = _load_state(await cur.fetchall())
+
+            slugs = {s for _, s in events if s} | {p["slug"] for p in state.values()}
+            vids = [vid for p in state.values() for vid in p["variants"]]
+            await cur.execute(_DOCS_SQL, {"slugs": sorted(slugs), "vids": vids})
+            docs = await cur.fetchall()
+
+            patches, deletes, stats.unchanged = plan_patches(docs, state, set(pids))
+            if patches:
+                await cur.execute(_PATCH_SQL, {"ids": [d for d, _ in patches],
+                                               "metas": [Jsonb(m) for _, m in patches]})
+                stats.patched = cur.rowcount
+            if deletes:
+                await cur.execute(_DELETE_SQL, {"ids": deletes})
+                stats.deleted = cur.rowcount
+            if stats.changed:
+                # every worker (this one included) drops vocab + cached answers
+                await cur.execute("SELECT pg_notify(%s, %s)", (CATALOG_CHANNEL, "cdc"))
+    return stats
+
+async def drain(conn: psycopg.AsyncConnection, limit: int = CATALOG_CDC_BATCH) -> CdcStats:
+    """Apply batches until the outbox is empty (or left to other workers)."""
+    total = CdcStats()
+    while True:
+        s = await apply_batch(conn, limit)
+        for f in ("events", "products", "patched", "unchanged", "deleted"):
+            setattr(total, f, getattr(total, f) + getattr(s, f))
+        if s.events < limit:
+            return total
+
+async def _installed(conn: psycopg.AsyncConnection) -> bool:
+    cur = await conn.execute("SELECT to_regclass('ai_core.catalog_outbox') IS NOT NULL")
+    row = await cur.fetchone()
+    return bool(row and row[0])
+
+async def consume_catalog_changes(poll_secs: float = CATALOG_CDC_POLL_SECS) -> None:
+    """
+    Long-running task (app lifespan). Drains on every CDC NOTIFY, and every
+    `poll_secs` regardless, so a missed notification (listener reconnect)
+    delays a change rather than losing it.
+    """
+    while True:
+        try:
+            conn = await psycopg.AsyncConnection.connect(PG_DSN, autocommit=True)
+            async with conn:
+                if not await _installed(conn):
+                    log.info("ai_core.catalog_outbox not found; catalog CDC disabled")
+                    return
+                await conn.execute(f"LISTEN {CDC_CHANNEL}")
+                while True:
+                    stats = await drain(conn)
+                    if stats.events:
+                        log.info("cdc: %d events, %d products -> %d patched, %d deleted, %d unchanged",
+                                 stats.events, stats.products, stats.patched, stats.deleted, stats.unchanged)
+                    async for _ in conn.notifies(timeout=poll_secs, stop_after=1):
+                        pass
+                    await asyncio.sleep(_DEBOUNCE_SECS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("catalog CDC consumer reconnecting: %s", e)
+            await asyncio.sleep(5)
+
+# --------- CLI ----------
+
+_ENQUEUE_ALL_SQL = """
+    INSERT INTO ai_core.catalog_outbox (product_id, slug)
+    SELECT product_id, slug FROM catalog_productmastergroup
+"""
+
+async def _run(enqueue_all: bool) -> CdcStats:
+    conn = await psycopg.AsyncConnection.connect(PG_DSN, autocommit=True)
+    async with conn:
+        if enqueue_all:
+            await conn.execute(_ENQUEUE_ALL_SQL)
+        return await drain(conn)
+
+def main():
+    parser = argparse.ArgumentParser(description="Cove AI — apply pending catalog changes to ai_core.docs")
+    parser.add_argument("--all", action="store_true",
+                        help="resync every catalog product (e.g. right after installing the CDC migration)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    s = asyncio.run(_run(args.all))
+    print(f"[cdc] events={s.events} products={s.products} patched={s.patched} "
+          f"deleted={s.deleted} unchanged={s.unchanged}", flush=True)
+
+if __name__ == "__main__":
+    main()
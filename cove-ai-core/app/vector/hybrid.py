@@ -1,10 +1,16 @@
 # app/vector/hybrid.py
 from __future__ import annotations
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import asyncio, os
 import psycopg
 from psycopg.rows import dict_row
 
+from app.core.rerank import mmr_select, token_matrix
+from app.providers.embed import embed_query as embed_query_async, cached_query_embedding
+from app.telemetry.metrics import timed, timer
+
 # ---- Types ----
 @dataclass
 class Hit:
@@ -18,6 +24,7 @@ class Hit:
     score_bm25: float = 0.0
     score_attr: float = 0.0     # NEW
     score_final: float = 0.0
+    embedding: Optional[Any] = None   # stored vector (numpy) when requested
 
 # ---- Weights ----
 W_DENSE = 0.45
@@ -34,33 +41,16 @@ def _min_max_norm(values: List[float]) -> List[float]:
     return [(v - lo) / (hi - lo) for v in values]
 
 def _mmr(items: List[Hit], k: int, lambda_diversity: float = 0.75) -> List[Hit]:
+    # relevance = blended score, redundancy = token-set cosine of doc texts
     if not items:
         return []
-    selected: List[Hit] = []
-    candidates = items[:]
-
-    def text_sim(a: str, b: str) -> float:
-        at = set(a.split())
-        bt = set(b.split())
-        if not at or not bt:
-            return 0.0
-        inter = len(at & bt)
-        denom = (len(at) * len(bt)) ** 0.5
-        return inter / (denom + 1e-9)
-
-    while candidates and len(selected) < k:
-        best = None
-        best_score = -1e9
-        for c in candidates:
-            relevance = c.score_final
-            redundancy = max((text_sim(c.text, s.text) for s in selected), default=0.0)
-            score = lambda_diversity * relevance - (1 - lambda_diversity) * redundancy
-            if score > best_score:
-                best_score = score
-                best = c
-        selected.append(best)
-        candidates.remove(best)
-    return selected
+    order = mmr_select(
+        [it.score_final for it in items],
+        token_matrix([it.text for it in items]),
+        k,
+        lambda_diversity,
+    )
+    return [items[i] for i in order]
 
 def _attr_overlap(
     meta: Dict[str, Any],
@@ -109,55 +99,189 @@ def _attr_overlap(
         return 0.0
     return sum(scores) / len(scores)
 
-def hybrid_search(
-    conn: psycopg.Connection,
-    query: str,
-    index_name: str,   # interpreted as `kind`
-    k: int = 24,
-    k_rerank: int = 6,
-    *,
-    attrs: Optional[Dict[str, List[str]]] = None,  # NEW (colors/sizes)
-) -> List[Hit]:
+# ---- Structured pre-filters (type/tier/color/size) ----
+# Pushed into every candidate query so filtered requests rank among matching
+# rows instead of discarding most of a fixed top-k afterwards.
+# A row that does not carry an attribute passes its predicate, so callers keep
+# their Python filter as the final word. Color and size go through
+# ai_core.product_attrs (trigger-maintained, color lowercased): a doc without
+# colors/sizes has a NULL there, and both branches of each OR are plain btree
+# lookups (idx_product_attrs_color, idx_product_attrs_size_upper). Matching is
+# case-insensitive, like the Python filter in recs; a variant-level row
+# matches on its own color.
+_FILTER_SQL = {
+    "type":  "COALESCE(lower(meta->>'type'), '') IN ('', %(f_type)s)",
+    "tier":  "COALESCE(lower(meta->>'tier'), '') IN ('', %(f_tier)s)",
+    "color": "id IN (SELECT product_doc_id FROM ai_core.product_attrs"
+             " WHERE color = %(f_color)s OR color IS NULL)",
+    "size":  "id IN (SELECT product_doc_id FROM ai_core.product_attrs"
+             " WHERE upper(size) = %(f_size)s OR size IS NULL)",
+}
+
+def filter_clause(filters: Optional[Dict[str, Optional[str]]]) -> Tuple[str, Dict[str, Any]]:
     """
-    1) Dense top-k (pgvector)
-    2) BM25 top-k on tsv
-    3) Optional attribute boost (colors/sizes) from meta
-    4) Normalize, blend, MMR → k_rerank
+    ("\n AND ...", params) for the non-empty keys of `filters`
+    ({type, tier, color, size}); ("", {}) when nothing is filtered.
     """
-    from app.vector.store import embed_query  # sync helper
-    q_emb = embed_query(query)
+    if not filters:
+        return "", {}
+    preds: List[str] = []
+    params: Dict[str, Any] = {}
+    for name in ("type", "tier", "color", "size"):
+        value = (filters.get(name) or "").strip()
+        if not value:
+            continue
+        preds.append(_FILTER_SQL[name])
+        params[f"f_{name}"] = value.upper() if name == "size" else value.lower()
+    return "".join(f"\n      AND {p}" for p in preds), params
 
-    with conn.cursor(row_factory=dict_row) as cur:
-        # ---- Dense (proper cast to vector)
-        cur.execute(
-            """
-            SELECT id, kind, title, text, url, meta,
-                   (1.0 - (embedding <=> %s::vector)) AS dense_score
-            FROM ai_core.docs
-            WHERE kind = %s
-            ORDER BY embedding <=> %s::vector
-            LIMIT %s
-            """,
-            (q_emb, index_name, q_emb, k),
-        )
-        dense_rows = cur.fetchall()
+# `{emb}` becomes ", embedding" when the caller wants stored vectors back;
+# `{where}` takes the filter_clause() predicates
+_DENSE_SQL = """
+    SELECT id, kind, title, text, url, meta{emb},
+           (1.0 - (embedding <=> %(emb)s::vector)) AS dense_score
+    FROM ai_core.docs
+    WHERE kind = %(kind)s{where}
+    ORDER BY embedding <=> %(emb)s::vector
+    LIMIT %(k)s
+"""
 
-        # ---- BM25 (precomputed tsv)
-        cur.execute(
-            """
-            SELECT id, kind, title, text, url, meta,
-                   ts_rank(tsv, plainto_tsquery('simple', lower(%s))) AS bm25_score
-            FROM ai_core.docs
-            WHERE kind = %s
-              AND tsv @@ plainto_tsquery('simple', lower(%s))
-            ORDER BY bm25_score DESC
-            LIMIT %s
-            """,
-            (query, index_name, query, k),
-        )
-        bm_rows = cur.fetchall()
+_BM25_SQL = """
+    SELECT id, kind, title, text, url, meta{emb},
+           ts_rank(tsv, plainto_tsquery('simple', lower(%(q)s))) AS bm25_score
+    FROM ai_core.docs
+    WHERE kind = %(kind)s
+      AND tsv @@ plainto_tsquery('simple', lower(%(q)s)){where}
+    ORDER BY bm25_score DESC
+    LIMIT %(k)s
+"""
+
+# Dense + BM25 in one statement; rows come back in the same order the two
+# separate queries would merge them (dense order, then BM25-only rows).
+_FUSED_SQL = """
+    WITH dense AS (
+        SELECT id, (1.0 - (embedding <=> %(emb)s::vector)) AS dense_score
+        FROM ai_core.docs
+        WHERE kind = %(kind)s{where}
+        ORDER BY embedding <=> %(emb)s::vector
+        LIMIT %(k)s
+    ),
+    bm AS (
+        SELECT id, ts_rank(tsv, plainto_tsquery('simple', lower(%(q)s))) AS bm25_score
+        FROM ai_core.docs
+        WHERE kind = %(kind)s
+          AND tsv @@ plainto_tsquery('simple', lower(%(q)s)){where}
+        ORDER BY bm25_score DESC
+        LIMIT %(k)s
+    )
+    SELECT d.id, d.kind, d.title, d.text, d.url, d.meta{emb},
+           dense.dense_score, bm.bm25_score
+    FROM (SELECT id FROM dense UNION SELECT id FROM bm) ids
+    JOIN ai_core.docs d ON d.id = ids.id
+    LEFT JOIN dense ON dense.id = ids.id
+    LEFT JOIN bm    ON bm.id    = ids.id
+    ORDER BY dense.dense_score DESC NULLS LAST, bm.bm25_score DESC
+"""
+
+# auto    : fused when the query embedding is already cached, else overlap
+# overlap : BM25 runs while the embedding call is in flight, then dense
+# fused   : one CTE round-trip after the embedding
+HYBRID_MODE = os.getenv("HYBRID_MODE", "auto").lower()
+
+# ---- ANN recall knobs (HNSW / IVFFlat partial indexes per kind) ----
+# None = server default (hnsw.ef_search=40, ivfflat.probes=1). An HNSW scan
+# returns at most ef_search rows, so ef_search is raised to the LIMIT; only
+# values that differ from the defaults are sent, in a single statement.
+def _env_int(name: str) -> Optional[int]:
+    v = os.getenv(name, "").strip()
+    return int(v) if v else None
+
+HNSW_EF_SEARCH = _env_int("HNSW_EF_SEARCH")
+IVFFLAT_PROBES = _env_int("IVFFLAT_PROBES")
+# Filtered queries: an HNSW scan only yields ef_search candidates before the
+# filter runs, so a selective filter can leave fewer than LIMIT rows (or none).
+# pgvector >= 0.8 keeps walking the index until LIMIT rows pass
+# ("relaxed_order" | "strict_order" | "off"; skipped on older servers), and
+# ef_search is raised to at least ANN_FILTERED_EF_SEARCH for older ones.
+ANN_ITERATIVE_SCAN = os.getenv("ANN_ITERATIVE_SCAN", "relaxed_order").strip()
+ANN_FILTERED_EF_SEARCH = int(os.getenv("ANN_FILTERED_EF_SEARCH", "200"))
+
+_HNSW_EF_DEFAULT = 40
+_HNSW_EF_MAX = 1000   # pgvector's upper bound for hnsw.ef_search
+
+def _ann_knobs(
+    ef_search: Optional[int],
+    probes: Optional[int],
+    filtered: bool = False,
+    k: Optional[int] = None,
+) -> List[Tuple[str, str]]:
+    """Settings that differ from the server defaults; [] means no SET at all."""
+    ef = HNSW_EF_SEARCH if ef_search is None else ef_search
+    pr = IVFFLAT_PROBES if probes is None else probes
+    # a LIMIT above ef_search would silently come back short
+    ef = max(ef or _HNSW_EF_DEFAULT, k or 0)
+    if filtered:
+        ef = max(ef, ANN_FILTERED_EF_SEARCH)
+    ef = min(ef, _HNSW_EF_MAX)
+    knobs = []
+    if ef != _HNSW_EF_DEFAULT:
+        knobs.append(("hnsw.ef_search", str(int(ef))))
+    if pr and pr != 1:
+        knobs.append(("ivfflat.probes", str(int(pr))))
+    if filtered and ANN_ITERATIVE_SCAN and ANN_ITERATIVE_SCAN != "off":
+        knobs.append(("hnsw.iterative_scan", ANN_ITERATIVE_SCAN))
+        knobs.append(("ivfflat.iterative_scan", ANN_ITERATIVE_SCAN))
+    return knobs
 
-    # ---- Merge by id
+# iterative_scan is unknown before pgvector 0.8 and setting it would error;
+# the scalar subquery yields NULL (nothing set) on older servers
+_PGVECTOR_08_KNOBS = {"hnsw.iterative_scan", "ivfflat.iterative_scan"}
+_SET_LOCAL = "set_config(%s, %s, true)"
+_SET_LOCAL_08 = (
+    "(SELECT set_config(%s, %s, true) FROM pg_extension"
+    " WHERE extname = 'vector' AND string_to_array(extversion, '.')::int[] >= '{0,8}')"
+)
+
+def _set_local(knobs: List[Tuple[str, str]]) -> Tuple[str, List[str]]:
+    """One SELECT setting every knob for the current transaction."""
+    cols = [_SET_LOCAL_08 if name in _PGVECTOR_08_KNOBS else _SET_LOCAL for name, _ in knobs]
+    return "SELECT " + ", ".join(cols), [v for kv in knobs for v in kv]
+
+@contextmanager
+def _ann_scope(conn: psycopg.Connection, knobs: List[Tuple[str, str]]):
+    # SET LOCAL needs a transaction; it ends with the block, so pooled
+    # connections never leak a per-request setting.
+    if not knobs:
+        yield
+        return
+    with conn.transaction():
+        conn.execute(*_set_local(knobs))
+        yield
+
+@asynccontextmanager
+async def _ann_scope_async(conn: psycopg.AsyncConnection, knobs: List[Tuple[str, str]]):
+    if not knobs:
+        yield
+        return
+    async with conn.transaction():
+        await conn.execute(*_set_local(knobs))
+        yield
+
+def _sql(template: str, with_embeddings: bool, where: str = "") -> str:
+    return template.format(emb=", embedding" if with_embeddings else "", where=where)
+
+def _split_fused(rows: List[Dict[str, Any]]):
+    dense_rows = [r for r in rows if r.get("dense_score") is not None]
+    bm_rows = [r for r in rows if r.get("bm25_score") is not None]
+    return dense_rows, bm_rows
+
+def _blend(
+    dense_rows: List[Dict[str, Any]],
+    bm_rows: List[Dict[str, Any]],
+    k_rerank: int,
+    attrs: Optional[Dict[str, List[str]]],
+) -> List[Hit]:
+    """Merge dense + BM25 rows by id, normalize, blend, MMR → k_rerank."""
     by_id: Dict[str, Hit] = {}
 
     for r in dense_rows:
@@ -169,6 +293,7 @@ def hybrid_search(
             url=r.get("url") or "",
             meta=r.get("meta") or {},
             score_dense=float(r.get("dense_score") or 0.0),
+            embedding=r.get("embedding"),
         )
 
     for r in bm_rows:
@@ -181,6 +306,7 @@ def hybrid_search(
                 text=r.get("text") or "",
                 url=r.get("url") or "",
                 meta=r.get("meta") or {},
+                embedding=r.get("embedding"),
             )
             by_id[r["id"]] = h
         h.score_bm25 = max(h.score_bm25, float(r.get("bm25_score") or 0.0))
@@ -208,6 +334,99 @@ def hybrid_search(
     items.sort(key=lambda x: x.score_final, reverse=True)
     return _mmr(items, k=k_rerank, lambda_diversity=0.75)
 
+@timed("hybrid_search")
+def hybrid_search(
+    conn: psycopg.Connection,
+    query: str,
+    index_name: str,   # interpreted as `kind`
+    k: int = 24,
+    k_rerank: int = 6,
+    *,
+    attrs: Optional[Dict[str, List[str]]] = None,  # NEW (colors/sizes)
+    ef_search: Optional[int] = None,   # hnsw.ef_search for this call (recall vs latency)
+    probes: Optional[int] = None,      # ivfflat.probes for this call
+    with_embeddings: bool = False,     # return stored doc vectors on each Hit (for MMR)
+    filters: Optional[Dict[str, Optional[str]]] = None,  # hard pre-filters {type, tier, color, size}
+) -> List[Hit]:
+    """
+    1) Dense top-k (pgvector)
+    2) BM25 top-k on tsv
+       (both restricted by `filters`, see filter_clause)
+    3) Optional attribute boost (colors/sizes) from meta
+    4) Normalize, blend, MMR → k_rerank
+    """
+    from app.vector.store import embed_query  # sync helper
+    q_emb = embed_query(query, conn)
+    where, fparams = filter_clause(filters)
+    params = {"emb": q_emb, "kind": index_name, "q": query, "k": k, **fparams}
+
+    # binary results: pgvector hands back numpy arrays instead of parsing text
+    with conn.cursor(row_factory=dict_row, binary=with_embeddings) as cur:
+        # ---- Dense (proper cast to vector)
+        with timer("dense_sql"), _ann_scope(conn, _ann_knobs(ef_search, probes, filtered=bool(where), k=k)):
+            cur.execute(_sql(_DENSE_SQL, with_embeddings, where), params)
+            dense_rows = cur.fetchall()
+
+        # ---- BM25 (precomputed tsv)
+        with timer("bm25_sql"):
+            cur.execute(_sql(_BM25_SQL, with_embeddings, where), params)
+            bm_rows = cur.fetchall()
+
+    return _blend(dense_rows, bm_rows, k_rerank, attrs)
+
+@timed("hybrid_search")
+async def hybrid_search_async(
+    conn: psycopg.AsyncConnection,
+    query: str,
+    index_name: str,
+    k: int = 24,
+    k_rerank: int = 6,
+    *,
+    attrs: Optional[Dict[str, List[str]]] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    with_embeddings: bool = False,
+    filters: Optional[Dict[str, Optional[str]]] = None,
+) -> List[Hit]:
+    """
+    Async end-to-end `hybrid_search` for request handlers: the embedding call
+    and both queries are awaited, so a slow provider never blocks the event loop.
+    The sync `hybrid_search` stays for CLI scripts.
+    """
+    where, fparams = filter_clause(filters)
+    params = {"kind": index_name, "q": query, "k": k, **fparams}
+    knobs = _ann_knobs(ef_search, probes, filtered=bool(where), k=k)
+    mode = HYBRID_MODE
+    q_emb = cached_query_embedding(query) if mode == "auto" else None
+
+    if mode == "fused" or q_emb is not None:
+        if q_emb is None:
+            q_emb = await embed_query_async(query, conn=conn)
+        async with _ann_scope_async(conn, knobs), conn.cursor(row_factory=dict_row, binary=with_embeddings) as cur:
+            with timer("fused_sql"):
+                await cur.execute(_sql(_FUSED_SQL, with_embeddings, where), {**params, "emb": q_emb})
+                dense_rows, bm_rows = _split_fused(await cur.fetchall())
+        return _blend(dense_rows, bm_rows, k_rerank, attrs)
+
+    # overlap: BM25 needs no embedding, so fire it while the provider call is in flight
+    emb_task = asyncio.create_task(embed_query_async(query, conn=conn))
+    try:
+        async with conn.cursor(row_factory=dict_row, binary=with_embeddings) as cur:
+            with timer("bm25_sql"):
+                await cur.execute(_sql(_BM25_SQL, with_embeddings, where), params)
+                bm_rows = await cur.fetchall()
+
+            q_emb = await emb_task
+            with timer("dense_sql"):
+                async with _ann_scope_async(conn, knobs):
+                    await cur.execute(_sql(_DENSE_SQL, with_embeddings, where), {**params, "emb": q_emb})
+                    dense_rows = await cur.fetchall()
+    finally:
+        if not emb_task.done():
+            emb_task.cancel()
+
+    return _blend(dense_rows, bm_rows, k_rerank, attrs)
+
 # app/vector/hybrid.py
 W_ATTR = 0.20
 
@@ -0,0 +1,124 @@
+# app/vector/incremental.py
+from __future__ import annotations
+import hashlib, json, logging, uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+import psycopg
+
+from app.vector.backfill_embeddings import embed_many_sync
+from app.vector.bulk import write_docs
+
+log = logging.getLogger("cove.ingest")
+
+# Incremental writes to ai_core.docs for the ingest/seed CLIs:
+#   - deterministic ids (uuid5 of kind + natural key), so re-runs update in place
+#   - content_hash of what we write; unchanged rows are skipped entirely
+#   - changed rows go through the bulk writer (app/vector/bulk.py): one binary
+#     COPY + one INSERT .. ON CONFLICT
+#   - a changed `text` clears the embedding, so only those rows are re-embedded
+#     (ingest --embed-missing / app/vector/backfill_embeddings.py)
+#   - rows a `source` owns but no longer emits are deleted
+
+_NAMESPACE = uuid.UUID("6f1c0a52-3c1e-5b0e-9a59-2f0f6f9f7c11")
+
+def doc_id(kind: str, *key: Any) -> uuid.UUID:
+    """Stable id for a document: same kind + natural key -> same id on every run."""
+    return uuid.uuid5(_NAMESPACE, "\x1f".join([kind, *("" if k is None else str(k) for k in key)]))
+
+def upsert_doc_id(kind: str, url: Optional[str], meta: Optional[Dict[str, Any]]) -> uuid.UUID:
+    """Id of a single-doc write (both upsert_doc helpers, the seed): kind + slug or url + variantId."""
+    meta = meta or {}
+    return doc_id(kind, meta.get("slug") or url, meta.get("variantId"))
+
+def content_hash(kind: str, title: str, text: str, url: Optional[str], meta: Dict[str, Any]) -> str:
+    payload = json.dumps([kind, title, text, url, meta], sort_keys=True, ensure_ascii=False,
+                         separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@dataclass
+class DocRow:
+    id: uuid.UUID
+    kind: str
+    title: str
+    text: str
+    url: Optional[str]
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def hash(self) -> str:
+        return content_hash(self.kind, self.title, self.text, self.url, self.meta)
+
+@dataclass
+class SyncStats:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    needs_embedding: int = 0   # written rows whose embedding is NULL (new or text changed)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated or self.deleted)
+
+_EXISTING_SQL = """
+    SELECT id, content_hash, md5(text) FROM ai_core.docs
+    WHERE id = ANY(%(ids)s) OR (%(source)s::text IS NOT NULL AND source = %(source)s)
+"""
+
+_PRUNE_SQL = """
+    DELETE FROM ai_core.docs WHERE source = %(source)s AND NOT (id = ANY(%(ids)s))
+"""
+
+def _text_md5(text: str) -> str:
+    return hashlib.md5((text or "").encode("utf-8")).hexdigest()
+
+def sync_docs(conn: psycopg.Connection, source: Optional[str], rows: Iterable[DocRow],
+              *, prune: bool = True, embed: bool = False) -> SyncStats:
+    """
+    Make ai_core.docs match `rows` for this `source`.
+    With prune=True, rows previously written under `source` that are not in
+    `rows` are deleted. source=None writes unowned rows and never prunes.
+    With embed=True, rows whose text is new or changed are embedded in
+    batches before the write (on failure they are left for the backfill).
+    """
+    by_id: Dict[uuid.UUID, DocRow] = {}
+    for r in rows:
+        by_id[r.id] = r  # last one wins, as sequential upserts would
+    ids = list(by_id)
+    stats = SyncStats()
+
+    with conn.cursor() as cur:
+        cur.execute(_EXISTING_SQL, {"ids": ids, "source": source})
+        existing = {rid: (h, tmd5) for rid, h, tmd5 in cur.fetchall()}
+
+    changed: List[DocRow] = []
+    for rid, r in by_id.items():
+        if existing.get(rid, (None,))[0] == r.hash:
+            stats.unchanged += 1
+        else:
+            changed.append(r)
+
+    vectors: Dict[uuid.UUID, Any] = {}
+    if embed:
+        to_embed = [r for r in changed if existing.get(r.id, (None, None))[1] != _text_md5(r.text)]
+        if to_embed:
+            try:
+                vecs = embed_many_sync([r.text for r in to_embed])
+                vectors = {r.id: v for r, v in zip(to_embed, vecs)}
+            except Exception as e:
+                log.warning("embedding %d changed docs failed, leaving them for the backfill: %s", len(to_embed), e)
+
+    with conn.transaction():
+        for inserted, needs_embedding in write_docs(conn, changed, source=source, embeddings=vectors):
+            if inserted:
+                stats.inserted += 1
+            else:
+                stats.updated += 1
+            stats.needs_embedding += int(needs_embedding)
+
+        if prune and source is not None:
+            with conn.cursor() as cur:
+                cur.execute(_PRUNE_SQL, {"source": source, "ids": ids})
+                stats.deleted = cur.rowcount
+    return stats
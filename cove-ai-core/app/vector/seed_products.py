@@ -1,13 +1,16 @@
 # app/vector/seed_products.py
 from __future__ import annotations
-import json, os
+import argparse, json
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 import psycopg
-from app.vector.store import connect, upsert_doc, _embed_sync  # reuse sync embed
+from app.vector.store import connect
+from app.vector.incremental import DocRow, sync_docs, upsert_doc_id
+from app.vector.vocab import notify_catalog_changed
 
 KIND = "product"
+SOURCE = "seed:products"
 
 def make_text(p: Dict[str, Any]) -> str:
     # Build a rich searchable text from fields
@@ -28,32 +31,47 @@ def make_text(p: Dict[str, Any]) -> str:
         parts.append(f"colors {cnames}")
     return " ".join([s for s in parts if s])
 
-def main(path: str):
-    conn = connect()
-    raw = json.loads(Path(path).read_text())
+def product_rows(raw: Dict[str, Any]) -> List[DocRow]:
     # raw has tiers: casual/originals/designer -> list of products
-    count = 0
+    rows: List[DocRow] = []
     for tier, plist in raw.items():
         for p in plist:
             meta = dict(p)  # full product JSON as meta
-            title = p.get("name", "")
-            url   = f"/product/{p.get('slug','')}"  # adjust to your frontend route
-            text  = make_text(p)
-            # embed once per product
-            [vec] = _embed_sync([text])
-            upsert_doc(conn,
-                       kind=KIND,
-                       title=title,
-                       text=text,
-                       url=url,
-                       meta=meta,
-                       embedding=vec)
-            count += 1
-    print(f"seeded {count} product docs")
+            url = f"/product/{p.get('slug','')}"  # adjust to your frontend route
+            rows.append(DocRow(
+                id=upsert_doc_id(KIND, url, {"slug": p.get("slug")}),  # same id as upsert_doc
+                kind=KIND,
+                title=p.get("name", ""),
+                text=make_text(p),
+                url=url,
+                meta=meta,
+            ))
+    return rows
+
+_PRUNE_LEGACY_SQL = """
+    DELETE FROM ai_core.docs
+    WHERE source IS NULL AND kind = 'product' AND meta ? 'slug' AND NOT (id = ANY(%s))
+"""
+
+def main(path: str, prune_legacy: bool = False):
+    conn = connect()
+    raw = json.loads(Path(path).read_text())
+    rows = product_rows(raw)
+    # only new/changed products are written; new or re-worded ones are embedded in batches
+    stats = sync_docs(conn, SOURCE, rows, embed=True)
+    if prune_legacy:
+        with conn.cursor() as cur:
+            cur.execute(_PRUNE_LEGACY_SQL, ([r.id for r in rows],))
+            stats.deleted += cur.rowcount
+    if stats.changed:
+        notify_catalog_changed(conn)
+    print(f"seeded {len(rows)} product docs (inserted={stats.inserted} updated={stats.updated} "
+          f"unchanged={stats.unchanged} deleted={stats.deleted} to_embed={stats.needs_embedding})")
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python -m app.vector.seed_products /absolute/path/to/catalog.json")
-        raise SystemExit(2)
-    main(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Cove AI — seed product-level docs from catalog JSON")
+    parser.add_argument("path", help="/absolute/path/to/catalog.json")
+    parser.add_argument("--prune-legacy", action="store_true",
+                        help="delete product rows from earlier seeds with random ids (duplicates)")
+    args = parser.parse_args()
+    main(args.path, prune_legacy=args.prune_legacy)
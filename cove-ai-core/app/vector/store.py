@@ -1,103 +1,94 @@
 # app/vector/store.py
 from __future__ import annotations
-import os, json, uuid
+import os, json, re
 from typing import Any, Dict, List, Tuple
 
-import httpx
 import psycopg
 from psycopg.rows import tuple_row
 from pgvector.psycopg import register_vector
 from psycopg.rows import dict_row
 
 from app.core.config import PG_DSN
+from app.providers.embed import embed_sync, embed_query_sync, embed_query as embed_query_async
+from app.vector.bulk import write_docs
+from app.vector.incremental import DocRow, upsert_doc_id
 
 # --------- DB ----------
+# Sync, single connection for CLI scripts (ingest/seed/backfill).
+# Request handlers borrow from the async pool in app/core/db.py instead.
 def connect():
     conn = psycopg.connect(PG_DSN, autocommit=True)
     register_vector(conn)
     return conn
 
 def upsert_doc(conn, kind:str, title:str, text:str, url:str, meta:dict, embedding:list):
-    with conn.cursor() as cur:
-        cur.execute(
-            """INSERT INTO ai_core.docs(id,kind,title,text,url,meta,embedding)
-               VALUES(%s,%s,%s,%s,%s,%s,%s)
-               ON CONFLICT(id) DO UPDATE SET
-                 kind=EXCLUDED.kind, title=EXCLUDED.title, text=EXCLUDED.text,
-                 url=EXCLUDED.url, meta=EXCLUDED.meta, embedding=EXCLUDED.embedding
-            """,
-            (str(uuid.uuid4()), kind, title, text, url, json.dumps(meta), embedding)
-        )
+    """
+    One row keyed by kind + slug/url (+ variantId); re-runs update it in place.
+    Many rows: build DocRows and use app/vector/bulk.write_docs (or sync_docs).
+    """
+    meta = meta or {}
+    row = DocRow(id=upsert_doc_id(kind, url, meta),
+                 kind=kind, title=title or "", text=text or "", url=url, meta=meta)
+    write_docs(conn, [row], embeddings={row.id: embedding} if embedding is not None else None)
 
 # --------- Embeddings (sync, used by retriever) ----------
-EMBED_MODEL = os.getenv("EMBED_MODEL","openrouter:openai/text-embedding-3-small")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY","")
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY","")
-COHERE_API_KEY = os.getenv("COHERE_API_KEY","")
-
 def _embed_sync(texts: List[str]) -> List[List[float]]:
-    if EMBED_MODEL.startswith("openrouter:"):
-        model = EMBED_MODEL.split("openrouter:",1)[1]
-        url = "https://openrouter.ai/api/v1/embeddings"
-        headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type":"application/json"}
-        payload = {"model": model, "input": texts}
-    elif EMBED_MODEL.startswith("cohere:"):
-        model = EMBED_MODEL.split("cohere:",1)[1]
-        url = "https://api.cohere.ai/v1/embed"
-        headers = {"Authorization": f"Bearer {COHERE_API_KEY}", "Content-Type":"application/json"}
-        payload = {"model": model, "texts": texts}
-    else:
-        model = EMBED_MODEL.split("openai:",1)[1] if EMBED_MODEL.startswith("openai:") else EMBED_MODEL
-        url = "https://api.openai.com/v1/embeddings"
-        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type":"application/json"}
-        payload = {"model": model, "input": texts}
-
-    with httpx.Client(timeout=30) as cx:
-        r = cx.post(url, headers=headers, json=payload)
-        r.raise_for_status()
-        data = r.json()
-        if "data" in data and data["data"] and "embedding" in data["data"][0]:
-            return [d["embedding"] for d in data["data"]]
-        if "embeddings" in data:  # Cohere
-            return data["embeddings"]
-        raise RuntimeError(f"Unexpected embedding response keys: {list(data.keys())}")
-
-def embed_query(query: str) -> List[float]:
-    return _embed_sync([query])[0]
+    return embed_sync(texts)
+
+def embed_query(query: str, conn: psycopg.Connection | None = None) -> List[float]:
+    # cached: repeated storefront queries never hit the provider twice
+    return embed_query_sync(query, conn=conn)
 
 # --------- Hybrid wrapper ----------
 # ... header unchanged ...
 
-def search_hybrid(conn: psycopg.Connection, query: str, kind: str, top_k: int = 6) -> List[Dict[str,Any]]:
-    from app.vector.hybrid import hybrid_search
+_DENSE_FALLBACK_SQL = """
+    SELECT id, kind, title, text, url, meta,
+           (1.0 - (embedding <=> %(emb)s::vector)) AS dense_score{emb}
+    FROM ai_core.docs
+    WHERE kind = %(kind)s{where}
+    ORDER BY embedding <=> %(emb)s::vector
+    LIMIT %(k)s
+"""
 
-    hits = hybrid_search(conn, query=query, index_name=kind, k=max(24, top_k), k_rerank=top_k)
+def _fallback_sql(with_embeddings: bool, where: str = "") -> str:
+    return _DENSE_FALLBACK_SQL.format(emb=", embedding" if with_embeddings else "", where=where)
 
-    # Fallback: dense-only if hybrid yielded nothing
-    if not hits:
-        q_emb = embed_query(query)
-        with conn.cursor(row_factory=tuple_row) as cur:
-            cur.execute(
-                """
-                SELECT id, kind, title, text, url, meta,
-                       (1.0 - (embedding <=> %s::vector)) AS dense_score
-                FROM ai_core.docs
-                WHERE kind = %s
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-                """,
-                (q_emb, kind, q_emb, top_k),
-            )
-            rows = cur.fetchall()
-        hits = [
-            type("Dummy", (), {
-                "id": r[0], "kind": r[1],
-                "title": r[2] or "", "text": r[3] or "",
-                "url": r[4] or "", "meta": r[5] or {},
-                "score_final": float(r[6] or 0.0)
-            })() for r in rows
-        ]
+def _fallback_hits(rows) -> list:
+    return [
+        type("Dummy", (), {
+            "id": r[0], "kind": r[1],
+            "title": r[2] or "", "text": r[3] or "",
+            "url": r[4] or "", "meta": r[5] or {},
+            "score_final": float(r[6] or 0.0),
+            "embedding": r[7] if len(r) > 7 else None,
+        })() for r in rows
+    ]
+
+_PRODUCT_URL_RE = re.compile(r"/product/([^?\s]+)")
+
+def product_fields(meta: Any, url: str = "") -> Dict[str, Any]:
+    """
+    Structured product attributes carried on every retrieval hit, so callers
+    (recs filtering/scoring) never need a second lookup for the same row.
+    """
+    m = meta if isinstance(meta, dict) else {}
+    um = _PRODUCT_URL_RE.search(url or "")
+    colors = []
+    for c in (m.get("colors") or []):
+        name = (c.get("colorName") or "").strip() if isinstance(c, dict) else ""
+        if name:
+            colors.append(name)
+    sizes = m.get("sizes")
+    return {
+        "slug": (um.group(1) if um else "") or (m.get("slug") or ""),
+        "type": (m.get("type") or "").lower().strip() or None,
+        "tier": (m.get("tier") or "").lower().strip() or None,
+        "colors": colors,
+        "sizes": sizes if isinstance(sizes, dict) else {},
+    }
 
+def _hits_to_docs(hits) -> List[Dict[str, Any]]:
     # Map to rag.py expected dicts
     docs: List[Dict[str, Any]] = []
     for h in hits:
@@ -112,10 +103,141 @@ def search_hybrid(conn: psycopg.Connection, query: str, kind: str, top_k: int =
             "text": text,
             "score": float(getattr(h, "score_final", 0.0)),
             "meta": meta,
+            **product_fields(meta, url),
         })
+        emb = getattr(h, "embedding", None)
+        if emb is not None:
+            docs[-1]["embedding"] = emb
     return docs
 
+def search_hybrid(
+    conn: psycopg.Connection,
+    query: str,
+    kind: str,
+    top_k: int = 6,
+    *,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    with_embeddings: bool = False,
+    filters: Dict[str, str | None] | None = None,
+) -> List[Dict[str,Any]]:
+    from app.vector.hybrid import hybrid_search, filter_clause, _ann_knobs, _ann_scope
 
+    hits = hybrid_search(conn, query=query, index_name=kind, k=max(24, top_k), k_rerank=top_k,
+                         ef_search=ef_search, probes=probes, with_embeddings=with_embeddings,
+                         filters=filters)
+
+    # Fallback: dense-only if hybrid yielded nothing
+    if not hits:
+        q_emb = embed_query(query, conn)
+        where, fparams = filter_clause(filters)
+        knobs = _ann_knobs(ef_search, probes, filtered=bool(where), k=top_k)
+        with _ann_scope(conn, knobs), conn.cursor(row_factory=tuple_row, binary=with_embeddings) as cur:
+            cur.execute(_fallback_sql(with_embeddings, where),
+                        {"emb": q_emb, "kind": kind, "k": top_k, **fparams})
+            rows = cur.fetchall()
+        hits = _fallback_hits(rows)
+
+    return _hits_to_docs(hits)
+
+async def search_hybrid_async(
+    conn: psycopg.AsyncConnection,
+    query: str,
+    kind: str,
+    top_k: int = 6,
+    *,
+    attrs: Dict[str, List[str]] | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    with_embeddings: bool = False,
+    filters: Dict[str, str | None] | None = None,
+) -> List[Dict[str,Any]]:
+    """
+    Async twin of `search_hybrid` for request handlers (pooled connection).
+    `with_embeddings=True` adds each doc's stored vector under "embedding".
+    `filters` ({type, tier, color, size}) are applied inside the SQL.
+    """
+    from app.vector.hybrid import hybrid_search_async, filter_clause, _ann_knobs, _ann_scope_async
+
+    hits = await hybrid_search_async(conn, query=query, index_name=kind, k=max(24, top_k), k_rerank=top_k,
+                                     attrs=attrs, ef_search=ef_search, probes=probes,
+                                     with_embeddings=with_embeddings, filters=filters)
+
+    if not hits:
+        q_emb = await embed_query_async(query, conn=conn)
+        where, fparams = filter_clause(filters)
+        knobs = _ann_knobs(ef_search, probes, filtered=bool(where), k=top_k)
+        async with _ann_scope_async(conn, knobs), conn.cursor(row_factory=tuple_row, binary=with_embeddings) as cur:
+            await cur.execute(_fallback_sql(with_embeddings, where),
+                              {"emb": q_emb, "kind": kind, "k": top_k, **fparams})
+            rows = await cur.fetchall()
+        hits = _fallback_hits(rows)
+
+    return _hits_to_docs(hits)
+
+
+
+
+# --------- Product metadata (batched, request-scoped) ----------
+
+_PRODUCTS_BY_SLUGS_SQL = """
+    SELECT DISTINCT ON (meta->>'slug') meta->>'slug' AS slug, title, meta
+    FROM ai_core.docs
+    WHERE kind = 'product' AND meta->>'slug' = ANY(%s)
+"""
+
+def product_payload(slug: str, title: str | None, meta: Any) -> dict:
+    return {
+        "title": title or (meta.get("name") if isinstance(meta, dict) else ""),
+        "url": f"/product/{slug}",
+        "price": (meta.get("price") if isinstance(meta, dict) else None),
+        "meta": meta or {},
+    }
+
+async def get_products_by_slugs(conn: psycopg.AsyncConnection, slugs: List[str]) -> Dict[str, dict]:
+    """
+    One round-trip for many slugs: {slug: {title, url, price, meta}}.
+    Slugs with no product row are simply absent.
+    """
+    wanted = [s for s in dict.fromkeys(slugs) if s]
+    if not wanted:
+        return {}
+    async with conn.cursor() as cur:
+        await cur.execute(_PRODUCTS_BY_SLUGS_SQL, (wanted,))
+        rows = await cur.fetchall()
+    return {slug: product_payload(slug, title, meta) for slug, title, meta in rows}
+
+class ProductCache:
+    """
+    Request-scoped product lookup shared by retrieval post-processing, fit,
+    suggestions and verification. `prefetch` batches all misses into one
+    query; misses are remembered so a slug is never looked up twice.
+    """
+
+    def __init__(self, conn: psycopg.AsyncConnection):
+        self.conn = conn
+        self._data: Dict[str, dict | None] = {}
+
+    async def prefetch(self, slugs: List[str]) -> None:
+        missing = [s for s in dict.fromkeys(slugs) if s and s not in self._data]
+        if not missing:
+            return
+        found = await get_products_by_slugs(self.conn, missing)
+        for s in missing:
+            self._data[s] = found.get(s)
+
+    async def get(self, slug: str) -> dict | None:
+        if not slug:
+            return None
+        if slug not in self._data:
+            await self.prefetch([slug])
+        return self._data.get(slug)
+
+    def peek(self, slug: str) -> dict | None:
+        return self._data.get(slug)
+
+    def put(self, slug: str, prod: dict) -> None:
+        self._data[slug] = prod
 
 
 def get_product_by_slug(conn: psycopg.Connection, slug: str) -> dict | None:
@@ -140,20 +262,18 @@ def get_product_by_slug(conn: psycopg.Connection, slug: str) -> dict | None:
 
 def get_variant_by_id(conn: psycopg.Connection, variant_id: str) -> dict | None:
     """
-    Search all product metas for a color variant with given variantId.
+    Find the product whose meta.colors[] holds the given variantId
+    (indexed lookup through ai_core.product_attrs).
     Returns a dict: { product: {...}, variant: {...} }
     """
     with conn.cursor(row_factory=dict_row) as cur:
         cur.execute(
             """
-            SELECT id, kind, title, url, meta
-            FROM ai_core.docs
-            WHERE kind = 'product'
-              AND EXISTS (
-                SELECT 1
-                FROM jsonb_array_elements(COALESCE(meta->'colors','[]'::jsonb)) AS c
-                WHERE c->>'variantId' = %s
-              )
+            SELECT d.id, d.kind, d.title, d.url, d.meta
+            FROM ai_core.product_attrs a
+            JOIN ai_core.docs d ON d.id = a.product_doc_id
+            WHERE a.variant_id = %s
+              AND jsonb_typeof(d.meta->'colors') = 'array'
             LIMIT 1
             """,
             (variant_id,),
@@ -176,59 +296,69 @@ def get_variant_by_id(conn: psycopg.Connection, variant_id: str) -> dict | None:
             "variant": variant,
         }
 
-from time import time
-
-_vocab_cache = {"t": 0, "colors": set(), "types": set(), "sizes": {"S","M","L","XL"}}
+# --------- Catalog vocab loaders ----------
+# Raw DISTINCT scans; callers go through app/vector/vocab.py (cached, SWR).
 
-def catalog_vocab(conn, ttl_sec: int = 60):
-    now = time()
-    if now - _vocab_cache["t"] < ttl_sec and _vocab_cache["colors"]:
-        return _vocab_cache
+# colors come from the normalized side table (see migrations/*__product_attrs.sql)
+_VOCAB_COLORS_SQL = """
+    SELECT DISTINCT color
+    FROM ai_core.product_attrs
+    WHERE color IS NOT NULL
+"""
 
-    colors, types = set(), set()
-    with conn.cursor() as cur:
-        # colors from meta.colors[].colorName
-        cur.execute("""
-            SELECT DISTINCT lower(c->>'colorName')
-            FROM ai_core.docs, jsonb_array_elements(meta->'colors') c
-            WHERE kind='product'
-        """)
-        colors = {r[0] for r in cur.fetchall()}
-
-        # types from meta.type/title (fallback)
-        cur.execute("""
-            SELECT DISTINCT lower(COALESCE(meta->>'type', title))
-            FROM ai_core.docs
-            WHERE kind='product'
-        """)
-        types = {r[0] for r in cur.fetchall()}
-
-    _vocab_cache.update({"t": now, "colors": colors, "types": types})
-    return _vocab_cache
+_VOCAB_TYPES_SQL = """
+    SELECT DISTINCT lower(COALESCE(meta->>'type', split_part(lower(title),' ',1)))
+    FROM ai_core.docs
+    WHERE kind='product'
+"""
 
 def catalog_vocab(conn) -> dict:
     """Return lowercased distinct colors and types from product docs."""
     colors, types = set(), set()
     with conn.cursor() as cur:
-        cur.execute("""
-            SELECT DISTINCT lower(c->>'colorName')
-            FROM ai_core.docs, jsonb_array_elements(meta->'colors') c
-            WHERE kind='product'
-        """)
+        cur.execute(_VOCAB_COLORS_SQL)
         colors |= {r[0] for r in cur.fetchall() if r[0]}
-        cur.execute("""
-            SELECT DISTINCT lower(COALESCE(meta->>'type', split_part(lower(title),' ',1)))
-            FROM ai_core.docs
-            WHERE kind='product'
-        """)
+        cur.execute(_VOCAB_TYPES_SQL)
         types |= {r[0] for r in cur.fetchall() if r[0]}
     return {"colors": colors, "types": types}
 
+async def catalog_vocab_async(conn: psycopg.AsyncConnection) -> dict:
+    """Async twin of `catalog_vocab`."""
+    colors, types = set(), set()
+    async with conn.cursor() as cur:
+        await cur.execute(_VOCAB_COLORS_SQL)
+        colors |= {r[0] for r in await cur.fetchall() if r[0]}
+        await cur.execute(_VOCAB_TYPES_SQL)
+        types |= {r[0] for r in await cur.fetchall() if r[0]}
+    return {"colors": colors, "types": types}
+
 # at bottom of file (or near search_hybrid)
-def search_keyword(conn, *, query: str, kind: str = "product", top_k: int = 6):
+_KEYWORD_SQL = """
+    SELECT
+        title,
+        text,
+        COALESCE(url, meta->>'url', '') AS url,
+        meta,
+        ts_rank(
+            setweight(to_tsvector('simple', COALESCE(title,'')), 'A') ||
+            setweight(to_tsvector('simple', COALESCE(text,'')),  'B'),
+            plainto_tsquery('simple', %(q)s)
+        ) AS score
+    FROM ai_core.docs
+    WHERE kind = %(kind)s{where}
+    ORDER BY score DESC
+    LIMIT %(k)s
+"""
+
+def _keyword_query(query: str, kind: str, top_k: int, filters) -> Tuple[str, Dict[str, Any]]:
+    from app.vector.hybrid import filter_clause
+    where, fparams = filter_clause(filters)
+    return _KEYWORD_SQL.format(where=where), {"q": query, "kind": kind, "k": top_k, **fparams}
+
+def search_keyword(conn, *, query: str, kind: str = "product", top_k: int = 6, filters=None):
     """
     Pure Postgres FTS keyword search; never calls embeddings.
-    Returns rows shaped like search_hybrid: [{title, text, url, score}, ...]
+    Returns rows shaped like search_hybrid: [{title, text, url, score, meta, slug, type, ...}, ...]
     """
     q = (query or "").strip()
     if not q:
@@ -236,30 +366,32 @@ def search_keyword(conn, *, query: str, kind: str = "product", top_k: int = 6):
 
     with conn.cursor() as cur:
         # to_tsvector over title + text; adjust columns per your schema
-        cur.execute("""
-            SELECT
-                title,
-                text,
-                COALESCE(url, meta->>'url', '') AS url,
-                ts_rank(
-                    setweight(to_tsvector('simple', COALESCE(title,'')), 'A') ||
-                    setweight(to_tsvector('simple', COALESCE(text,'')),  'B'),
-                    plainto_tsquery('simple', %s)
-                ) AS score
-            FROM ai_core.docs
-            WHERE kind = %s
-            ORDER BY score DESC
-            LIMIT %s
-        """, (q, kind, top_k))
+        cur.execute(*_keyword_query(q, kind, top_k, filters))
         rows = cur.fetchall()
+    return _keyword_rows(rows)
+
+async def search_keyword_async(conn: psycopg.AsyncConnection, *, query: str, kind: str = "product", top_k: int = 6,
+                               filters=None):
+    """Async twin of `search_keyword` for request handlers."""
+    q = (query or "").strip()
+    if not q:
+        return []
+
+    async with conn.cursor() as cur:
+        await cur.execute(*_keyword_query(q, kind, top_k, filters))
+        rows = await cur.fetchall()
+    return _keyword_rows(rows)
 
+def _keyword_rows(rows) -> List[Dict[str, Any]]:
     out = []
     for r in rows:
-        title, text, url, score = r
+        title, text, url, meta, score = r
         out.append({
             "title": title or "",
             "text": text or "",
             "url": url or "",
             "score": float(score) if score is not None else 0.0,
+            "meta": meta or {},
+            **product_fields(meta, url or ""),
         })
     return out
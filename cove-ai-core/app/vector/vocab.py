@@ -0,0 +1,124 @@
+# app/vector/vocab.py
+from __future__ import annotations
+import asyncio, logging
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import FrozenSet, Optional
+
+import psycopg
+
+from app.core.attrs import AttrExtractor
+from app.core.config import PG_DSN, VOCAB_TTL_SECS
+from app.core.db import get_pool
+from app.vector.store import catalog_vocab_async
+
+log = logging.getLogger("cove.vocab")
+
+# Ingest/seed run in another process; they NOTIFY this channel after writing
+# product docs and the app's listener marks the vocab stale.
+CATALOG_CHANNEL = "ai_core_catalog"
+
+@dataclass
+class Vocab:
+    """Catalog colors/types plus the attribute extractor compiled from them."""
+    colors: FrozenSet[str]
+    types: FrozenSet[str]
+    extractor: AttrExtractor
+    loaded_at: float = field(default_factory=monotonic)
+
+    @classmethod
+    def build(cls, colors, types) -> "Vocab":
+        return cls(colors=frozenset(colors), types=frozenset(types), extractor=AttrExtractor(colors, types))
+
+    def normalize_type(self, tok: str) -> Optional[str]:
+        return self.extractor.normalize_type(tok)
+
+class VocabService:
+    """
+    Process-wide catalog vocabulary with stale-while-revalidate:
+    the first call loads inline; afterwards a stale (TTL or invalidated)
+    vocab is served while one background task reloads it from the pool.
+    """
+
+    def __init__(self, ttl: float = VOCAB_TTL_SECS):
+        self.ttl = ttl
+        self._vocab: Optional[Vocab] = None
+        self._dirty = False
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def invalidate(self) -> None:
+        self._dirty = True
+
+    def _stale(self, v: Vocab) -> bool:
+        return self._dirty or (monotonic() - v.loaded_at) > self.ttl
+
+    async def get(self, conn: Optional[psycopg.AsyncConnection] = None) -> Vocab:
+        v = self._vocab
+        if v is None:
+            return await self._load(conn)
+        if self._stale(v) and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._refresh_bg())
+        return v
+
+    async def _load(self, conn: Optional[psycopg.AsyncConnection]) -> Vocab:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._vocab is not None and not self._stale(self._vocab):
+                return self._vocab
+            self._dirty = False  # invalidations during the load schedule another one
+            try:
+                if conn is None:
+                    async with get_pool().connection() as c:
+                        raw = await catalog_vocab_async(c)
+                else:
+                    raw = await catalog_vocab_async(conn)
+            except BaseException:
+                self._dirty = True  # keep the invalidation: the next get() retries
+                raise
+            self._vocab = Vocab.build(raw["colors"], raw["types"])
+            log.info("vocab loaded (%d colors, %d types)", len(self._vocab.colors), len(self._vocab.types))
+            return self._vocab
+
+    async def _refresh_bg(self) -> None:
+        # never the request's connection: it goes back to the pool before we finish
+        try:
+            await self._load(None)
+        except Exception as e:
+            log.warning("vocab refresh failed, serving stale: %s", e)
+
+vocab = VocabService()
+
+# --------- Cross-process invalidation ----------
+# Bumped on every catalog change this process hears about; anything derived
+# from catalog content (vocab, cached RAG answers) keys on or reacts to it.
+_catalog_version = 0
+
+def catalog_version() -> int:
+    return _catalog_version
+
+def catalog_changed() -> None:
+    global _catalog_version
+    _catalog_version += 1
+    vocab.invalidate()
+
+def notify_catalog_changed(conn: psycopg.Connection) -> None:
+    """Call after writing product docs (ingest/seed CLIs, sync connection)."""
+    catalog_changed()
+    conn.execute("SELECT pg_notify(%s, %s)", (CATALOG_CHANNEL, "products"))
+
+async def listen_catalog_changes() -> None:
+    """Long-running task (app lifespan): catalog_changed() on every NOTIFY."""
+    while True:
+        try:
+            conn = await psycopg.AsyncConnection.connect(PG_DSN, autocommit=True)
+            async with conn:
+                await conn.execute(f"LISTEN {CATALOG_CHANNEL}")
+                async for _ in conn.notifies():
+                    catalog_changed()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("catalog listener reconnecting: %s", e)
+            await asyncio.sleep(5)
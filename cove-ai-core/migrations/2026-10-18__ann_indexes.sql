@@ -0,0 +1,23 @@
+-- ANN indexes for ai_core.docs.embedding (pgvector >= 0.5 for HNSW).
+-- One partial index per `kind`, so `WHERE kind = ... ORDER BY embedding <=> ...`
+-- in hybrid_search / search_hybrid walks a graph instead of scanning the table.
+--
+-- Run outside a transaction (CONCURRENTLY). For a new kind, or to switch a kind
+-- to IVFFlat, use:  python -m app.vector.ann_index --kind <kind> [--method ivfflat]
+--
+-- Recall/latency is tuned per request: hybrid_search(..., ef_search=N, probes=N)
+-- or globally with HNSW_EF_SEARCH / IVFFLAT_PROBES.
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ai_docs_emb_hnsw_product
+  ON ai_core.docs USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64)
+  WHERE kind = 'product';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ai_docs_emb_hnsw_size_policy
+  ON ai_core.docs USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64)
+  WHERE kind = 'size_policy';
+
+ANALYZE ai_core.docs;
@@ -0,0 +1,96 @@
+BEGIN;
+
+-- Change-data-capture from the Django catalog tables (same database) into
+-- ai_core.docs (app/vector/cdc.py).
+--
+-- Row triggers on catalog_productmastergroup / colorgroup / sizestockprice /
+-- productimage append the affected product to ai_core.catalog_outbox and
+-- NOTIFY ai_core_catalog_cdc. Triggers rather than Django signals, so
+-- queryset.update(), bulk writes, admin edits and raw SQL (e.g. the checkout
+-- stock decrement) are all captured, in the same transaction as the change.
+-- The app drains the outbox and patches only docs.meta (stock/price/colors);
+-- text and embeddings are never touched.
+CREATE TABLE IF NOT EXISTS ai_core.catalog_outbox (
+  id          BIGSERIAL PRIMARY KEY,
+  product_id  TEXT NOT NULL,
+  slug        TEXT,            -- slug at the time of the change (old slug on delete/rename)
+  created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION ai_core_catalog_cdc() RETURNS trigger AS $$
+DECLARE
+  pids     text[] := '{}';
+  old_pid  text;
+  old_slug text;
+BEGIN
+  IF TG_TABLE_NAME = 'catalog_productmastergroup' THEN
+    IF TG_OP <> 'INSERT' THEN
+      old_pid := OLD.product_id;
+      old_slug := OLD.slug;
+      pids := pids || OLD.product_id;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN pids := pids || NEW.product_id; END IF;
+  ELSIF TG_TABLE_NAME = 'catalog_colorgroup' THEN
+    IF TG_OP <> 'INSERT' THEN pids := pids || OLD.product_id; END IF;
+    IF TG_OP <> 'DELETE' THEN pids := pids || NEW.product_id; END IF;
+  ELSE
+    -- catalog_sizestockprice / catalog_productimage hang off a color variant
+    IF TG_OP <> 'INSERT' THEN
+      pids := pids || ARRAY(SELECT product_id FROM catalog_colorgroup WHERE variant_id = OLD.variant_id);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+      pids := pids || ARRAY(SELECT product_id FROM catalog_colorgroup WHERE variant_id = NEW.variant_id);
+    END IF;
+  END IF;
+
+  INSERT INTO ai_core.catalog_outbox (product_id, slug)
+  SELECT DISTINCT x.pid, x.slug FROM (
+    SELECT u.pid, p.slug
+    FROM unnest(pids) AS u(pid)
+    LEFT JOIN catalog_productmastergroup p ON p.product_id = u.pid
+    UNION ALL
+    SELECT old_pid, old_slug WHERE old_slug IS NOT NULL
+  ) x
+  WHERE x.pid IS NOT NULL;
+
+  -- identical payloads are folded per transaction: one wake-up per commit
+  PERFORM pg_notify('ai_core_catalog_cdc', '');
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+  IF to_regclass('catalog_sizestockprice') IS NULL THEN
+    RAISE NOTICE 'Django catalog tables not found; CDC triggers not installed';
+    RETURN;
+  END IF;
+
+  DROP TRIGGER IF EXISTS ai_core_catalog_cdc_t ON catalog_productmastergroup;
+  CREATE TRIGGER ai_core_catalog_cdc_t
+    AFTER INSERT OR DELETE OR UPDATE OF slug, tier, type, material, gender, fit, base_price
+    ON catalog_productmastergroup
+    FOR EACH ROW EXECUTE PROCEDURE ai_core_catalog_cdc();
+
+  DROP TRIGGER IF EXISTS ai_core_catalog_cdc_t ON catalog_colorgroup;
+  CREATE TRIGGER ai_core_catalog_cdc_t
+    AFTER INSERT OR DELETE OR UPDATE OF product_id, color_name, hex, slug
+    ON catalog_colorgroup
+    FOR EACH ROW EXECUTE PROCEDURE ai_core_catalog_cdc();
+
+  -- stripe id backfills do not touch anything the docs carry
+  DROP TRIGGER IF EXISTS ai_core_catalog_cdc_t ON catalog_sizestockprice;
+  CREATE TRIGGER ai_core_catalog_cdc_t
+    AFTER INSERT OR DELETE OR UPDATE OF variant_id, size, quantity, price
+    ON catalog_sizestockprice
+    FOR EACH ROW EXECUTE PROCEDURE ai_core_catalog_cdc();
+
+  DROP TRIGGER IF EXISTS ai_core_catalog_cdc_t ON catalog_productimage;
+  CREATE TRIGGER ai_core_catalog_cdc_t
+    AFTER INSERT OR DELETE OR UPDATE OF variant_id, image_name
+    ON catalog_productimage
+    FOR EACH ROW EXECUTE PROCEDURE ai_core_catalog_cdc();
+END
+$$;
+
+COMMIT;
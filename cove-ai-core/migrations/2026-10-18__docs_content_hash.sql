@@ -0,0 +1,16 @@
+BEGIN;
+
+-- Incremental ingest (app/vector/incremental.py).
+--   content_hash: sha256 of (kind, title, text, url, meta) as last written;
+--                 unchanged rows are skipped on re-ingest.
+--   source:       which loader owns the row ('ingest:catalog', ...); rows a
+--                 source stops emitting are deleted on its next run.
+-- Ids are now uuid5(kind + natural key), so re-runs update in place instead of
+-- inserting duplicates. Rows written before this change have NULL source;
+-- `python -m app.ingest --prune-legacy` removes the ingest-written ones.
+ALTER TABLE ai_core.docs ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE ai_core.docs ADD COLUMN IF NOT EXISTS source TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_docs_source ON ai_core.docs (source) WHERE source IS NOT NULL;
+
+COMMIT;
@@ -0,0 +1,16 @@
+BEGIN;
+
+-- Persistent tier of the query-embedding cache (EMBED_CACHE_PERSIST=true).
+-- Keyed by embedding model + normalized query text (lowercased, collapsed whitespace).
+CREATE TABLE IF NOT EXISTS ai_core.embedding_cache (
+  model      TEXT        NOT NULL,
+  query      TEXT        NOT NULL,
+  embedding  vector      NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (model, query)
+);
+
+-- For periodic pruning: DELETE FROM ai_core.embedding_cache WHERE created_at < now() - interval '30 days';
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_created ON ai_core.embedding_cache (created_at);
+
+COMMIT;
@@ -0,0 +1,81 @@
+BEGIN;
+
+-- Normalized product attributes, one row per (product doc, color variant, size).
+-- Kept in sync with ai_core.docs by trigger, so ingest/seed/upsert_doc need no
+-- changes. Replaces jsonb_array_elements(meta->'colors') scans for variant and
+-- color lookups (get_variant_by_id, catalog_vocab, /ai/tools/variant.get).
+--
+-- Product-level rows (seed_products: meta.colors[] x meta.sizes{}) fan out per
+-- color and size; variant-level rows (ingest: meta.variantId/color/price/stock)
+-- give one row with size NULL. Per-color stock (meta.colors[].sizes{}, written
+-- by the catalog CDC consumer) wins over the product-wide meta.sizes.
+CREATE TABLE IF NOT EXISTS ai_core.product_attrs (
+  id             BIGSERIAL PRIMARY KEY,
+  product_doc_id UUID NOT NULL REFERENCES ai_core.docs(id) ON DELETE CASCADE,
+  slug           TEXT,
+  variant_id     TEXT,
+  color          TEXT,     -- lowercased
+  size           TEXT,
+  stock          INTEGER,
+  price          NUMERIC,
+  type           TEXT,     -- lowercased
+  tier           TEXT      -- lowercased
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_attrs_doc     ON ai_core.product_attrs (product_doc_id);
+CREATE INDEX IF NOT EXISTS idx_product_attrs_variant ON ai_core.product_attrs (variant_id);
+CREATE INDEX IF NOT EXISTS idx_product_attrs_slug    ON ai_core.product_attrs (slug);
+CREATE INDEX IF NOT EXISTS idx_product_attrs_color   ON ai_core.product_attrs (color);
+CREATE INDEX IF NOT EXISTS idx_product_attrs_type    ON ai_core.product_attrs (type, tier);
+
+CREATE OR REPLACE FUNCTION ai_core_num(v jsonb) RETURNS numeric AS $$
+  SELECT CASE WHEN jsonb_typeof(v) = 'number' THEN (v #>> '{}')::numeric END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION ai_core_product_attrs_sync() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    DELETE FROM ai_core.product_attrs WHERE product_doc_id = OLD.id;
+  END IF;
+  IF NEW.kind IS DISTINCT FROM 'product' THEN
+    RETURN NULL;
+  END IF;
+
+  INSERT INTO ai_core.product_attrs
+    (product_doc_id, slug, variant_id, color, size, stock, price, type, tier)
+  SELECT
+    NEW.id,
+    COALESCE(NEW.meta->>'slug', substring(NEW.url from '/product/([^?[:space:]]+)')),
+    COALESCE(c->>'variantId', NEW.meta->>'variantId'),
+    lower(COALESCE(c->>'colorName', NEW.meta->>'color')),
+    s.key,
+    COALESCE(ai_core_num(s.value), ai_core_num(NEW.meta->'stock'))::integer,
+    COALESCE(ai_core_num(c->'price'), ai_core_num(NEW.meta->'price')),
+    lower(NEW.meta->>'type'),
+    lower(NEW.meta->>'tier')
+  FROM jsonb_array_elements(
+         CASE WHEN jsonb_typeof(NEW.meta->'colors') = 'array'
+               AND jsonb_array_length(NEW.meta->'colors') > 0
+              THEN NEW.meta->'colors' ELSE '[{}]'::jsonb END
+       ) AS c
+  LEFT JOIN LATERAL jsonb_each(
+         CASE WHEN jsonb_typeof(c->'sizes') = 'object' THEN c->'sizes'
+              WHEN jsonb_typeof(NEW.meta->'sizes') = 'object' THEN NEW.meta->'sizes'
+              ELSE '{}'::jsonb END
+       ) AS s ON true;
+
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ai_core_product_attrs_sync_t ON ai_core.docs;
+CREATE TRIGGER ai_core_product_attrs_sync_t
+  AFTER INSERT OR UPDATE OF kind, url, meta ON ai_core.docs
+  FOR EACH ROW EXECUTE PROCEDURE ai_core_product_attrs_sync();
+
+-- Backfill existing rows (fires the trigger)
+UPDATE ai_core.docs SET meta = meta WHERE kind = 'product';
+
+ANALYZE ai_core.product_attrs;
+
+COMMIT;
@@ -0,0 +1,29 @@
+-- Indexes behind the structured pre-filters in hybrid_search / search_keyword
+-- (app/vector/hybrid.py: filter_clause). Runs after product_attrs.sql, which
+-- creates ai_core.product_attrs.
+--
+--   type/tier : COALESCE(lower(meta->>'type'), '') IN ('', $type)
+--   color     : id IN (SELECT product_doc_id FROM ai_core.product_attrs WHERE color = $c OR color IS NULL)
+--   size      : id IN (SELECT product_doc_id FROM ai_core.product_attrs WHERE upper(size) = $s OR size IS NULL)
+--
+-- type/tier use the partial expression indexes below (product rows only, like
+-- idx_docs_slug); color uses idx_product_attrs_color and size the upper(size)
+-- index below, both OR branches as btree lookups (a bitmap OR). BM25
+-- candidates combine these with idx_ai_docs_tsv through bitmap ANDs; filtered
+-- HNSW scans rely on hnsw.iterative_scan (ANN_ITERATIVE_SCAN, pgvector >= 0.8).
+--
+-- Run outside a transaction (CONCURRENTLY).
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ai_docs_type
+  ON ai_core.docs ((COALESCE(lower(meta->>'type'), '')))
+  WHERE kind = 'product';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ai_docs_tier
+  ON ai_core.docs ((COALESCE(lower(meta->>'tier'), '')))
+  WHERE kind = 'product';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_product_attrs_size_upper
+  ON ai_core.product_attrs (upper(size));
+
+ANALYZE ai_core.docs;
+ANALYZE ai_core.product_attrs;
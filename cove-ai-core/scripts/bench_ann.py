@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Recall-vs-latency for the dense leg of hybrid search.
+#   python scripts/bench_ann.py --kind product --k 24,96 --ef 10,20,40,80,160 --probes 1,5,10
+# Ground truth is an exact scan (index scans disabled); queries are stored doc
+# embeddings, so no provider calls are made. Each k also gets an "app" row with
+# the settings hybrid search itself applies (_ann_knobs), so a LIMIT above the
+# server's hnsw.ef_search (40; recs asks for up to 96) shows up as lost recall.
+import argparse, statistics, time
+
+from app.vector.hybrid import _ann_knobs
+from app.vector.store import connect
+
+_DENSE = """
+    SELECT id FROM ai_core.docs
+    WHERE kind = %s
+    ORDER BY embedding <=> %s::vector
+    LIMIT %s
+"""
+
+def _topk(conn, kind, vec, k, settings):
+    with conn.transaction():
+        for name, value in settings:
+            conn.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+        t0 = time.perf_counter()
+        rows = conn.execute(_DENSE, (kind, vec, k)).fetchall()
+        return [r[0] for r in rows], (time.perf_counter() - t0) * 1000
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[max(0, int(p * len(xs)) - 1)] if xs else 0.0
+
+def run():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--kind", default="product")
+    ap.add_argument("--k", default="24,96", help="comma-separated LIMITs; keep one above 40")
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--ef", default="10,20,40,80,160")
+    ap.add_argument("--probes", default="")
+    args = ap.parse_args()
+
+    conn = connect()
+    queries = conn.execute(
+        "SELECT embedding FROM ai_core.docs WHERE kind = %s AND embedding IS NOT NULL ORDER BY random() LIMIT %s",
+        (args.kind, args.queries),
+    ).fetchall()
+    queries = [q[0] for q in queries]
+    if not queries:
+        print(f"no embedded docs for kind={args.kind}")
+        return
+
+    grid = [("hnsw.ef_search", int(x)) for x in args.ef.split(",") if x] + \
+           [("ivfflat.probes", int(x)) for x in args.probes.split(",") if x]
+
+    for k in [int(x) for x in args.k.split(",") if x]:
+        exact = [_topk(conn, args.kind, q, k, [("enable_indexscan", "off"), ("enable_bitmapscan", "off")])
+                 for q in queries]
+        print(f"exact scan: p50 {_pct([t for _, t in exact], .5):.2f} ms, p95 {_pct([t for _, t in exact], .95):.2f} ms "
+              f"({len(queries)} queries, k={k})")
+
+        rows = [(f"{name}={value}", [(name, value)]) for name, value in grid]
+        rows.append(("app", _ann_knobs(None, None, k=k)))
+        for label, settings in rows:
+            recalls, lat = [], []
+            for q, (truth, _) in zip(queries, exact):
+                got, ms = _topk(conn, args.kind, q, k, settings)
+                recalls.append(len(set(got) & set(truth)) / max(1, len(truth)))
+                lat.append(ms)
+            print(f"{label:<20} recall@{k} {statistics.mean(recalls):.3f}  "
+                  f"p50 {_pct(lat, .5):.2f} ms  p95 {_pct(lat, .95):.2f} ms")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,32 @@
+from app.core.attrs import AttrExtractor
+
+TYPES = ["bomber", "hoodie", "jacket", "jeans"]
+
+
+def _ex():
+    return AttrExtractor(colors=["black", "green", "navy blue"], types=TYPES)
+
+
+def test_everyday_words_are_not_types():
+    ex = _ex()
+    assert ex.extract("what it means")["types"] == []
+    assert ex.extract("any goodies for me")["types"] == []
+    for word in ("means", "goodies", "beans", "packet", "jean", "hood", "number", "member"):
+        assert ex.normalize_type(word) is None, word
+
+
+def test_exact_and_plural_types():
+    ex = _ex()
+    assert ex.normalize_type("hoodie") == "hoodie"
+    assert ex.normalize_type("hoodies") == "hoodie"
+    assert ex.normalize_type("jackets") == "jacket"
+    assert ex.normalize_type("jeans") == "jeans"
+
+
+def test_small_typos_resolve():
+    ex = _ex()
+    assert ex.normalize_type("hoodis") == "hoodie"
+    assert ex.normalize_type("jakcet") == "jacket"
+    assert ex.normalize_type("bommer") == "bomber"
+    assert ex.normalize_type("jenas") == "jeans"
+    assert ex.extract("black hoodis in XL") == {"colors": ["black"], "sizes": ["XL"], "types": ["hoodie"]}
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("psycopg")
+
+from app.routes.rag import _AnswerFieldStream, _sse
+
+RAW = '{"answer": "Great pick \\ud83d\\ude00 \\u00e9t\\u00e9 \\"fit\\"", "citations": []}'
+TEXT = 'Great pick \U0001F600 été "fit"'
+
+
+def _feed_in(chunks):
+    stream = _AnswerFieldStream()
+    return "".join(stream.feed(c) for c in chunks)
+
+
+def test_non_bmp_escape_is_one_character():
+    out = _feed_in([RAW])
+    assert out == TEXT == json.loads(RAW)["answer"]
+    _sse("delta", {"text": out}).encode("utf-8")
+
+
+def test_surrogate_pair_split_across_chunks():
+    # every split point, including inside and between the two \u escapes
+    for cut in range(1, len(RAW)):
+        assert _feed_in([RAW[:cut], RAW[cut:]]) == TEXT, cut
+
+
+def test_lone_surrogates_are_replaced():
+    out = _feed_in(['{"answer": "a\\ud83d b \\ude00 c"}'])
+    assert out == "a� b � c"
+    _sse("delta", {"text": out}).encode("utf-8")